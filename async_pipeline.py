@@ -0,0 +1,346 @@
+"""
+Async Crawl Pipeline
+Runs the HTTP crawl as asyncio stages joined by bounded queues:
+
+    page fetcher -> parser -> detail fetcher pool -> writer
+
+The page fetcher walks the grid one page at a time and passes each page on
+with its form state, so that page's violation popups can still be opened
+after the fetcher has moved on. The parser turns pages into rows and popup
+jobs, a pool of detail fetchers opens the popups, and the writer stores a
+page once all of its popups are in. Blocking HTTP, lxml and disk calls run
+in worker threads, so network waits overlap with parsing and writing
+instead of adding up. A full queue holds back the stage in front of it, so
+memory stays bounded however slow the popups get.
+
+With parse_workers, the grid rows and popups are parsed in a
+parse_pool.ParsePool of worker processes instead of threads, so parsing
+scales with cores and does not hold the GIL the fetch stages need.
+
+With an html_archive.HtmlArchive, every fetched page and popup is archived
+raw before it is parsed.
+"""
+
+import asyncio
+import logging
+import time
+
+import requests
+
+import incremental
+from resilience import CrawlTruncated
+from http_backend import SEARCH_URL, HttpPageSession, WebFormsClient
+from metrics import METRICS
+from page_parser import PopupNotLoaded, parse_violation_popup
+from parallel_crawl import RateLimiter
+from parse_pool import ParsePool
+
+DONE = None  # Queue sentinel: the stage feeding this queue has finished
+
+log = logging.getLogger(__name__)
+
+
+class PageBatch:
+    """One grid page whose rows wait for their violation popups."""
+
+    def __init__(self, page_num, form_state, archive_entry=None):
+        self.page_num = page_num
+        self.form_state = form_state
+        self.archive_entry = archive_entry  # Archive entry the page's popups are filed under
+        self.rows = []
+        self.jobs = []
+        self.pending = 0
+
+
+class PipelineStats:
+    """Counters the stages update; only touched from the event loop thread."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.rows = 0
+        self.popups = 0
+        self.popup_seconds = 0.0
+
+    def print_summary(self):
+        """Print throughput of the finished crawl."""
+        elapsed = time.perf_counter() - self.started
+        average = self.popup_seconds / self.popups * 1000 if self.popups else 0.0
+        print(f"Pipeline: {self.pages} pages, {self.rows} rows, {self.popups} popups "
+              f"in {elapsed:.1f}s ({self.rows / elapsed if elapsed else 0:.1f} rows/s, "
+              f"{average:.0f} ms per popup)")
+
+
+def plan_page(page_num, grid_rows, form_state, change_tracker=None, history=None, archive_entry=None):
+    """
+    Turn a parsed grid page into rows and the popups they still need.
+
+    Violation details are left as empty dictionaries that the detail
+    fetchers fill in place, so each row is complete once its jobs are done.
+
+    Returns:
+        PageBatch with its rows and (link, details) jobs
+    """
+    batch = PageBatch(page_num, form_state, archive_entry)
+
+    def schedule(violations_link):
+        details = {}
+        batch.jobs.append((violations_link, details))
+        return details
+
+    for row_data, row_info in grid_rows:
+        if change_tracker and not change_tracker.should_fetch(row_data, row_info):
+            continue
+        violations_link = row_info['violations_link']
+        row_data['violation_details'] = schedule(violations_link) if violations_link else None
+        row_data['past_inspections'] = incremental.past_inspection_records(row_info, schedule, history)
+        batch.rows.append((row_data, row_info))
+    batch.pending = len(batch.jobs)
+    return batch
+
+
+@METRICS.timed('popup')
+def fetch_popup(client, violations_link, form_state, archive=None, archive_entry=None):
+    """
+    Open one violations popup against a page's saved form state and parse it.
+
+    A failed request is recorded in the row. resilience.CircuitOpen is not:
+    it means the site stayed down past the pause budget, so it is left to
+    fail the pipeline, and the checkpoint lets a later run resume.
+    """
+    try:
+        body = client.fetch_violations_body(violations_link['target'], form_state)
+        if archive is not None:
+            archive.add_popup(archive_entry, violations_link, body)
+        details = parse_violation_popup(client.parse(body))
+        client.cache_violations_body(violations_link['target'], body, form_state)
+        return details
+    except (requests.RequestException, PopupNotLoaded) as e:
+        log.warning("Error in get_violation_details: %s", e)
+        METRICS.increment('popup_errors_total')
+        return {"error": str(e)}
+
+
+async def fetch_popup_pooled(client, violations_link, form_state, parse_pool, archive=None, archive_entry=None):
+    """Open one violations popup on a thread and parse it in the process pool, like fetch_popup()."""
+    with METRICS.timer('popup'):
+        try:
+            body = await asyncio.to_thread(client.fetch_violations_body, violations_link['target'], form_state)
+        except requests.RequestException as e:
+            log.warning("Error in get_violation_details: %s", e)
+            METRICS.increment('popup_errors_total')
+            return {"error": str(e)}
+        if archive is not None:
+            await asyncio.to_thread(archive.add_popup, archive_entry, violations_link, body)
+        try:
+            details = await parse_pool.popup(body)
+        except PopupNotLoaded as e:
+            log.warning("Error in get_violation_details: %s", e)
+            METRICS.increment('popup_errors_total')
+            return {"error": str(e)}
+        await asyncio.to_thread(client.cache_violations_body, violations_link['target'], body, form_state)
+        return details
+
+
+async def fetch_pages(session, start_page, page_queue, checkpoint=None, last_page=None):
+    """Page fetcher stage: walk the grid and queue every page not yet done."""
+    expected_last = last_page if last_page is not None else await asyncio.to_thread(session.total_pages)
+    if start_page > expected_last:
+        return
+    await asyncio.to_thread(session.seek, start_page)
+    while True:
+        page_num = session.page_num
+        if not (checkpoint and checkpoint.is_page_done(page_num)):
+            log.debug("Fetched page %d", page_num)
+            archive_entry = await asyncio.to_thread(session.archive_page) if session.archive else None
+            await page_queue.put(
+                (page_num, session.client.doc, session.client.body, session.form_state(), archive_entry)
+            )
+        if last_page is not None and page_num >= last_page:
+            return
+        if not await asyncio.to_thread(session.next_page):
+            if page_num < expected_last:
+                raise CrawlTruncated(f"Pager ended at page {page_num} of {expected_last}")
+            return
+
+
+async def parse_pages(page_queue, detail_queue, write_queue, headers, stats, parse_pool,
+                      change_tracker=None, history=None):
+    """Parser stage: turn pages into rows and popup jobs."""
+    while True:
+        item = await page_queue.get()
+        if item is DONE:
+            return
+        page_num, doc, body, form_state, archive_entry = item
+        grid_rows = await parse_pool.rows(doc if parse_pool.inline else body, headers)
+        batch = await asyncio.to_thread(
+            plan_page, page_num, grid_rows, form_state, change_tracker, history, archive_entry
+        )
+        stats.pages += 1
+        if not batch.jobs:
+            await write_queue.put(batch)
+        for violations_link, details in batch.jobs:
+            await detail_queue.put((batch, violations_link, details))
+
+
+async def fetch_details(client, detail_queue, write_queue, stats, parse_pool, archive=None):
+    """Detail fetcher stage: open popups and release pages whose popups are all in."""
+    while True:
+        job = await detail_queue.get()
+        if job is DONE:
+            return
+        batch, violations_link, details = job
+        start = time.perf_counter()
+        if parse_pool.inline:
+            details.update(await asyncio.to_thread(
+                fetch_popup, client, violations_link, batch.form_state, archive, batch.archive_entry
+            ))
+        else:
+            details.update(await fetch_popup_pooled(
+                client, violations_link, batch.form_state, parse_pool, archive, batch.archive_entry
+            ))
+        stats.popups += 1
+        stats.popup_seconds += time.perf_counter() - start
+        batch.pending -= 1
+        if batch.pending == 0:
+            await write_queue.put(batch)
+
+
+async def write_pages(write_queue, sink, stats, checkpoint=None, change_tracker=None):
+    """Writer stage: store finished pages, committing each to the checkpoint."""
+    while True:
+        batch = await write_queue.get()
+        if batch is DONE:
+            return
+        rows = [row_data for row_data, _ in batch.rows]
+        if change_tracker:
+            for row_data, row_info in batch.rows:
+                change_tracker.seen(row_data, row_info)
+        with METRICS.timer('write'):
+            if checkpoint:
+                await asyncio.to_thread(checkpoint.commit_page, batch.page_num, rows, sink, batch.form_state)
+            else:
+                await asyncio.to_thread(sink.add, rows)
+        stats.rows += len(rows)
+        METRICS.record_rows(rows)
+        log.info("Wrote page %d (%d rows)", batch.page_num, len(rows))
+
+
+async def crawl_async(sink, url=SEARCH_URL, detail_workers=8, queue_size=4, requests_per_second=0,
+                      checkpoint=None, change_tracker=None, history=None, first_page=1, last_page=None,
+                      cache=None, resilience=None, navigator=None, parse_workers=0, archive=None):
+    """
+    Crawl the result pages through the asyncio pipeline.
+
+    Args:
+        sink: Result sink with add(), e.g. ndjson_sink.NdjsonWriter
+        url: Search page URL
+        detail_workers: Number of concurrent popup fetchers
+        queue_size: Capacity of the page and write queues; the popup queue
+            holds detail_workers times as many jobs
+        requests_per_second: Per-host request budget shared by all stages
+        checkpoint: Optional checkpoint.CheckpointStore to resume from and update
+        change_tracker: Optional incremental.InspectionIndex
+        history: Optional sqlite_store.SqliteStore for past inspection popups
+        first_page: First page to crawl
+        last_page: Last page to crawl; defaults to the final result page
+        cache: Optional response_cache.ResponseCache shared by all clients
+        resilience: Optional resilience.Resilience shared by all clients
+        navigator: Optional pager.PageNavigator the page fetcher seeks with
+        parse_workers: Processes that parse pages and popups; 0 parses on threads
+        archive: Optional html_archive.HtmlArchive for the raw pages and popups
+
+    Returns:
+        PipelineStats of the crawl
+    """
+    rate_limiter = RateLimiter(requests_per_second)
+    session = HttpPageSession(
+        url=url, rate_limiter=rate_limiter, cache=cache, resilience=resilience, navigator=navigator,
+        archive=archive
+    )
+    clients = [
+        WebFormsClient(url=url, rate_limiter=rate_limiter, cache=cache, resilience=resilience)
+        for _ in range(detail_workers)
+    ]
+    stats = PipelineStats()
+
+    start_page = checkpoint.first_unfinished_page(first_page) if checkpoint else first_page
+    resumed = (
+        checkpoint is not None
+        and checkpoint.form_state
+        and checkpoint.form_state_page == start_page - 1
+        and await asyncio.to_thread(session.resume, checkpoint.form_state, start_page)
+    )
+    if resumed:
+        log.info("Resumed at page %d from saved page state", start_page)
+    else:
+        await asyncio.to_thread(session.open)
+
+    parse_pool = ParsePool(parse_workers)
+    page_queue = asyncio.Queue(queue_size)
+    detail_queue = asyncio.Queue(queue_size * detail_workers)
+    write_queue = asyncio.Queue(queue_size)
+
+    fetcher = asyncio.create_task(fetch_pages(session, start_page, page_queue, checkpoint, last_page))
+    parser = asyncio.create_task(parse_pages(
+        page_queue, detail_queue, write_queue, session.headers, stats, parse_pool, change_tracker, history
+    ))
+    details = [
+        asyncio.create_task(fetch_details(client, detail_queue, write_queue, stats, parse_pool, archive))
+        for client in clients
+    ]
+    writer = asyncio.create_task(write_pages(write_queue, sink, stats, checkpoint, change_tracker))
+    stages = [fetcher, parser, *details, writer]
+
+    # A stage that dies would leave its neighbours blocked on a queue forever,
+    # so the first failure cancels the whole pipeline
+    failure = asyncio.get_running_loop().create_future()
+
+    def on_stage_done(task):
+        if not task.cancelled() and task.exception() and not failure.done():
+            failure.set_exception(task.exception())
+
+    for stage in stages:
+        stage.add_done_callback(on_stage_done)
+
+    async def unless_failed(awaitable):
+        # Every shutdown step, sentinel puts included, gives way to a failure:
+        # a put into the full queue of a dead stage would never return
+        task = asyncio.ensure_future(awaitable)
+        await asyncio.wait({task, failure}, return_when=asyncio.FIRST_COMPLETED)
+        if failure.done():
+            task.cancel()
+            failure.result()
+
+    try:
+        # Shut down front to back: each stage gets its sentinel once the
+        # stages feeding it have drained
+        await unless_failed(fetcher)
+        await unless_failed(page_queue.put(DONE))
+        await unless_failed(parser)
+        for _ in details:
+            await unless_failed(detail_queue.put(DONE))
+        for task in details:
+            await unless_failed(task)
+        await unless_failed(write_queue.put(DONE))
+        await unless_failed(writer)
+    except BaseException:
+        for stage in stages:
+            stage.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        raise
+    finally:
+        if failure.done() and not failure.cancelled():
+            failure.exception()  # Mark the exception retrieved
+        session.close()
+        for client in clients:
+            client.session.close()
+        parse_pool.close()
+
+    stats.print_summary()
+    return stats
+
+
+def run_pipeline(sink, **kwargs):
+    """Run crawl_async to completion from synchronous code."""
+    return asyncio.run(crawl_async(sink, **kwargs))
@@ -0,0 +1,216 @@
+"""
+Scraper Benchmark
+Runs the scrapers against a local replay_server.py instance and reports
+throughput, popup latency and memory, so performance regressions show up
+before a crawl ever reaches the real site.
+
+Each target runs as its own process in a scratch directory. Reported per run:
+wall time, grid pages/s and rows/s, popup latency percentiles as measured by
+the server, and the peak RSS of the scraper process (browsers it starts are
+separate processes and not included). Rows are counted from the NDJSON or
+JSON array file each target writes to its {output} path; a run that writes no
+rows counts as failed, and the script then exits with status 1.
+
+Usage:
+    python benchmark.py --pages 10 --popup-latency 0.02 main-http main-http-4
+    python benchmark.py --report bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2
+    python benchmark.py --target "mine={python} my_backend.py --url {url} --output {output}"
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import ndjson_sink
+import replay_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_ARGS = '--url {url} --output {output} --json-output "" --checkpoint "" --rate 0'
+TARGETS = {
+    'main-http': '{python} {repo}/main.py --backend http ' + MAIN_ARGS,
+    'main-http-4': '{python} {repo}/main.py --backend http --workers 4 ' + MAIN_ARGS,
+    'main-async': '{python} {repo}/main.py --backend async --workers 8 ' + MAIN_ARGS,
+    'main-async-procs': '{python} {repo}/main.py --backend async --workers 8 --parse-workers 4 ' + MAIN_ARGS,
+    'main-selenium': '{python} {repo}/main.py --backend selenium ' + MAIN_ARGS,
+    'newmain': '{python} {repo}/newmain.py {url} {output}',
+}
+
+
+def count_rows(path):
+    """Count the records a run wrote to its output file, NDJSON or JSON array."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return 0
+    return sum(1 for _ in ndjson_sink.iter_file(path))
+
+
+def run_target(name, command, site, url, timeout=None):
+    """
+    Run one scraper command against the replay server and measure it.
+
+    Args:
+        name: Label of the run
+        command: Command template with {python}, {repo}, {url} and {output}
+        site: replay_server.ReplaySite being served
+        url: Search page URL of the replay server
+        timeout: Seconds after which the run is killed
+
+    Returns:
+        Dictionary of measurements
+    """
+    site.stats.reset()
+    with tempfile.TemporaryDirectory(prefix=f'bench-{name}-') as run_dir:
+        output = os.path.join(run_dir, 'output')
+        argv = shlex.split(command.format(
+            python=shlex.quote(sys.executable),
+            repo=shlex.quote(REPO_DIR),
+            url=shlex.quote(url),
+            output=shlex.quote(output)
+        ))
+        with open(os.path.join(run_dir, 'run.log'), 'wb') as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(argv, cwd=run_dir, stdout=log, stderr=subprocess.STDOUT)
+            timer = threading.Timer(timeout, process.kill) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                # wait4 reaps the child and reports the resource usage of that child alone
+                _, status, usage = os.wait4(process.pid, 0)
+            finally:
+                if timer:
+                    timer.cancel()
+            wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        rows = count_rows(output)
+        with open(os.path.join(run_dir, 'run.log'), 'rb') as log:
+            log_tail = log.read()[-2000:].decode('utf-8', 'replace')
+
+    stats = site.stats.summary()
+    result = {
+        'target': name,
+        'exit_code': process.returncode,
+        'wall_s': round(wall, 3),
+        'grid_pages': stats['grid_pages'],
+        'rows': rows,
+        'popups': stats['popups'],
+        'pages_per_s': round(stats['grid_pages'] / wall, 2) if wall else 0.0,
+        'rows_per_s': round(rows / wall, 2) if wall else 0.0,
+        'popup_p50_ms': stats['popup_p50_ms'],
+        'popup_p90_ms': stats['popup_p90_ms'],
+        'popup_p99_ms': stats['popup_p99_ms'],
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1)
+    }
+    if process.returncode != 0:
+        print(f"{name} exited with {process.returncode}; last output:\n{log_tail}")
+    elif not rows:
+        print(f"{name} wrote no rows to {{output}}; last output:\n{log_tail}")
+    return result
+
+
+def print_report(results):
+    """Print one line of measurements per run."""
+    print(f"\n{'target':<16}{'exit':>5}{'wall s':>9}{'pages/s':>9}{'rows/s':>9}{'rows':>7}"
+          f"{'popups':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    for r in results:
+        print(f"{r['target']:<16}{r['exit_code']:>5}{r['wall_s']:>9.2f}{r['pages_per_s']:>9.2f}"
+              f"{r['rows_per_s']:>9.2f}{r['rows']:>7}{r['popups']:>8}"
+              f"{r['popup_p50_ms'] if r['popup_p50_ms'] is not None else '-':>9}"
+              f"{r['popup_p90_ms'] if r['popup_p90_ms'] is not None else '-':>9}"
+              f"{r['popup_p99_ms'] if r['popup_p99_ms'] is not None else '-':>9}"
+              f"{r['peak_rss_mb']:>9}")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Flag runs that got slower or bigger than a saved report.
+
+    Args:
+        results: Measurements of this run
+        baseline: Measurements loaded from an earlier --report file
+        tolerance: Allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        List of regression messages; empty if nothing regressed
+    """
+    previous = {r['target']: r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        old = previous.get(r['target'])
+        if not old:
+            continue
+        if r['exit_code'] != 0 and old['exit_code'] == 0:
+            regressions.append(f"{r['target']}: now exits with {r['exit_code']}")
+        if old['rows_per_s'] and r['rows_per_s'] < old['rows_per_s'] * (1 - tolerance):
+            regressions.append(f"{r['target']}: rows/s {old['rows_per_s']} -> {r['rows_per_s']}")
+        if old['peak_rss_mb'] and r['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{r['target']}: peak RSS {old['peak_rss_mb']} -> {r['peak_rss_mb']} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local replay server.")
+    parser.add_argument('targets', nargs='*', default=['main-http', 'main-http-4'],
+                        help=f"Targets to run (built in: {', '.join(TARGETS)})")
+    parser.add_argument('--target', action='append', default=[], metavar='NAME=COMMAND',
+                        help="Extra target; COMMAND may use {python}, {repo}, {url} and {output}")
+    parser.add_argument('--pages', type=int, default=10, help="Result pages served")
+    parser.add_argument('--rows-per-page', type=int, default=15)
+    parser.add_argument('--pager-window', type=int, default=20)
+    parser.add_argument('--popup-latency', type=float, default=0.0, help="Seconds before a popup is answered")
+    parser.add_argument('--page-latency', type=float, default=0.0, help="Seconds before a grid page is answered")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds before a run is killed")
+    parser.add_argument('--report', help="Write the measurements to this JSON file")
+    parser.add_argument('--baseline', help="Earlier --report file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative slowdown or memory growth against --baseline")
+    args = parser.parse_args()
+
+    commands = dict(TARGETS)
+    for spec in args.target:
+        name, _, command = spec.partition('=')
+        commands[name] = command
+    names = args.targets + [spec.partition('=')[0] for spec in args.target if spec.partition('=')[0] not in args.targets]
+    unknown = [name for name in names if name not in commands]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+
+    site = replay_server.ReplaySite(
+        os.path.join(REPO_DIR, 'index.html'), args.pages, args.rows_per_page, args.pager_window,
+        args.popup_latency, args.page_latency
+    )
+    server, url = replay_server.start_server(site)
+    print(f"Replay server with {args.pages} pages of {args.rows_per_page} rows at {url}")
+    results = []
+    try:
+        for name in names:
+            print(f"Running {name}...")
+            results.append(run_target(name, commands[name], site, url, args.timeout))
+    finally:
+        server.shutdown()
+
+    print_report(results)
+    failures = [r['target'] for r in results if r['exit_code'] != 0 or not r['rows']]
+    if failures:
+        print(f"FAILED {', '.join(failures)}")
+    config = {key: getattr(args, key) for key in
+              ('pages', 'rows_per_page', 'pager_window', 'popup_latency', 'page_latency')}
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'results': results}, f, indent=4)
+        print(f"Report written to {args.report}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+    if failures:
+        sys.exit(1)
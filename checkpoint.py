@@ -0,0 +1,180 @@
+"""
+Crawl Checkpoints
+Records crawl progress after every page so an interrupted crawl can pick up
+at the first unfinished page instead of starting over.
+
+A checkpoint is a small JSON file holding the completed pages, the WebForms
+state of the last completed page, the size of the output file at that point
+and, once the crawl has finished, the page range it covered. The IDs of
+records already written are appended to a companion <checkpoint>.ids file,
+one per line.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+RECORD_KEY_FIELDS = ("Name / Address", "Most Recent Inspection", "Inspection Type")
+
+
+def record_id(row_data):
+    """
+    Build a stable ID for a scraped row.
+
+    Args:
+        row_data: Row dictionary as produced by the scrapers
+
+    Returns:
+        Hex digest identifying the establishment's inspection
+    """
+    key = "\x1f".join(str(row_data.get(field, "")) for field in RECORD_KEY_FIELDS)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+class CheckpointStore:
+    """Thread-safe, crash-safe record of crawl progress."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids_path = path + ".ids"
+        self._lock = threading.Lock()
+        self.completed_pages = set()
+        self.written_ids = set()
+        self.form_state = None
+        self.form_state_page = None
+        self.output_offset = 0
+        self.finished = None  # {'first_page', 'last_page'} of a crawl that ran to the end
+
+    def load(self):
+        """
+        Read a previous checkpoint, if there is one.
+
+        Returns:
+            True if a checkpoint was found
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        self.completed_pages = set(state.get("completed_pages", []))
+        self.form_state = state.get("form_state")
+        self.form_state_page = state.get("form_state_page")
+        self.output_offset = state.get("output_offset", 0)
+        self.finished = state.get("finished")
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, encoding="utf-8") as f:
+                self.written_ids = {line.strip() for line in f if line.strip()}
+        return True
+
+    def reset(self):
+        """Forget all progress and remove the checkpoint files."""
+        with self._lock:
+            for path in (self.path, self.ids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.completed_pages = set()
+            self.written_ids = set()
+            self.form_state = None
+            self.form_state_page = None
+            self.output_offset = 0
+            self.finished = None
+
+    def is_page_done(self, page_num):
+        """Return True if page_num was fully written in an earlier run."""
+        return page_num in self.completed_pages
+
+    def first_unfinished_page(self, first_page=1):
+        """Return the lowest page at or after first_page that still needs crawling."""
+        page_num = first_page
+        while page_num in self.completed_pages:
+            page_num += 1
+        return page_num
+
+    def mark_finished(self, first_page=1, last_page=None):
+        """
+        Record that the crawl of first_page..last_page ran to the end.
+
+        Args:
+            first_page: First page of the crawl
+            last_page: Last page of the crawl; None if it ran to the final result page
+        """
+        with self._lock:
+            self.finished = {"first_page": first_page, "last_page": last_page}
+            self._save()
+
+    def is_finished(self, first_page=1, last_page=None):
+        """Return True if a finished crawl already covered first_page..last_page, so a resume has nothing to do."""
+        if not self.finished or self.finished["first_page"] > first_page:
+            return False
+        done_through = self.finished["last_page"]
+        return done_through is None or (last_page is not None and last_page <= done_through)
+
+    def truncate_output(self, output_path):
+        """
+        Cut the output file back to its size at the last checkpoint.
+
+        Drops the rows of a page that was only partly written when the
+        previous run died, so they are not duplicated when it is redone.
+        """
+        if os.path.exists(output_path) and os.path.getsize(output_path) > self.output_offset:
+            os.truncate(output_path, self.output_offset)
+            print(f"Truncated {output_path} to last checkpoint ({self.output_offset} bytes)")
+
+    def commit_page(self, page_num, rows, writer, form_state=None):
+        """
+        Write one page of rows and record it as done, as a single step.
+
+        Rows already written by an earlier page or run are skipped. The page
+        is only marked done after its rows are flushed to the output file.
+
+        Args:
+            page_num: Page the rows came from
+            rows: Scraped row dictionaries
+            writer: ndjson_sink.NdjsonWriter the rows go to
+            form_state: WebForms fields of the page, for resuming without a new search
+
+        Returns:
+            Number of rows written
+        """
+        with self._lock:
+            new_rows = []
+            new_ids = []
+            for row in rows:
+                rid = record_id(row)
+                if rid in self.written_ids:
+                    continue
+                self.written_ids.add(rid)
+                new_ids.append(rid)
+                new_rows.append(row)
+
+            writer.add(new_rows)
+            self.output_offset = writer.tell()
+
+            if new_ids:
+                with open(self.ids_path, "a", encoding="utf-8") as f:
+                    f.write("".join(rid + "\n" for rid in new_ids))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            self.completed_pages.add(page_num)
+            if form_state is not None and (self.form_state_page or 0) <= page_num:
+                self.form_state = form_state
+                self.form_state_page = page_num
+            self._save()
+            return len(new_rows)
+
+    def _save(self):
+        state = {
+            "completed_pages": sorted(self.completed_pages),
+            "form_state": self.form_state,
+            "form_state_page": self.form_state_page,
+            "output_offset": self.output_offset,
+            "finished": self.finished
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,232 @@
+"""
+WebDriver Pool
+Keeps warm, headless Chrome instances ready for the Selenium scrapers, so a
+crawl does not pay Chrome's startup for every session, and strips each page
+down to what the scrapers read.
+
+Images, fonts and third-party scripts (analytics, the Google map in divMap)
+are blocked through the DevTools protocol (Network.setBlockedURLs). Drivers
+are retired after a number of pages and replaced in the background, which
+keeps Chrome's memory growth in check on long crawls.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from selenium import webdriver
+
+BLOCKED_URL_PATTERNS = [
+    # Images and fonts
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # Third-party scripts: analytics, the Google map and CDN plugins
+    "*google-analytics.com*", "*googletagmanager.com*", "*maps.googleapis.com*",
+    "*maps.gstatic.com*", "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    "*cdnjs.cloudflare.com*",
+]
+
+# Sum of bytes transferred for the current document and its subresources
+PAGE_BYTES_JS = """
+var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return entries.reduce(function (total, entry) { return total + (entry.transferSize || 0); }, 0);
+"""
+
+log = logging.getLogger(__name__)
+
+
+def chrome_options(headless=True):
+    """
+    Build Chrome options for scraping.
+
+    Args:
+        headless: Run without a window
+
+    Returns:
+        Configured webdriver.ChromeOptions
+    """
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--window-size=1366,900')
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.default_content_setting_values.notifications': 2
+    })
+    return options
+
+
+def block_resources(driver, patterns=BLOCKED_URL_PATTERNS):
+    """Tell Chrome to drop every request matching one of the URL patterns."""
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+
+
+def launch_driver(headless=True, block=True):
+    """
+    Start one Chrome instance configured for scraping.
+
+    Args:
+        headless: Run without a window
+        block: Block images, fonts and third-party scripts
+
+    Returns:
+        WebDriver instance
+    """
+    driver = webdriver.Chrome(options=chrome_options(headless))
+    if block:
+        block_resources(driver)
+    return driver
+
+
+def page_bytes(driver):
+    """Return the bytes transferred to load the page the driver is showing."""
+    try:
+        return int(driver.execute_script(PAGE_BYTES_JS) or 0)
+    except Exception:
+        return 0
+
+
+class DriverPool:
+    """
+    Thread-safe pool of pre-launched Chrome instances.
+
+    Args:
+        size: Number of drivers kept warm
+        headless: Run Chrome without a window
+        recycle_after: Pages a driver may serve before it is retired; 0 never retires
+        block: Block images, fonts and third-party scripts
+        launcher: Callable returning a new driver; defaults to launch_driver
+    """
+
+    def __init__(self, size=1, headless=True, recycle_after=50, block=True, launcher=None):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.launcher = launcher or (lambda: launch_driver(headless=headless, block=block))
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._closed = False
+        self._failures = queue.Queue()
+        self.launches = 0
+        self.launch_seconds = 0.0
+        self.recycled = 0
+        self.pages_served = 0
+        self.bytes_served = 0
+        for _ in range(size):
+            self._launch_async()
+
+    def _launch(self):
+        start = time.perf_counter()
+        driver = self.launcher()
+        with self._lock:
+            self.launches += 1
+            self.launch_seconds += time.perf_counter() - start
+            self._pages[id(driver)] = 0
+            closed = self._closed
+        if closed:
+            driver.quit()
+            return
+        self._idle.put(driver)
+
+    def _launch_async(self):
+        def run():
+            try:
+                self._launch()
+            except Exception as e:
+                log.error("Could not launch Chrome: %s", e)
+                self._failures.put(e)
+        threading.Thread(target=run, daemon=True).start()
+
+    def acquire(self, timeout=120):
+        """
+        Take a warm driver, waiting for one to finish launching if needed.
+
+        Raises:
+            RuntimeError: If no driver could be launched
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            try:
+                error = self._failures.get_nowait()
+            except queue.Empty:
+                error = None
+            if error is not None:
+                raise RuntimeError(f"Chrome failed to launch: {error}") from error
+            if time.monotonic() >= deadline:
+                raise RuntimeError("Timed out waiting for a Chrome instance")
+
+    def record_page(self, driver, transferred=0):
+        """
+        Count one page served by driver.
+
+        Args:
+            driver: Driver that loaded the page
+            transferred: Bytes the page took to load, e.g. from page_bytes()
+        """
+        with self._lock:
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+            self.pages_served += 1
+            self.bytes_served += transferred
+
+    def due_for_recycle(self, driver):
+        """Return True once driver has served recycle_after pages."""
+        with self._lock:
+            return bool(self.recycle_after) and self._pages.get(id(driver), 0) >= self.recycle_after
+
+    def release(self, driver):
+        """
+        Hand a driver back to the pool.
+
+        Worn-out drivers are quit and replaced by a fresh one launched in
+        the background; the rest go back to the idle queue as they are.
+        """
+        if self.due_for_recycle(driver) or self._closed:
+            self._retire(driver)
+            if not self._closed:
+                self.recycled += 1
+                self._launch_async()
+            return
+        self._idle.put(driver)
+
+    def _retire(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            log.warning("Error quitting Chrome: %s", e)
+
+    def close(self):
+        """Quit every idle driver; drivers still leased are quit on release."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def print_summary(self):
+        """Print launch and recycling statistics."""
+        average = self.launch_seconds / self.launches if self.launches else 0.0
+        per_page = self.bytes_served / self.pages_served / 1024 if self.pages_served else 0.0
+        print(f"Driver pool: {self.launches} launches ({average:.2f}s average), "
+              f"{self.recycled} recycled after {self.recycle_after} pages, "
+              f"{self.pages_served} pages at {per_page:.0f} KB each")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
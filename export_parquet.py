@@ -0,0 +1,293 @@
+"""
+Columnar Export
+Flattens crawl output into columnar Parquet (or Arrow IPC) files for
+analytics, so analysts can load only the columns and years they need.
+Loading the whole nested JSON into pandas is no longer required.
+
+Two tables are written, each partitioned by inspection year in the Hive
+layout that pandas, pyarrow.dataset, DuckDB and Spark read directly:
+
+    <out>/inspections/year=2025/part-0.parquet   one row per inspection
+    <out>/violations/year=2025/part-0.parquet    one row per cited violation
+
+Code, explanation, city and the other repeating columns are dictionary
+encoded. Input is read one record at a time and written in row groups of
+a bounded size, so exporting never holds the full dataset in memory.
+Accepted inputs are the NDJSON/JSON files of main.py and newmain.py and
+the SQLite database of sqlite_store.py.
+
+Requires pyarrow (pip install pyarrow).
+
+Usage:
+    python export_parquet.py --out analytics food_safety_data.ndjson inspection_data.ndjson
+    python export_parquet.py --out analytics --sqlite food_safety.db
+    python export_parquet.py --out analytics --format arrow food_safety_data.json
+
+    pandas.read_parquet('analytics/violations', filters=[('year', '=', 2025)])
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import sqlite3
+
+import ndjson_sink
+from sqlite_store import normalize_record
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# Column kinds: 'category' columns are dictionary encoded
+INSPECTION_COLUMNS = (
+    ('trade_name', 'string'),
+    ('owner_name', 'string'),
+    ('street', 'string'),
+    ('city', 'category'),
+    ('state', 'category'),
+    ('zip', 'category'),
+    ('phone', 'string'),
+    ('inspection_date', 'date'),
+    ('inspection_type', 'category'),
+    ('compliance', 'category'),
+    ('violation_count', 'int32'),
+    ('facility_information', 'string'),
+)
+VIOLATION_COLUMNS = (
+    ('trade_name', 'string'),
+    ('street', 'string'),
+    ('city', 'category'),
+    ('zip', 'category'),
+    ('inspection_date', 'date'),
+    ('inspection_type', 'category'),
+    ('position', 'int16'),
+    ('code', 'category'),
+    ('code_explanation', 'category'),
+    ('inspector_comments', 'string'),
+)
+UNKNOWN_YEAR = '__HIVE_DEFAULT_PARTITION__'
+
+
+def require_pyarrow():
+    """Raise a helpful error if pyarrow is not installed."""
+    if pa is None:
+        raise RuntimeError("The columnar export needs pyarrow: pip install pyarrow")
+
+
+def _arrow_type(kind):
+    return {
+        'string': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'date': pa.date32(),
+        'int16': pa.int16(),
+        'int32': pa.int32(),
+    }[kind]
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PartitionedTable:
+    """
+    One output table, split into a file per inspection year.
+
+    Rows are buffered per year and written as one row group per flush.
+    Every file keeps its own dictionary for each category column and sends
+    only the new values with each row group.
+    """
+
+    def __init__(self, directory, name, columns, fmt='parquet', compression='zstd'):
+        self.directory = os.path.join(directory, name)
+        self.name = name
+        self.columns = columns
+        self.fmt = fmt
+        self.compression = compression
+        self.schema = pa.schema([(column, _arrow_type(kind)) for column, kind in columns])
+        self.rows = 0
+        self.pending = 0
+        self._buffers = {}
+        self._writers = {}
+        self._vocabularies = {}
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def append(self, row):
+        """Buffer one row; its inspection_date decides the year partition."""
+        date = _date(row.get('inspection_date'))
+        year = date.year if date else UNKNOWN_YEAR
+        buffer = self._buffers.setdefault(year, {column: [] for column, _ in self.columns})
+        for column, kind in self.columns:
+            value = row.get(column)
+            buffer[column].append(date if kind == 'date' else value)
+        self.pending += 1
+
+    def _writer(self, year):
+        if year not in self._writers:
+            partition = os.path.join(self.directory, f"year={year}")
+            os.makedirs(partition, exist_ok=True)
+            if self.fmt == 'arrow':
+                self._writers[year] = pa.ipc.new_file(
+                    os.path.join(partition, 'part-0.arrow'), self.schema,
+                    options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                )
+            else:
+                self._writers[year] = pa.parquet.ParquetWriter(
+                    os.path.join(partition, 'part-0.parquet'), self.schema, compression=self.compression
+                )
+            self._vocabularies[year] = {column: {} for column, kind in self.columns if kind == 'category'}
+        return self._writers[year]
+
+    def _category_array(self, values, vocabulary):
+        # Indices into a dictionary that only ever grows, so each row group
+        # extends the previous one instead of replacing it
+        indices = [None if value is None else vocabulary.setdefault(value, len(vocabulary)) for value in values]
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(list(vocabulary), pa.string()))
+
+    def flush(self):
+        """Write every buffered row as one row group per year."""
+        for year, buffer in self._buffers.items():
+            writer = self._writer(year)
+            vocabularies = self._vocabularies[year]
+            arrays = [
+                self._category_array(buffer[column], vocabularies[column]) if kind == 'category'
+                else pa.array(buffer[column], _arrow_type(kind))
+                for column, kind in self.columns
+            ]
+            batch = pa.record_batch(arrays, schema=self.schema)
+            writer.write_batch(batch)
+            self.rows += batch.num_rows
+        self._buffers = {}
+        self.pending = 0
+
+    def close(self):
+        """Flush and close every year's file."""
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+
+    @property
+    def years(self):
+        return sorted(self._writers, key=str)
+
+
+class ColumnarExporter:
+    """
+    Streams records into the partitioned inspections and violations tables.
+
+    Args:
+        directory: Output directory; its inspections/ and violations/ tables are replaced
+        fmt: 'parquet' or 'arrow' (Arrow IPC files)
+        batch_rows: Rows buffered across both tables before a row group is written
+        compression: Parquet compression codec
+    """
+
+    def __init__(self, directory, fmt='parquet', batch_rows=50000, compression='zstd'):
+        require_pyarrow()
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.records = 0
+        self.inspections = PartitionedTable(directory, 'inspections', INSPECTION_COLUMNS, fmt, compression)
+        self.violations = PartitionedTable(directory, 'violations', VIOLATION_COLUMNS, fmt, compression)
+
+    def _maybe_flush(self):
+        if self.inspections.pending + self.violations.pending >= self.batch_rows:
+            self.inspections.flush()
+            self.violations.flush()
+
+    def add_inspection(self, row):
+        """Add one flat inspection row (see INSPECTION_COLUMNS)."""
+        self.inspections.append(row)
+        self._maybe_flush()
+
+    def add_violation(self, row):
+        """Add one flat violation row (see VIOLATION_COLUMNS)."""
+        self.violations.append(row)
+        self._maybe_flush()
+
+    def add_record(self, record):
+        """Flatten one main.py or newmain.py record into both tables."""
+        establishment, inspections = normalize_record(record)
+        for inspection in inspections:
+            row = dict(establishment, **inspection)
+            self.inspections.append(row)
+            for position, violation in enumerate(inspection['violations'] or []):
+                self.violations.append(dict(
+                    row, position=position, code=violation.get('code'),
+                    code_explanation=violation.get('code_explanation'),
+                    inspector_comments=violation.get('inspector_comments')
+                ))
+        self.records += 1
+        self._maybe_flush()
+
+    def add_file(self, path):
+        """Add every record of an NDJSON file or JSON array file."""
+        for record in ndjson_sink.iter_file(path):
+            self.add_record(record)
+
+    def add_database(self, path):
+        """Add every inspection and violation of a sqlite_store database."""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute(
+                """SELECT e.trade_name, e.owner_name, e.street, e.city, e.state, e.zip, e.phone,
+                          i.inspection_date, i.inspection_type, i.compliance, i.violation_count,
+                          i.facility_information
+                   FROM inspections i JOIN establishments e ON e.id = i.establishment_id"""
+            ):
+                self.add_inspection(dict(row))
+            for row in conn.execute(
+                """SELECT e.trade_name, e.street, e.city, e.zip, i.inspection_date, i.inspection_type,
+                          v.position, v.code, COALESCE(v.code_explanation, c.explanation) AS code_explanation,
+                          v.inspector_comments
+                   FROM violations v
+                   JOIN inspections i ON i.id = v.inspection_id
+                   JOIN establishments e ON e.id = i.establishment_id
+                   LEFT JOIN violation_codes c ON c.code = v.code"""
+            ):
+                self.add_violation(dict(row))
+        finally:
+            conn.close()
+
+    def close(self):
+        """Write the remaining rows and close all files."""
+        self.inspections.close()
+        self.violations.close()
+        for table in (self.inspections, self.violations):
+            print(f"Wrote {table.rows} {table.name} rows for years "
+                  f"{', '.join(map(str, table.years)) or '-'} to {table.directory}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export crawl results to columnar Parquet/Arrow files.")
+    parser.add_argument('files', nargs='*', help="NDJSON or JSON output of main.py/newmain.py")
+    parser.add_argument('--sqlite', metavar='DATABASE', help="Export a sqlite_store.py database instead")
+    parser.add_argument('--out', default='analytics', help="Output directory")
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--batch-rows', type=int, default=50000, help="Rows per row group flush")
+    parser.add_argument('--compression', default='zstd', help="Parquet compression codec")
+    args = parser.parse_args()
+    if not args.files and not args.sqlite:
+        parser.error("give input files or --sqlite")
+
+    with ColumnarExporter(args.out, args.format, args.batch_rows, args.compression) as exporter:
+        for path in args.files:
+            exporter.add_file(path)
+            print(f"Exported {path}")
+        if args.sqlite:
+            exporter.add_database(args.sqlite)
+            print(f"Exported {args.sqlite}")
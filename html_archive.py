@@ -0,0 +1,435 @@
+"""
+Raw HTML Archive
+Keeps every grid page and violations popup the HTTP crawls fetch. When the
+parsing code changes, old data can then be rebuilt by re-parsing the
+archive instead of crawling the site again.
+
+    <archive>/bodies.zst    append-only; one independent zstd frame per distinct body
+    <archive>/index.db      SQLite offset index of the pages and popups
+
+Grid pages are indexed by search and page number. Popups are indexed by the
+page entry they were opened from and their lnkViolations postback target,
+and by the inspection they show: the search, establishment name and address,
+inspection date and type. A later crawl does not reopen popups it already
+has (past inspections in --sqlite, unchanged rows under --incremental), so a
+re-parse falls back to the newest popup archived for the same inspection by
+any earlier run. Identical bodies are stored once. Bodies are read back through mmap one frame at a
+time, so any page or popup can be read without decompressing the rest.
+
+Requires zstandard (pip install zstandard).
+
+Usage:
+    python main.py --backend http --archive html_archive
+    python html_archive.py html_archive                          # what is stored
+    python html_archive.py html_archive --page 12 > page12.html
+    python html_archive.py html_archive --reparse rebuilt.ndjson --workers 4
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import ndjson_sink
+from incremental import past_inspection_records
+from page_parser import PopupNotLoaded, parse_grid_rows, parse_violation_popup
+from parse_pool import ParsePool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    digest TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    search TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    digest TEXT NOT NULL REFERENCES bodies(digest),
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_search_page ON pages (search, page, id);
+CREATE TABLE IF NOT EXISTS popups (
+    page_id INTEGER NOT NULL REFERENCES pages(id),
+    target TEXT NOT NULL,
+    inspection TEXT,
+    digest TEXT NOT NULL REFERENCES bodies(digest),
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (page_id, target)
+);
+CREATE INDEX IF NOT EXISTS idx_popups_inspection ON popups (inspection, fetched_at);
+"""
+DATA_FILE = 'bodies.zst'
+INDEX_FILE = 'index.db'
+COMMIT_EVERY = 100  # Index rows per transaction
+
+
+def require_zstandard():
+    """Raise a helpful error if zstandard is not installed."""
+    if zstandard is None:
+        raise RuntimeError("The HTML archive needs zstandard: pip install zstandard")
+
+
+def search_key(criteria):
+    """Return the key pages of a search are archived under; '' for the unfiltered search."""
+    return json.dumps(criteria, sort_keys=True) if criteria else ''
+
+
+def inspection_key(search, violations_link):
+    """
+    Return the key a popup is archived under across crawl runs.
+
+    Args:
+        search: Key of the search the popup was opened from
+        violations_link: Link dictionary from page_parser.parse_grid_rows
+
+    Returns:
+        JSON key of the search and the link's 'inspection', or None if the
+        link does not say which inspection it opens
+    """
+    inspection = violations_link.get('inspection')
+    return json.dumps([search, *inspection]) if inspection else None
+
+
+class HtmlArchive:
+    """
+    Thread-safe writer and reader of an archive directory.
+
+    Args:
+        directory: Archive directory; created if missing
+        level: zstd compression level
+        readonly: Open an existing archive for reading only, e.g. in re-parse workers
+    """
+
+    def __init__(self, directory, level=10, readonly=False):
+        require_zstandard()
+        self.directory = directory
+        self.level = level
+        self.readonly = readonly
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = 0
+        self._map = None
+        self._data_path = os.path.join(directory, DATA_FILE)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+            self._data = None
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(index_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self._data = open(self._data_path, 'ab')
+            # Bytes past the last indexed frame are left over from a crash; drop them
+            self._end = self.conn.execute("SELECT COALESCE(MAX(offset + length), 0) FROM bodies").fetchone()[0]
+            self._data.truncate(self._end)
+
+    def _codec(self):
+        # zstd contexts are not thread-safe, so every thread gets its own pair
+        if not hasattr(self._local, 'compressor'):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.compressor, self._local.decompressor
+
+    def _store(self, body):
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            known = self.conn.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone()
+        if known:
+            with self._lock:
+                self.deduplicated += 1
+            return digest
+        frame = self._codec()[0].compress(body)
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone():
+                self.deduplicated += 1
+                return digest
+            self._data.write(frame)
+            self.conn.execute(
+                "INSERT INTO bodies (digest, offset, length, size) VALUES (?, ?, ?, ?)",
+                (digest, self._end, len(frame), len(body))
+            )
+            self._end += len(frame)
+            self.stored += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(frame)
+        return digest
+
+    def _added(self):
+        # Called with the lock held; the frames are on disk before the index points at them
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        self._data.flush()
+        self.conn.commit()
+        self._pending = 0
+
+    def add_page(self, page_num, body, search=''):
+        """
+        Archive a grid page.
+
+        Args:
+            page_num: Page number of the grid
+            body: Raw HTML as fetched
+            search: Key of the search the page belongs to; '' for the unfiltered search
+
+        Returns:
+            ID of the page entry, for add_popup()
+        """
+        digest = self._store(body)
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO pages (search, page, digest, fetched_at) VALUES (?, ?, ?, ?)",
+                (search, page_num, digest, time.time())
+            )
+            self._added()
+            return cursor.lastrowid
+
+    def add_popup(self, page_id, violations_link, body):
+        """
+        Archive a violations popup opened from an archived page.
+
+        Args:
+            page_id: Entry ID returned by add_page() for the page holding the link
+            violations_link: Link dictionary from page_parser.parse_grid_rows
+            body: Raw HTML as fetched
+        """
+        digest = self._store(body)
+        with self._lock:
+            search = self.conn.execute("SELECT search FROM pages WHERE id = ?", (page_id,)).fetchone()[0]
+            self.conn.execute(
+                """INSERT OR REPLACE INTO popups (page_id, target, inspection, digest, fetched_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (page_id, violations_link['target'], inspection_key(search, violations_link), digest, time.time())
+            )
+            self._added()
+
+    def flush(self):
+        """Make everything archived so far visible to readers."""
+        with self._lock:
+            if self._data is not None:
+                self._commit()
+
+    def read(self, digest):
+        """
+        Read one body back.
+
+        Args:
+            digest: SHA-256 of the body, as listed in the index
+
+        Returns:
+            The body bytes
+
+        Raises:
+            KeyError: If the archive holds no such body
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT offset, length FROM bodies WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(digest)
+            offset, length = row
+            if self._map is None or offset + length > len(self._map):
+                # The data file grew since it was mapped
+                if self._data is not None:
+                    self._data.flush()
+                if self._map is not None:
+                    self._map.close()
+                with open(self._data_path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            frame = self._map[offset:offset + length]
+        return self._codec()[1].decompress(frame)
+
+    def latest_pages(self):
+        """
+        List the newest entry of every archived page.
+
+        Returns:
+            List of (page entry ID, search, page number, digest), by search and page
+        """
+        with self._lock:
+            return self.conn.execute(
+                """SELECT p.id, p.search, p.page, p.digest FROM pages p
+                   JOIN (SELECT MAX(id) AS id FROM pages GROUP BY search, page) latest ON latest.id = p.id
+                   ORDER BY p.search, p.page"""
+            ).fetchall()
+
+    def page(self, page_num, search=''):
+        """Return the newest archived body of a grid page, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM pages WHERE search = ? AND page = ? ORDER BY id DESC LIMIT 1",
+                (search, page_num)
+            ).fetchone()
+        return self.read(row[0]) if row else None
+
+    def popups(self, page_id):
+        """Return the popups opened from a page entry as {postback target: digest}."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT target, digest FROM popups WHERE page_id = ?", (page_id,)))
+
+    def latest_popup(self, search, violations_link):
+        """
+        Find the newest archived popup of the inspection a link opens, from any page entry.
+
+        Returns:
+            Digest of the popup body, or None if no run archived it
+        """
+        key = inspection_key(search, violations_link)
+        if key is None:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM popups WHERE inspection = ? ORDER BY fetched_at DESC LIMIT 1", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        """Return entry counts and sizes of the whole archive."""
+        with self._lock:
+            pages, page_keys = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT search || ':' || page) FROM pages"
+            ).fetchone()
+            popups = self.conn.execute("SELECT COUNT(*) FROM popups").fetchone()[0]
+            bodies, size, length = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM bodies"
+            ).fetchone()
+        return {'pages': pages, 'distinct_pages': page_keys, 'popups': popups, 'bodies': bodies,
+                'bytes': size, 'compressed_bytes': length}
+
+    def print_summary(self):
+        """Print what this run added and the size of the archive."""
+        stats = self.stats()
+        ratio = stats['bytes'] / stats['compressed_bytes'] if stats['compressed_bytes'] else 0.0
+        print(f"HTML archive: {self.stored} bodies added, {self.deduplicated} already stored; "
+              f"{stats['distinct_pages']} pages and {stats['popups']} popups in {self.directory}, "
+              f"{stats['compressed_bytes'] / (1 << 20):.1f} MB ({ratio:.1f}x compressed)")
+
+    def close(self):
+        """Commit the index and close the files."""
+        with self._lock:
+            if self._data is not None:
+                self._commit()
+                self._data.close()
+            if self._map is not None:
+                self._map.close()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _ArchivedHistory:
+    """History stand-in for past_inspection_records that asks for every past popup."""
+
+    def missing_violation_details(self, *inspection):
+        return True
+
+
+_READERS = {}  # Archive directory -> HtmlArchive, one per worker process
+
+
+def reparse_page(directory, page_id, search, digest):
+    """
+    Rebuild the rows of one archived grid page; runs in a parse_pool worker.
+
+    Popups are taken from the archive: the one opened from this page entry,
+    or else the newest one any run archived for the same inspection. Links
+    whose popup was never archived (e.g. past inspections no crawl opened)
+    get no violation details.
+
+    Returns:
+        List of row dictionaries, as the crawl would have written them
+    """
+    archive = _READERS.get(directory)
+    if archive is None:
+        archive = _READERS[directory] = HtmlArchive(directory, readonly=True)
+    popups = archive.popups(page_id)
+
+    def details(violations_link):
+        popup = popups.get(violations_link['target']) or archive.latest_popup(search, violations_link)
+        if popup is None:
+            return None
+        try:
+            return parse_violation_popup(archive.read(popup))
+        except PopupNotLoaded as e:
+            return {"error": str(e)}
+
+    rows = []
+    for row_data, row_info in parse_grid_rows(archive.read(digest)):
+        violations_link = row_info['violations_link']
+        row_data['violation_details'] = details(violations_link) if violations_link else None
+        row_data['past_inspections'] = past_inspection_records(row_info, details, _ArchivedHistory())
+        rows.append(row_data)
+    return rows
+
+
+def reparse(directory, output, workers=None):
+    """
+    Rebuild the dataset from the newest archived copy of every page, without the network.
+
+    Args:
+        directory: Archive directory
+        output: NDJSON file the rows are written to, in search and page order
+        workers: Parser processes; None uses one per core, 0 parses in this process
+
+    Returns:
+        Number of rows written
+    """
+    with HtmlArchive(directory, readonly=True) as archive:
+        pages = archive.latest_pages()
+    start = time.perf_counter()
+    with ParsePool(workers) as pool, ndjson_sink.NdjsonWriter(output) as writer:
+        results = pool.map(
+            reparse_page, [directory] * len(pages), [page[0] for page in pages], [page[1] for page in pages],
+            [page[3] for page in pages]
+        )
+        for rows in results:
+            writer.add(rows)
+        count = writer.count
+    elapsed = time.perf_counter() - start
+    print(f"Re-parsed {len(pages)} archived pages into {count} rows in {elapsed:.1f}s "
+          f"({len(pages) / elapsed if elapsed else 0:.0f} pages/s); wrote {output}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a raw HTML archive or rebuild the dataset from it.")
+    parser.add_argument('directory', help="Archive directory")
+    parser.add_argument('--page', type=int, help="Write the newest archived copy of this grid page to stdout")
+    parser.add_argument('--search', default='', help="Search key of --page (default: the unfiltered search)")
+    parser.add_argument('--reparse', metavar='NDJSON', help="Rebuild the rows of every archived page into NDJSON")
+    parser.add_argument('--workers', type=int, help="Parser processes for --reparse (default: one per core)")
+    args = parser.parse_args()
+
+    if args.page is not None:
+        with HtmlArchive(args.directory, readonly=True) as archive:
+            body = archive.page(args.page, args.search)
+        if body is None:
+            sys.exit(f"Page {args.page} is not archived")
+        sys.stdout.buffer.write(body)
+    elif args.reparse:
+        reparse(args.directory, args.reparse, args.workers)
+    else:
+        with HtmlArchive(args.directory, readonly=True) as archive:
+            archive.print_summary()
@@ -0,0 +1,433 @@
+"""
+HTTP Fetch Backend
+Replays the ASP.NET WebForms postbacks of the public inspection search page over
+a pooled HTTP session, so the results grid can be walked without a browser.
+"""
+
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import incremental
+from html_archive import search_key
+from metrics import METRICS
+from response_cache import request_key
+from page_parser import (
+    extract_form_fields,
+    get_next_page_number,
+    has_results,
+    next_hop,
+    parse_document,
+    parse_grid_rows,
+    parse_headers,
+    parse_page_count,
+    parse_pager,
+    parse_violation_popup,
+    PopupNotLoaded
+)
+
+SEARCH_URL = "https://foodsafety.kda.ks.gov/FoodSafety/Web/Inspection/PublicInspectionSearch.aspx"
+GRID_TARGET = 'ctl00$MainContent$gvInspections'
+SEARCH_BUTTON = 'ctl00$MainContent$btnSearch'
+USER_AGENT = (
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+)
+
+log = logging.getLogger(__name__)
+
+
+def create_session(pool_size=10):
+    """
+    Create an HTTP session with a pooled, keep-alive connection adapter.
+
+    Args:
+        pool_size: Maximum number of pooled connections per host
+
+    Returns:
+        Configured requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+
+class WebFormsClient:
+    """
+    Stateful client for the inspection search page.
+
+    Keeps the hidden WebForms state (__VIEWSTATE, __EVENTVALIDATION, ...) of the
+    last page it loaded and sends it back with every postback, exactly as the
+    browser form would.
+    """
+
+    def __init__(self, url=SEARCH_URL, session=None, timeout=30, rate_limiter=None, cache=None,
+                 resilience=None):
+        self.url = url
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.resilience = resilience
+        self.fields = {}
+        self.doc = None
+        self.body = None  # Raw HTML of doc, for parsing it elsewhere (see parse_pool.py)
+
+    def _throttle(self):
+        if self.rate_limiter:
+            self.rate_limiter.wait(self.url)
+
+    def _request(self, method, form=None):
+        self._throttle()
+        with METRICS.timer('request'):
+            if method == 'GET':
+                response = self.session.get(self.url, timeout=self.timeout)
+            else:
+                response = self.session.post(self.url, data=form, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def _fetch_body(self, method, form=None, store=True):
+        # Serve from the response cache when it holds this exact request; with
+        # store=False a fetched body is left for the caller to cache once it is known good
+        key = request_key(method, self.url, form) if self.cache else None
+        body = self.cache.get(key) if key else None
+        if key:
+            METRICS.increment('cache_requests_total', result='miss' if body is None else 'hit')
+        if body is None:
+            if self.resilience:
+                body = self.resilience.call(self.url, self._request, method, form)
+            else:
+                body = self._request(method, form)
+            if key and store:
+                self.cache.put(key, body)
+        return body
+
+    def parse(self, body):
+        """Parse raw HTML fetched by this client, e.g. from fetch_violations_body()."""
+        with METRICS.timer('parse'):
+            return parse_document(body)
+
+    def _submit(self, form):
+        return self._fetch_body('POST', form)
+
+    def _commit(self, body, doc=None):
+        self.body = body
+        self.doc = self.parse(body) if doc is None else doc
+        self.fields = extract_form_fields(self.doc)
+        return self.doc
+
+    def load(self):
+        """Fetch the empty search page and capture its initial form state."""
+        return self._commit(self._fetch_body('GET'))
+
+    @METRICS.timed('search')
+    def search(self, criteria=None):
+        """
+        Submit the search form, like clicking MainContent_btnSearch.
+
+        Args:
+            criteria: Form fields to fill in first, e.g. {'ctl00$MainContent$txtCity': 'Wichita'};
+                an empty search returns every establishment
+
+        Returns:
+            Parsed lxml document of the first result page
+        """
+        if self.doc is None:
+            self.load()
+        form = dict(self.fields)
+        form.update(criteria or {})
+        form[SEARCH_BUTTON] = 'Search'
+        return self._commit(self._submit(form))
+
+    def post_back(self, target, argument=''):
+        """
+        Replay a __doPostBack(target, argument) call and carry the new state forward.
+
+        Args:
+            target: Event target control name
+            argument: Event argument, e.g. 'Page$2'
+
+        Returns:
+            Parsed lxml document of the response
+        """
+        form = dict(self.fields)
+        form['__EVENTTARGET'] = target
+        form['__EVENTARGUMENT'] = argument
+        return self._commit(self._submit(form))
+
+    @METRICS.timed('page_load')
+    def go_to_page(self, page_num):
+        """Switch the results grid to the given page."""
+        return self.post_back(GRID_TARGET, f'Page${page_num}')
+
+    def try_page(self, page_num):
+        """
+        Post Page$page_num once, whether or not the pager links it.
+
+        Bypasses the cache and retries: the site may reject pages its pager
+        did not render, and that answer should cost one request.
+
+        Returns:
+            Parsed lxml document of the page, or None if the site refused the jump
+        """
+        form = dict(self.fields)
+        form['__EVENTTARGET'] = GRID_TARGET
+        form['__EVENTARGUMENT'] = f'Page${page_num}'
+        try:
+            body = self._request('POST', form)
+        except requests.HTTPError:
+            return None
+        doc = parse_document(body)
+        if parse_pager(doc)['current_page'] != page_num:
+            return None
+        return self._commit(body, doc)
+
+    def open_report(self, button, fields=None):
+        """
+        Click an inspection report button and return the response unread.
+
+        The button is an image submit button, so the click is sent as its
+        .x/.y fields rather than as a __doPostBack target.
+
+        Args:
+            button: Form name of a btnInspectionReport button
+            fields: Form state of the page the button is on; defaults to the
+                client's current page
+
+        Returns:
+            Streaming requests.Response; the caller reads and closes it
+        """
+        form = dict(self.fields if fields is None else fields)
+        form['__EVENTTARGET'] = ''
+        form['__EVENTARGUMENT'] = ''
+        form[f'{button}.x'] = '8'
+        form[f'{button}.y'] = '8'
+        self._throttle()
+        response = self.session.post(self.url, data=form, timeout=self.timeout, stream=True)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def fetch_violations(self, target, fields=None):
+        """
+        Open a violations popup and return the rendered page.
+
+        The grid itself does not change, so the current form state is kept and
+        the same page can serve any number of popups.
+
+        Args:
+            target: Event target of a lnkViolations link
+            fields: Form state of the page the link is on; defaults to the
+                client's current page
+
+        Returns:
+            Parsed lxml document containing the popup content
+        """
+        return self.parse(self.fetch_violations_body(target, fields))
+
+    def _violations_form(self, target, fields):
+        form = dict(self.fields if fields is None else fields)
+        form['__EVENTTARGET'] = target
+        form['__EVENTARGUMENT'] = ''
+        return form
+
+    def fetch_violations_body(self, target, fields=None):
+        """
+        Open a violations popup like fetch_violations() and return the raw HTML unparsed.
+
+        A fetched popup is not put in the response cache: an unpopulated one
+        would be served from there until it expired. Call
+        cache_violations_body() once the popup has parsed.
+        """
+        return self._fetch_body('POST', self._violations_form(target, fields), store=False)
+
+    def cache_violations_body(self, target, body, fields=None):
+        """Store a popup body that parsed in the response cache, keyed like fetch_violations_body()."""
+        if self.cache:
+            self.cache.put(request_key('POST', self.url, self._violations_form(target, fields)), body)
+
+
+class HttpPageSession:
+    """
+    One independent crawl position over the results grid, backed by HTTP.
+
+    Sessions share nothing but an optional rate limiter, so several of them
+    can walk disjoint page ranges side by side. With search criteria the
+    session walks the filtered results instead of the whole state. With an
+    html_archive.HtmlArchive every scraped page and popup is archived raw.
+    """
+
+    def __init__(self, url=SEARCH_URL, rate_limiter=None, client=None, change_tracker=None, history=None,
+                 criteria=None, cache=None, resilience=None, navigator=None, archive=None):
+        self.client = client or WebFormsClient(
+            url=url, rate_limiter=rate_limiter, cache=cache, resilience=resilience
+        )
+        self.navigator = navigator
+        self.change_tracker = change_tracker
+        self.history = history
+        self.criteria = criteria
+        self.archive = archive
+        self.headers = None
+        self.page_num = 1
+        self._page_entry = None  # Archive entry of the page being scraped
+
+    def open(self):
+        """
+        Run the search and land on page 1.
+
+        Leaves headers as None if the search matched nothing.
+        """
+        doc = self.client.search(self.criteria)
+        self.headers = parse_headers(doc) if has_results(doc) else None
+        self.page_num = 1
+        if self.navigator and self.headers is not None:
+            self.navigator.remember(1, self.client.fields, parse_pager(doc))
+
+    def total_pages(self):
+        """Return the number of result pages."""
+        return parse_page_count(self.client.doc)
+
+    def form_state(self):
+        """Return the WebForms fields of the current page, for checkpoints."""
+        return dict(self.client.fields)
+
+    def resume(self, form_state, page_num):
+        """
+        Continue from a checkpointed page state without running a new search.
+
+        The jump is tried once, without retries: a page the saved state
+        cannot reach is answered with a server error, which is no reason to
+        back off or open the circuit breaker.
+
+        Args:
+            form_state: Fields saved by form_state() on page page_num - 1
+            page_num: Page to move to
+
+        Returns:
+            True if the server accepted the saved state
+        """
+        self.client.fields = dict(form_state)
+        try:
+            doc = self.client.try_page(page_num)
+            if doc is None:
+                return False
+            self.headers = parse_headers(doc)
+        except (requests.RequestException, TypeError, IndexError) as e:
+            log.warning("Could not resume from saved page state: %s", e)
+            return False
+        pager = parse_pager(doc)
+        self.page_num = page_num
+        if self.navigator:
+            self.navigator.remember(page_num, self.client.fields, pager)
+        return True
+
+    def seek(self, page_num):
+        """
+        Move the grid to page_num, hopping through the pager window as needed.
+
+        With a pager.PageNavigator the jump is made directly if the site
+        allows it, or from the nearest page state any session has seen.
+        """
+        if self.navigator:
+            self.navigator.seek(self.client, page_num)
+            self.page_num = parse_pager(self.client.doc)['current_page']
+            return
+        while True:
+            hop = next_hop(self.client.doc, page_num)
+            if hop is None:
+                return
+            self.client.go_to_page(hop)
+            self.page_num = hop
+
+    def next_page(self):
+        """
+        Advance to the following page.
+
+        Returns:
+            True if the grid moved, False on the last page
+        """
+        next_page = get_next_page_number(self.client.doc, self.page_num)
+        if next_page is None:
+            return False
+        doc = self.client.go_to_page(next_page)
+        self.page_num = next_page
+        if self.navigator:
+            self.navigator.remember(next_page, self.client.fields, parse_pager(doc))
+        return True
+
+    def archive_page(self):
+        """
+        Archive the raw HTML of the current page.
+
+        Returns:
+            Entry ID for popups opened from the page, or None without an archive
+        """
+        if self.archive is None:
+            return None
+        return self.archive.add_page(self.page_num, self.client.body, search_key(self.criteria))
+
+    @METRICS.timed('popup')
+    def fetch_violation_details(self, violations_link):
+        """
+        Open one violations popup and parse it.
+
+        Args:
+            violations_link: Link dictionary from page_parser.parse_grid_rows
+
+        Returns:
+            Dictionary containing violation details
+        """
+        try:
+            body = self.client.fetch_violations_body(violations_link['target'])
+            if self.archive is not None:
+                self.archive.add_popup(self._page_entry, violations_link, body)
+            details = parse_violation_popup(self.client.parse(body))
+            self.client.cache_violations_body(violations_link['target'], body)
+            return details
+        except (requests.RequestException, PopupNotLoaded) as e:
+            log.warning("Error in get_violation_details: %s", e)
+            METRICS.increment('popup_errors_total')
+            return {"error": str(e)}
+
+    def scrape_page(self):
+        """
+        Scrape every row on the current page, opening violation popups as needed.
+
+        With a change tracker, rows it reports as unchanged are skipped
+        without opening their popups. Past inspections are read from the
+        row itself; their popups are opened only for inspections the
+        history store is missing.
+
+        Returns:
+            List of row dictionaries
+        """
+        rows = []
+        self._page_entry = self.archive_page()
+        for row_data, row_info in parse_grid_rows(self.client.doc, self.headers):
+            if self.change_tracker and not self.change_tracker.should_fetch(row_data, row_info):
+                continue
+            violations_link = row_info['violations_link']
+            if violations_link:
+                row_data['violation_details'] = self.fetch_violation_details(violations_link)
+            else:
+                row_data['violation_details'] = None
+            row_data['past_inspections'] = incremental.past_inspection_records(
+                row_info, self.fetch_violation_details, self.history
+            )
+            if self.change_tracker:
+                self.change_tracker.seen(row_data, row_info)
+            rows.append(row_data)
+        return rows
+
+    def close(self):
+        """Release pooled connections."""
+        self.client.session.close()
+
@@ -0,0 +1,122 @@
+"""
+Incremental Crawl Index
+Remembers the latest inspection seen for every establishment so daily reruns
+only open the violations popup for inspections that are new or changed.
+
+Establishments are keyed by the tradeName and mapAddress fields that
+newmain.py builds; the stored value is the inspectionDate and type of the
+most recent inspection written.
+
+Past inspections embedded in each grid row are harvested on the same page
+load; their violation popups are only opened when the history store does
+not already hold their details.
+"""
+
+import json
+import os
+import threading
+
+
+class InspectionIndex:
+    """Thread-safe establishment -> latest inspection index backed by a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.stats = {'new': 0, 'changed': 0, 'unchanged': 0}
+
+    @staticmethod
+    def key(row_info):
+        """Build the establishment key from the parsed tradeName and mapAddress."""
+        return f"{row_info['trade_name']}\n{row_info['map_address']}"
+
+    @staticmethod
+    def inspection(row_data):
+        """Return the [inspectionDate, inspectionType] pair of a grid row."""
+        return [row_data.get("Most Recent Inspection", ""), row_data.get("Inspection Type", "")]
+
+    def load(self):
+        """Read the index from disk if it exists."""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        print(f"Loaded {len(self.entries)} establishments from {self.path}")
+        return self
+
+    def save(self):
+        """Write the index atomically."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        print(f"Saved {len(self.entries)} establishments to {self.path}")
+
+    def should_fetch(self, row_data, row_info):
+        """
+        Decide whether a grid row holds a new or changed inspection.
+
+        Args:
+            row_data: Scraped grid row
+            row_info: Parsed row details from page_parser.parse_grid_rows
+
+        Returns:
+            True if the row should be scraped in full and written
+        """
+        with self._lock:
+            known = self.entries.get(self.key(row_info))
+            if known is None:
+                self.stats['new'] += 1
+                return True
+            if known != self.inspection(row_data):
+                self.stats['changed'] += 1
+                return True
+            self.stats['unchanged'] += 1
+            return False
+
+    def seen(self, row_data, row_info):
+        """
+        Record a fully scraped row so later runs skip it.
+
+        Rows whose violation popup failed are left out and retried next run.
+        """
+        details = row_data.get('violation_details')
+        if isinstance(details, dict) and 'error' in details:
+            return
+        with self._lock:
+            self.entries[self.key(row_info)] = self.inspection(row_data)
+
+    def print_summary(self):
+        """Print how many rows were new, changed and skipped."""
+        print(f"Incremental crawl: {self.stats['new']} new, {self.stats['changed']} changed, "
+              f"{self.stats['unchanged']} unchanged rows skipped")
+
+
+def past_inspection_records(row_info, fetch_details, history=None):
+    """
+    Build the past-inspection history of a grid row.
+
+    Args:
+        row_info: Parsed row details from page_parser.parse_grid_rows
+        fetch_details: Callable taking a violations link and returning the
+            popup's violation record
+        history: Optional store with a missing_violation_details() method,
+            such as sqlite_store.SqliteStore; without one no past popups
+            are opened
+
+    Returns:
+        List of past inspection dictionaries with 'violation_details' set to
+        the popup record, or None when it was not fetched
+    """
+    records = []
+    for past in row_info.get('past_inspections', []):
+        record = {key: value for key, value in past.items() if key not in ('violations_link', 'report_button')}
+        record['violation_details'] = None
+        link = past['violations_link']
+        if link and history is not None and history.missing_violation_details(
+                row_info['trade_name'], row_info['map_address'],
+                past['inspection_date'], past['inspection_type']):
+            record['violation_details'] = fetch_details(link)
+        records.append(record)
+    return records
@@ -2,12 +2,21 @@
 """
 Food Safety Inspection Data Scraper
 This script scrapes food safety inspection data from the Kansas Department of Agriculture website.
+
+It is the single entry point for every crawl mode: Chrome (selenium) or
+WebForms postbacks (http, async) fetch the pages, one engine walks them,
+and every mode writes the record layout described in schema.py.
+
+Usage:
+    python main.py --backend http --workers 4 --pages 1-50
+    python main.py --backend selenium --format inspections --json-output inspection_data.json
+    python main.py --backend async --archive html_archive    # re-parse later with html_archive.py
 """
 
 import time
-import json
+import argparse
+import logging
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -18,14 +27,39 @@ from selenium.common.exceptions import (
 )
 from selenium.webdriver.remote.webelement import WebElement
 
-
-def setup_driver():
+import async_pipeline
+import checkpoint
+import driver_pool
+import export_parquet
+import html_archive
+import http_backend
+import incremental
+import metrics
+import ndjson_sink
+import page_parser
+import pager
+import parallel_crawl
+import partitions
+import resilience
+import response_cache
+import schema
+import sqlite_store
+import violation_extractor
+import waits
+
+OUTPUT_FORMATS = ('json', 'ndjson', 'inspections', 'parquet')
+DEFAULT_EXPORTS = {
+    'json': "food_safety_data.json",
+    'ndjson': None,
+    'inspections': "inspection_data.json",
+    'parquet': "analytics"
+}
+
+log = logging.getLogger(__name__)
+
+def setup_driver(headless=True):
     """Initialize and configure the Chrome WebDriver."""
-    options = webdriver.ChromeOptions()
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    driver = webdriver.Chrome(options=options)
-    return driver
+    return driver_pool.launch_driver(headless=headless)
 
 
 def wait_and_find_element(driver, by, value, timeout=10, retries=3):
@@ -42,6 +76,7 @@ def wait_and_find_element(driver, by, value, timeout=10, retries=3):
     Returns:
         WebElement if found
     """
+    policy = resilience.POLICIES['stale']
     for attempt in range(retries):
         try:
             element = WebDriverWait(driver, timeout).until(
@@ -51,285 +86,872 @@ def wait_and_find_element(driver, by, value, timeout=10, retries=3):
         except StaleElementReferenceException:
             if attempt == retries - 1:
                 raise
-            time.sleep(1)
+            time.sleep(policy.delay(attempt + 1))
 
 
-def get_next_page_link(driver, current_page):
+@metrics.METRICS.timed('popup')
+def get_violation_details(driver, violation_link):
     """
-    Find the next page link in pagination.
+    Extract violation details from popup window.
 
     Args:
         driver: WebDriver instance
-        current_page: Current page number
+        violation_link: Link element that opens violation details
 
     Returns:
-        Tuple of (next_link_element, has_next_page)
+        Dictionary containing violation details
     """
     try:
-        pagination_row = wait_and_find_element(
-            driver,
-            By.CSS_SELECTOR,
-            '#MainContent_gvInspections > tbody > tr:last-child'
-        )
-        page_links = pagination_row.find_elements(By.TAG_NAME, 'a')
-        
-        for link in page_links:
-            try:
-                if link.text.isdigit() and int(link.text) == current_page + 1:
-                    return link, True
-                if link.text == "..." and 'Page$' in link.get_attribute('href'):
-                    href = link.get_attribute('href')
-                    if f'Page${current_page + 1}' in href:
-                        return link, True
-            except StaleElementReferenceException:
-                continue
-        
-        return None, False
+        # Open violation details popup
+        driver.execute_script("arguments[0].click();", violation_link)
+        log.debug("Clicked violation link")
+
+        # Wait for the popup and read all of it with one script call
+        violation_record = violation_extractor.extract_violations(driver, timeout=10)
+        if "error" in violation_record:
+            log.warning("Popup content not loaded")
+            metrics.METRICS.increment('popup_errors_total')
+            return violation_record
+        log.debug("Found %d violations for %s",
+                  len(violation_record['violations']), violation_record['inspection_date'])
+
+        # Close popup
+        try:
+            driver.execute_script(
+                "var close = document.getElementById('cboxClose'); if (close) { close.click(); }"
+            )
+            waits.wait_for_popup_closed(driver)
+        except Exception as e:
+            log.warning("Error with close button: %s", e)
+
+        return violation_record
+
     except Exception as e:
-        print(f"Error in get_next_page_link: {str(e)}")
-        return None, False
+        log.warning("Error in get_violation_details: %s", e)
+        metrics.METRICS.increment('popup_errors_total')
+        return {"error": str(e)}
 
 
-def get_violation_details(driver, violation_link):
+def fetch_violation_details(driver, violations_link, rate_limiter=None, retries=None):
     """
-    Extract violation details from popup window.
+    Find a violations link by ID and read its popup.
 
     Args:
         driver: WebDriver instance
-        violation_link: Link element that opens violation details
+        violations_link: Link dictionary from page_parser.parse_grid_rows
+        rate_limiter: Optional parallel_crawl.RateLimiter applied before the popup
+        retries: Optional resilience.Resilience; a popup that fails to load
+            is retried with backoff before its error is recorded
 
     Returns:
-        Dictionary containing violation details
+        Dictionary containing violation details, or None if the link is gone
     """
+    def read_popup():
+        violation_link = driver.find_element(By.ID, violations_link['id'])
+        if rate_limiter:
+            rate_limiter.wait(driver.current_url)
+        details = get_violation_details(driver, violation_link)
+        if retries and "error" in details:
+            raise TimeoutException(details["error"])
+        return details
+
     try:
-        # Open violation details popup
-        driver.execute_script("arguments[0].click();", violation_link)
-        print("Clicked violation link...")
-
-        # Wait for popup to load and be visible
-        popup_table = wait_and_find_element(
-            driver,
-            By.ID,
-            'tbPublicInspectionMain',
-            timeout=10
-        )
-        if not popup_table:
-            print("Popup table not found")
-            return {"error": "Popup table not found"}
-
-        # Additional wait to ensure content is loaded
-        time.sleep(3)
-        
-        # Get inspection date
-        try:
-            header_elem = wait_and_find_element(
-                driver,
-                By.ID,
-                'MainContent_wucPublicInspectionViolations_lblHeader',
-                timeout=5
-            )
-            inspection_date = header_elem.text.replace('Inspection Violations:', '').strip()
-            print(f"Inspection date: {inspection_date}")
-        except TimeoutException:
-            print("Timeout waiting for header element")
-            return {"error": "Header element not found"}
+        if retries:
+            return retries.call(driver.current_url, read_popup)
+        return read_popup()
+    except (NoSuchElementException, StaleElementReferenceException):
+        return None
+    except TimeoutException as e:
+        return {"error": e.msg}
+
+
+def scrape_current_page(driver, headers, rate_limiter=None, change_tracker=None, history=None, retries=None):
+    """
+    Scrape every row on the grid page the driver is showing.
+
+    Args:
+        driver: WebDriver instance
+        headers: Header names used as row keys
+        rate_limiter: Optional parallel_crawl.RateLimiter applied before each popup
+        change_tracker: Optional incremental.InspectionIndex; rows it reports
+            as unchanged are skipped without opening their popups
+        history: Optional sqlite_store.SqliteStore; past inspection popups are
+            opened only for inspections it is missing
+        retries: Optional resilience.Resilience the popups are opened under
+
+    Returns:
+        List of row dictionaries
+    """
+    def fetch(violations_link):
+        return fetch_violation_details(driver, violations_link, rate_limiter, retries)
+
+    rows = []
+    for row_data, row_info in page_parser.parse_grid_rows(driver.page_source, headers):
+        if change_tracker and not change_tracker.should_fetch(row_data, row_info):
+            continue
+        violations_link = row_info['violations_link']
+        row_data['violation_details'] = fetch(violations_link) if violations_link else None
+        row_data['past_inspections'] = incremental.past_inspection_records(row_info, fetch, history)
+        if change_tracker:
+            change_tracker.seen(row_data, row_info)
+        rows.append(row_data)
+    return rows
+
+
+def fill_search_form(driver, criteria):
+    """
+    Fill in search form fields by their form names before the search is submitted.
+
+    Args:
+        driver: WebDriver instance showing the search page
+        criteria: Form field names mapped to values; checkboxes are ticked
+    """
+    driver.execute_script(
+        """
+        var criteria = arguments[0];
+        Object.keys(criteria).forEach(function (name) {
+            var element = document.getElementsByName(name)[0];
+            if (!element) { return; }
+            if (element.type === 'checkbox') { element.checked = true; } else { element.value = criteria[name]; }
+        });
+        """,
+        criteria
+    )
+
+
+class SeleniumPageSession:
+    """
+    One independent crawl position over the results grid, backed by Chrome.
 
-        # Get facility information
+    Mirrors http_backend.HttpPageSession so parallel_crawl can drive either.
+    """
+
+    def __init__(self, url=http_backend.SEARCH_URL, rate_limiter=None, change_tracker=None, history=None,
+                 drivers=None, criteria=None, retries=None):
+        self.url = url
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.change_tracker = change_tracker
+        self.history = history
+        self.drivers = drivers
+        self.criteria = criteria
+        self.driver = None
+        self.headers = None
+        self.page_num = 1
+
+    @metrics.METRICS.timed('search')
+    def open(self):
+        """
+        Take a Chrome instance from the pool (or start one), run the search and land on page 1.
+
+        Leaves headers as None if the search matched nothing.
+        """
+        self.driver = self.drivers.acquire() if self.drivers else setup_driver()
+        if self.retries:
+            self.retries.call(self.url, self.driver.get, self.url)
+        else:
+            self.driver.get(self.url)
+        search_button = wait_and_find_element(self.driver, By.ID, 'MainContent_btnSearch')
+        if self.criteria:
+            fill_search_form(self.driver, self.criteria)
+        search_button.click()
+        self.page_num = 1
         try:
-            facility_info = wait_and_find_element(
-                driver,
-                By.ID,
-                'MainContent_wucPublicInspectionViolations_lblFacilityInformation',
-                timeout=5
-            )
-            facility_text = facility_info.text.strip()
-            print(f"Found facility info: {facility_text}")
+            waits.wait_for_grid(self.driver, timeout=20)
         except TimeoutException:
-            print("Timeout waiting for facility information")
-            facility_text = None
+            if page_parser.has_results(self.driver.page_source):
+                raise
+            self.headers = None
+            return
+        self.headers = page_parser.parse_headers(self.driver.page_source)
+
+    def total_pages(self):
+        """Return the number of result pages."""
+        return page_parser.parse_page_count(self.driver.page_source)
+
+    def form_state(self):
+        """The browser keeps the WebForms state, so there is nothing to checkpoint."""
+        return None
+
+    def resume(self, form_state, page_num):
+        """
+        Chrome cannot take over page state saved by an HTTP crawl.
+
+        Returns:
+            False, so the caller runs the search and seeks instead
+        """
+        return False
+
+    def _go_to_page(self, page_num):
+        if self.retries:
+            self.retries.call(self.url, self._post_page, page_num)
+        else:
+            self._post_page(page_num)
+
+    @metrics.METRICS.timed('page_load')
+    def _post_page(self, page_num):
+        if self.rate_limiter:
+            self.rate_limiter.wait(self.url)
+        current_first_row = wait_and_find_element(
+            self.driver,
+            By.CSS_SELECTOR,
+            '#MainContent_gvInspections tr:nth-child(2)'
+        )
+        self.driver.execute_script(
+            "__doPostBack(arguments[0], arguments[1]);",
+            http_backend.GRID_TARGET,
+            f'Page${page_num}'
+        )
+        waits.wait_for_grid_refresh(self.driver, current_first_row)
+        self.page_num = page_num
 
-        # Process violations
-        violations = []
-        index = 0
+    def seek(self, page_num):
+        """Move the grid to page_num, hopping through the pager window as needed."""
         while True:
-            try:
-                violation = {}
-                
-                # Get violation code
-                code_id = f'MainContent_wucPublicInspectionViolations_rptViolations_lblRegulatorCodeType_{index}'
-                code_elem = wait_and_find_element(driver, By.ID, code_id, timeout=2)
-                if not code_elem:
-                    break
-                
-                violation['code'] = code_elem.text.strip()
-                print(f"Found violation code {index}: {violation['code']}")
-
-                # Get code explanation
-                try:
-                    explain_id = f'MainContent_wucPublicInspectionViolations_rptViolations_lnkToggleCodeExplanation_{index}'
-                    explain_link = wait_and_find_element(driver, By.ID, explain_id, timeout=2)
-                    driver.execute_script("arguments[0].click();", explain_link)
-                    time.sleep(0.5)
-                    
-                    explanation_id = f'MainContent_wucPublicInspectionViolations_rptViolations_pnlCodeExplanation_{index}'
-                    explanation_div = wait_and_find_element(driver, By.ID, explanation_id, timeout=2)
-                    explanation_text = explanation_div.find_element(
-                        By.CSS_SELECTOR, 
-                        'div > div'
-                    ).text.strip()
-                    violation['code_explanation'] = explanation_text
-                    print(f"Found code explanation {index}")
-                except Exception as e:
-                    print(f"Error getting code explanation for violation {index}: {str(e)}")
-                    violation['code_explanation'] = None
-
-                # Get inspector comments
-                try:
-                    comments_id = f'MainContent_wucPublicInspectionViolations_rptViolations_pnlComments_{index}'
-                    comments_div = wait_and_find_element(driver, By.ID, comments_id, timeout=2)
-                    comments = comments_div.text.replace('Inspector Comments', '').strip()
-                    violation['inspector_comments'] = comments
-                    print(f"Found inspector comments {index}")
-                except Exception as e:
-                    print(f"Error getting inspector comments for violation {index}: {str(e)}")
-                    violation['inspector_comments'] = None
-
-                violations.append(violation)
-                index += 1
-
-            except (NoSuchElementException, TimeoutException):
-                print(f"No more violations found after index {index-1}")
-                break
-
-        # Create violation record
-        violation_record = {
-            'inspection_date': inspection_date,
-            'facility_information': facility_text,
-            'violations': violations
-        }
-        print(inspection_date, facility_text, violations)
+            hop = page_parser.next_hop(self.driver.page_source, page_num)
+            if hop is None:
+                return
+            self._go_to_page(hop)
+
+    def next_page(self):
+        """
+        Advance to the following page.
+
+        Returns:
+            True if the grid moved, False on the last page
+        """
+        next_page = page_parser.get_next_page_number(self.driver.page_source, self.page_num)
+        if next_page is None:
+            return False
+        if self.drivers and self.drivers.due_for_recycle(self.driver):
+            # Swap the worn-out browser for a fresh one and find our place again
+            log.info("Recycling Chrome before page %d", next_page)
+            self.close()
+            self.open()
+            self.seek(next_page)
+            return True
+        self._go_to_page(next_page)
+        return True
+
+    def scrape_page(self):
+        """Scrape every row on the current page."""
+        if self.drivers:
+            self.drivers.record_page(self.driver, driver_pool.page_bytes(self.driver))
+        return scrape_current_page(
+            self.driver, self.headers, self.rate_limiter, self.change_tracker, self.history, self.retries
+        )
 
-        # Close popup
-        try:
-            close_button = wait_and_find_element(driver, By.ID, 'cboxClose', timeout=5)
-            if close_button:
-                close_button.click()
-                print("Clicked close button")
-        except Exception as e:
-            print(f"Error with close button: {str(e)}")
+    def close(self):
+        """Hand Chrome back to the pool, or shut it down."""
+        if self.driver and self.drivers:
+            self.drivers.release(self.driver)
+        elif self.driver:
+            self.driver.quit()
+        self.driver = None
 
-        time.sleep(2)
-        return violation_record
 
-    except Exception as e:
-        print(f"Error in get_violation_details: {str(e)}")
-        return {"error": str(e)}
+def make_session_factory(backend, requests_per_second=0, change_tracker=None, history=None,
+                         url=http_backend.SEARCH_URL, drivers=None, cache=None, retries=None,
+                         navigator=None, archive=None):
+    """
+    Build a callable that creates crawl sessions for the chosen backend.
+
+    Args:
+        backend: 'selenium' or 'http'
+        requests_per_second: Request budget shared by all sessions per host
+        change_tracker: Optional incremental.InspectionIndex shared by all sessions
+        history: Optional sqlite_store.SqliteStore consulted before opening
+            past inspection popups
+        url: Search page URL, e.g. a local replay_server.py instance
+        drivers: Optional driver_pool.DriverPool the Selenium sessions draw from
+        cache: Optional response_cache.ResponseCache the HTTP sessions read through
+        retries: Optional resilience.Resilience shared by all sessions
+        navigator: Optional pager.PageNavigator the HTTP sessions seek with;
+            only shared by unfiltered sessions, as page states do not carry
+            over between searches
+        archive: Optional html_archive.HtmlArchive the HTTP sessions store raw pages in
+
+    Returns:
+        Callable returning a new, unopened session; it takes optional search
+        criteria for partitioned crawls
+    """
+    rate_limiter = parallel_crawl.RateLimiter(requests_per_second)
+    if backend == "selenium":
+        return lambda criteria=None: SeleniumPageSession(
+            url=url, rate_limiter=rate_limiter, change_tracker=change_tracker, history=history,
+            drivers=drivers, criteria=criteria, retries=retries
+        )
+    return lambda criteria=None: http_backend.HttpPageSession(
+        url=url, rate_limiter=rate_limiter, change_tracker=change_tracker, history=history,
+        criteria=criteria, cache=cache, resilience=retries,
+        navigator=navigator if criteria is None else None, archive=archive
+    )
 
 
-def scrape_food_safety_data():
-    """Main function to scrape and save food safety inspection data."""
-    driver = setup_driver()
-    results = []
-    page_num = 1
+def make_resilience(workers=1, slow_latency=5.0):
+    """
+    Build the retry, circuit breaker and adaptive concurrency layer shared by a crawl.
 
+    Args:
+        workers: Number of sessions or popup fetchers; with the page fetcher
+            this is the most requests the crawl may have in flight
+        slow_latency: Seconds per request above which concurrency is halved
+
+    Returns:
+        resilience.Resilience instance
+    """
+    most = max(1, workers) + 1
+    return resilience.Resilience(
+        limiter=resilience.AdaptiveLimiter(initial=most, maximum=most, slow_latency=slow_latency)
+    )
+
+
+def scrape_food_safety_data_sequential(writer, make_session, checkpoint=None, stop_after_unchanged_pages=None,
+                                       first_page=1, last_page=None):
+    """
+    Walk the result pages one after another with a single session.
+
+    Args:
+        writer: Output sink rows are written to
+        make_session: Callable returning a new, unopened crawl session
+        checkpoint: Optional checkpoint.CheckpointStore to resume from and update
+        stop_after_unchanged_pages: Stop after this many pages in a row
+            without a new or changed row (incremental mode only)
+        first_page: First page to crawl
+        last_page: Last page to crawl; defaults to the final result page
+    """
+    session = make_session()
     try:
-        # Navigate to search page
-        url = "https://foodsafety.kda.ks.gov/FoodSafety/Web/Inspection/PublicInspectionSearch.aspx"
-        driver.get(url)
-
-        # Initialize search
-        search_button = wait_and_find_element(
-            driver,
-            By.ID,
-            'MainContent_btnSearch'
+        start_page = checkpoint.first_unfinished_page(first_page) if checkpoint else first_page
+        resumed = (
+            checkpoint is not None
+            and checkpoint.form_state
+            and checkpoint.form_state_page == start_page - 1
+            and session.resume(checkpoint.form_state, start_page)
         )
-        search_button.click()
+        if resumed:
+            log.info("Resumed at page %d from saved page state", start_page)
+        else:
+            session.open()
+            if start_page > 1:
+                log.info("Seeking to first unfinished page %d", start_page)
+        log.info("Headers: %s", session.headers)
+        parallel_crawl.crawl_shard(
+            session, start_page, last_page, writer, checkpoint,
+            stop_after_empty_pages=stop_after_unchanged_pages
+        )
+        log.info("Reached last page (%d). Stopping pagination.", session.page_num)
+    finally:
+        session.close()
 
-        # Wait for results
-        wait_and_find_element(driver, By.ID, 'MainContent_gvInspections', timeout=20)
 
-        # Get table headers
-        headers = [
-            header.text.strip() 
-            for header in driver.find_elements(By.CSS_SELECTOR, '#MainContent_gvInspections tr th')
-        ][:6]
-        headers[4] = "Violations"
-        print("Modified Headers:", headers)
+def scrape_food_safety_data(backend="selenium", workers=1, requests_per_second=2.0,
+                            output="food_safety_data.ndjson", json_output="food_safety_data.json",
+                            fsync=False, checkpoint_path="food_safety_data.checkpoint", resume=False,
+                            index_path=None, stop_after_unchanged_pages=None, database=None,
+                            past_violations=True, url=http_backend.SEARCH_URL, headless=True,
+                            recycle_after=50, cache_dir=None, cache_ttl=3600, cache_size_mb=512,
+                            slow_latency=5.0, metrics_path=None, output_format="json", first_page=1,
+                            last_page=None, parse_workers=0, archive_dir=None):
+    """
+    Main function to scrape and save food safety inspection data.
 
-        # Process all pages
-        while True:
-            print(f"Scraping page {page_num}")
-            
-            # Wait for table
-            table = wait_and_find_element(
-                driver,
-                By.ID,
-                'MainContent_gvInspections',
-                timeout=15
+    Rows are streamed to an NDJSON file as they are scraped; the export in
+    the chosen output format is built from it in a separate step at the end.
+    Progress is checkpointed after every page.
+
+    Args:
+        backend: 'selenium' to drive Chrome, 'http' to replay postbacks directly,
+            'async' to replay them through the asyncio pipeline
+        workers: Number of parallel sessions; 1 keeps the sequential crawl.
+            With the async backend, the number of concurrent popup fetchers
+        requests_per_second: Per-host request budget
+        output: NDJSON file rows are streamed to
+        json_output: Export built from output at the end (a directory for
+            the parquet format); None skips it
+        fsync: Force every buffered flush of output to disk
+        checkpoint_path: Checkpoint file; None disables checkpointing
+        resume: Continue from the checkpoint instead of starting over
+        index_path: Incremental index file; when set, only new or changed
+            inspections are scraped and written
+        stop_after_unchanged_pages: In incremental mode, stop after this many
+            consecutive pages with no changes (useful while the grid is
+            sorted newest first)
+        database: SQLite file rows are also written to, normalized into
+            establishment, inspection and violation tables
+        past_violations: With a database, open the violation popups of past
+            inspections it does not have yet (the past inspections themselves
+            are always read from the grid)
+        url: Search page URL to crawl
+        headless: Run the Selenium backend's Chrome without a window
+        recycle_after: Pages each Chrome instance serves before it is replaced
+        cache_dir: Directory of an on-disk response cache for the HTTP backends
+        cache_ttl: Seconds a cached response stays valid
+        cache_size_mb: Size budget of the response cache
+        slow_latency: Seconds per request above which concurrency is reduced
+        metrics_path: File the run's metrics are written to at the end; JSON
+            if it ends in .json, Prometheus text format otherwise
+        output_format: Export format, one of OUTPUT_FORMATS (see export_output)
+        first_page: First result page to crawl
+        last_page: Last result page to crawl; defaults to the final one
+        parse_workers: With the async backend, processes that parse pages
+            and popups (see parse_pool.py); 0 parses on threads
+        archive_dir: Directory of a raw HTML archive the HTTP backends store
+            every page and popup in (see html_archive.py)
+    """
+    metrics.METRICS.reset()
+    store = checkpoint.CheckpointStore(checkpoint_path) if checkpoint_path else None
+    nothing_left = False
+    if store and resume and store.load():
+        nothing_left = store.is_finished(first_page, last_page)
+        if not nothing_left:
+            print(f"Resuming: {len(store.completed_pages)} pages and "
+                  f"{len(store.written_ids)} records already done")
+        store.truncate_output(output)
+    elif store:
+        store.reset()
+    writer = ndjson_sink.NdjsonWriter(output, fsync=fsync, append=bool(store and resume))
+    database_store = sqlite_store.SqliteStore(database) if database else None
+    if database_store is not None:
+        writer = parallel_crawl.TeeSink(writer, database_store)
+
+    index = incremental.InspectionIndex(index_path).load() if index_path else None
+    drivers = (
+        driver_pool.DriverPool(size=max(1, workers), headless=headless, recycle_after=recycle_after)
+        if backend == "selenium" else None
+    )
+    cache = (
+        response_cache.ResponseCache(cache_dir, ttl=cache_ttl, max_bytes=cache_size_mb << 20)
+        if cache_dir and backend != "selenium" else None
+    )
+    archive = html_archive.HtmlArchive(archive_dir) if archive_dir and backend != "selenium" else None
+    if archive_dir and archive is None:
+        log.warning("The selenium backend does not archive raw HTML; %s is left alone", archive_dir)
+    retries = make_resilience(workers, slow_latency)
+    navigator = pager.PageNavigator() if backend != "selenium" else None
+    if navigator and store and store.form_state:
+        navigator.remember(store.form_state_page, store.form_state)
+    make_session = make_session_factory(
+        backend, requests_per_second, index, database_store if past_violations else None, url, drivers,
+        cache, retries, navigator, archive
+    )
+    completed = False
+    try:
+        if nothing_left:
+            print("The checkpointed crawl already finished; nothing to resume "
+                  "(start a fresh run without --resume to crawl again)")
+        elif backend == "async":
+            async_pipeline.run_pipeline(
+                writer,
+                url=url,
+                detail_workers=max(1, workers),
+                requests_per_second=requests_per_second,
+                checkpoint=store,
+                change_tracker=index,
+                history=database_store if past_violations else None,
+                cache=cache,
+                resilience=retries,
+                navigator=navigator,
+                first_page=first_page,
+                last_page=last_page,
+                parse_workers=parse_workers,
+                archive=archive
             )
-            time.sleep(2)
-
-            # Process rows
-            try:
-                rows = table.find_elements(By.CSS_SELECTOR, 'tr')[1:-2]
-                for row in rows:
-                    try:
-                        columns = row.find_elements(By.TAG_NAME, 'td')
-                        if columns:
-                            row_data = {}
-                            for i, col in enumerate(columns[:6]):
-                                if i < len(headers):
-                                    row_data[headers[i]] = col.text.replace("\n", " ").strip()
-                                    
-                                    if i == 4:  # Violations column
-                                        try:
-                                            violation_link = col.find_element(By.TAG_NAME, 'a')
-                                            violation_details = get_violation_details(driver, violation_link)
-                                            row_data['violation_details'] = violation_details
-                                        except NoSuchElementException:
-                                            row_data['violation_details'] = None
-                            
-                            if any(row_data.values()):
-                                results.append(row_data)
-                                print(f"Added row: {row_data}")
-                    except StaleElementReferenceException:
-                        continue
-            except StaleElementReferenceException:
-                print("Table became stale, retrying...")
-                continue
-
-            # Handle pagination
-            try:
-                next_link, has_next = get_next_page_link(driver, page_num)
-                
-                if not has_next:
-                    print(f"Reached last page ({page_num}). Stopping pagination.")
-                    break
-                
-                current_first_row = wait_and_find_element(
-                    driver,
-                    By.CSS_SELECTOR,
-                    '#MainContent_gvInspections tr:nth-child(2)'
-                )
-                driver.execute_script("arguments[0].click();", next_link)
-                
-                WebDriverWait(driver, 15).until(EC.staleness_of(current_first_row))
-                page_num += 1
-                
-            except (NoSuchElementException, TimeoutException, StaleElementReferenceException) as e:
-                print(f"Navigation error or last page reached: {str(e)}")
-                break
+        elif workers > 1:
+            parallel_crawl.crawl_parallel(
+                make_session, workers=workers, sink=writer, first_page=first_page, last_page=last_page,
+                checkpoint=store
+            )
+        else:
+            scrape_food_safety_data_sequential(
+                writer, make_session, store,
+                stop_after_unchanged_pages if index else None,
+                first_page, last_page
+            )
+        completed = True
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+    finally:
+        writer.close()
+        print(f"\nScraped {writer.count} records. Data streamed to {output}")
+        if completed and store:
+            if not nothing_left:
+                store.mark_finished(first_page, last_page)
+            print(f"Crawl finished; checkpoint kept at {checkpoint_path} until the next fresh run")
+        elif store:
+            print(f"Crawl interrupted; rerun with --resume to continue from {checkpoint_path}")
+        if index:
+            index.print_summary()
+            if completed:
+                index.save()
+        if json_output:
+            export_output(output, json_output, output_format)
+        if drivers:
+            drivers.close()
+            drivers.print_summary()
+        if cache:
+            cache.print_summary()
+            cache.close()
+        if archive:
+            archive.print_summary()
+            archive.close()
+        retries.print_summary()
+        if navigator:
+            navigator.print_summary()
+        if backend == "selenium":
+            waits.WAIT_STATS.print_summary()
+        metrics.METRICS.print_summary()
+        if metrics_path:
+            metrics.METRICS.dump(metrics_path)
+
+
+def export_output(ndjson_path, export_path, output_format="json"):
+    """
+    Build the final export from the streamed NDJSON file.
+
+    Args:
+        ndjson_path: NDJSON file the crawl streamed its records to
+        export_path: File, or directory for parquet, to write
+        output_format: 'json' for the indented JSON array of the records,
+            'inspections' for that array in newmain.py's layout, 'parquet'
+            for the columnar tables of export_parquet.py; 'ndjson' keeps
+            only the streamed file
+    """
+    if output_format == "json":
+        ndjson_sink.compact(ndjson_path, export_path)
+    elif output_format == "inspections":
+        ndjson_sink.compact(ndjson_path, export_path, ensure_ascii=False, transform=schema.to_inspection_record)
+    elif output_format == "parquet":
+        with export_parquet.ColumnarExporter(export_path) as exporter:
+            exporter.add_file(ndjson_path)
+
+
+def scrape_partitions(partition_specs, backend="http", workers=1, requests_per_second=2.0,
+                      partition_dir="partitions", resume=False, stale_after=None, fsync=False,
+                      index_path=None, stop_after_unchanged_pages=None, database=None,
+                      past_violations=True, url=http_backend.SEARCH_URL, headless=True,
+                      recycle_after=50, cache_dir=None, cache_ttl=3600, cache_size_mb=512,
+                      slow_latency=5.0, metrics_path=None, archive_dir=None):
+    """
+    Crawl the search as filtered partitions (per city, ZIP, county or radius).
+
+    Each partition is written to its own NDJSON file and checkpoint in
+    partition_dir, so partitions can be crawled in parallel and re-crawled
+    individually. See partitions.py for the spec syntax.
 
+    Args:
+        partition_specs: Partition specs, e.g. ['county:all'] or ['city:Wichita,Topeka']
+        backend: 'selenium' or 'http'; 'async' crawls partitions over plain HTTP sessions
+        workers: Number of partitions crawled at once
+        requests_per_second: Per-host request budget shared by all partitions
+        partition_dir: Directory holding the partition outputs, checkpoints and state
+        resume: Skip finished partitions and continue the others from their checkpoints
+        stale_after: Only crawl partitions last finished more than this many hours ago
+        fsync: Force every buffered flush of the outputs to disk
+        index_path: Incremental index file shared by all partitions
+        stop_after_unchanged_pages: In incremental mode, stop a partition after
+            this many consecutive pages with no changes
+        database: SQLite file all partitions also write to
+        past_violations: With a database, open the violation popups of past
+            inspections it does not have yet
+        url: Search page URL to crawl
+        headless: Run the Selenium backend's Chrome without a window
+        recycle_after: Pages each Chrome instance serves before it is replaced
+        cache_dir: Directory of an on-disk response cache for HTTP sessions
+        cache_ttl: Seconds a cached response stays valid
+        cache_size_mb: Size budget of the response cache
+        slow_latency: Seconds per request above which concurrency is reduced
+        metrics_path: File the run's metrics are written to at the end; JSON
+            if it ends in .json, Prometheus text format otherwise
+        archive_dir: Directory of a raw HTML archive the HTTP sessions store
+            every page and popup in, keyed by partition search
+    """
+    metrics.METRICS.reset()
+    work = partitions.build_partitions(partition_specs, url)
+    database_store = sqlite_store.SqliteStore(database) if database else None
+    index = incremental.InspectionIndex(index_path).load() if index_path else None
+    drivers = (
+        driver_pool.DriverPool(size=max(1, workers), headless=headless, recycle_after=recycle_after)
+        if backend == "selenium" else None
+    )
+    cache = (
+        response_cache.ResponseCache(cache_dir, ttl=cache_ttl, max_bytes=cache_size_mb << 20)
+        if cache_dir and backend != "selenium" else None
+    )
+    archive = html_archive.HtmlArchive(archive_dir) if archive_dir and backend != "selenium" else None
+    if archive_dir and archive is None:
+        log.warning("The selenium backend does not archive raw HTML; %s is left alone", archive_dir)
+    retries = make_resilience(workers, slow_latency)
+    make_session = make_session_factory(
+        "selenium" if backend == "selenium" else "http", requests_per_second, index,
+        database_store if past_violations else None, url, drivers, cache, retries, archive=archive
+    )
+    results = {}
+    try:
+        results = partitions.crawl_partitions(
+            work, make_session, partition_dir, workers, resume,
+            stale_after * 3600 if stale_after is not None else None,
+            database_store, fsync, stop_after_unchanged_pages if index else None
+        )
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
-    
+        log.error("An error occurred: %s", e)
     finally:
-        # Save data and cleanup
-        with open("food_safety_data.json", "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=4)
-        print(f"\nScraped {len(results)} records. Data saved to food_safety_data.json")
-        driver.quit()
+        rows = sum(rows for _, rows in results.values())
+        print(f"\nScraped {rows} records from {len(results)} partitions into {partition_dir}")
+        if database_store is not None:
+            database_store.close()
+        if index:
+            index.print_summary()
+            if len(results) == len(work):
+                index.save()
+        if drivers:
+            drivers.close()
+            drivers.print_summary()
+        if cache:
+            cache.print_summary()
+            cache.close()
+        if archive:
+            archive.print_summary()
+            archive.close()
+        retries.print_summary()
+        if backend == "selenium":
+            waits.WAIT_STATS.print_summary()
+        metrics.METRICS.print_summary()
+        if metrics_path:
+            metrics.METRICS.dump(metrics_path)
 
 
 if __name__ == "__main__":
-    scrape_food_safety_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape Kansas food safety inspection data.")
+    parser.add_argument(
+        '--backend',
+        choices=['selenium', 'http', 'async'],
+        default='selenium',
+        help="Fetch backend: drive Chrome (selenium), replay WebForms postbacks (http), "
+             "or replay them through the asyncio fetch/parse/write pipeline (async)"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of parallel sessions, each crawling a disjoint page range "
+             "(async backend: number of concurrent popup fetchers)"
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=0,
+        help="Async backend: parse pages and popups in this many worker processes "
+             "instead of threads (see parse_pool.py)"
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=2.0,
+        help="Maximum requests per second per host across all sessions (0 disables)"
+    )
+    parser.add_argument(
+        '--output',
+        help="NDJSON file rows are streamed to while crawling (default food_safety_data.ndjson)"
+    )
+    parser.add_argument(
+        '--format',
+        choices=OUTPUT_FORMATS,
+        help="Export built from --output at the end: indented JSON array (json, the default), "
+             "none (ndjson), JSON array in newmain.py's ownerName/tradeName layout (inspections), "
+             "or Parquet tables partitioned by year (parquet)"
+    )
+    parser.add_argument(
+        '--json-output',
+        '--export',
+        dest='json_output',
+        help="File, or directory for --format parquet, the export is written to ('' to skip; "
+             "default food_safety_data.json, inspection_data.json or analytics by format)"
+    )
+    parser.add_argument(
+        '--pages',
+        type=pager.page_range,
+        metavar='FIRST-LAST',
+        help="Result pages to crawl, e.g. 1-20 or 40- (default: all)"
+    )
+    parser.add_argument(
+        '--fsync',
+        action='store_true',
+        help="Force each buffered flush of --output to disk"
+    )
+    parser.add_argument(
+        '--checkpoint',
+        help="Checkpoint file recording crawl progress ('' to disable; "
+             "default food_safety_data.checkpoint)"
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Skip pages finished by an interrupted run and append to --output"
+    )
+    parser.add_argument(
+        '--incremental',
+        metavar='INDEX',
+        nargs='?',
+        const="inspection_index.json",
+        help="Only scrape inspections that are new or changed since the last run, "
+             "tracked in INDEX (default inspection_index.json)"
+    )
+    parser.add_argument(
+        '--stop-after-unchanged-pages',
+        type=int,
+        help="With --incremental, stop after this many pages in a row without changes"
+    )
+    parser.add_argument(
+        '--sqlite',
+        metavar='DATABASE',
+        help="Also write rows to this SQLite database (see sqlite_store.py for queries)"
+    )
+    parser.add_argument(
+        '--no-past-violations',
+        action='store_true',
+        help="Do not open violation popups of past inspections missing from --sqlite"
+    )
+    parser.add_argument(
+        '--url',
+        default=http_backend.SEARCH_URL,
+        help="Search page to crawl, e.g. a local replay_server.py instance"
+    )
+    parser.add_argument(
+        '--headed',
+        action='store_true',
+        help="Show the Chrome window (Selenium backend)"
+    )
+    parser.add_argument(
+        '--recycle-after',
+        type=int,
+        default=50,
+        help="Pages each Chrome instance serves before it is replaced (0 never replaces)"
+    )
+    parser.add_argument(
+        '--partition',
+        action='append',
+        metavar='SPEC',
+        help="Crawl filtered searches instead of the whole state, e.g. county:all, "
+             "city:Wichita,Topeka or zip:66212 (repeatable; see partitions.py). "
+             "Each partition gets its own output in --partition-dir"
+    )
+    parser.add_argument(
+        '--partition-dir',
+        default="partitions",
+        help="Directory for partition outputs, checkpoints and crawl times"
+    )
+    parser.add_argument(
+        '--stale-after',
+        type=float,
+        metavar='HOURS',
+        help="With --partition, skip partitions crawled less than HOURS ago"
+    )
+    parser.add_argument(
+        '--cache',
+        metavar='DIR',
+        help="Serve repeated requests from an on-disk response cache in DIR (HTTP backends)"
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=3600,
+        help="Seconds a cached response stays valid"
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=512,
+        metavar='MB',
+        help="Size budget of the response cache; least recently used responses are evicted"
+    )
+    parser.add_argument(
+        '--archive',
+        metavar='DIR',
+        help="Keep every fetched page and popup in a compressed raw HTML archive in DIR "
+             "(HTTP backends), to rebuild the data later with html_archive.py --reparse"
+    )
+    parser.add_argument(
+        '--slow-latency',
+        type=float,
+        default=5.0,
+        metavar='SECONDS',
+        help="Request latency above which the crawl halves its concurrency; failures are "
+             "retried with backoff and a failing site pauses the crawl"
+    )
+    parser.add_argument(
+        '--metrics',
+        metavar='FILE',
+        help="Write per-stage timings and counters to FILE at the end of the run: "
+             "JSON if it ends in .json, Prometheus textfile format otherwise"
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=metrics.LOG_LEVELS,
+        default='info',
+        help="Least severe log messages to show; debug adds per-popup progress"
+    )
+    args = parser.parse_args()
+    metrics.configure_logging(args.log_level)
+    if args.partition and (args.pages or args.format or args.json_output is not None
+                           or args.output is not None or args.checkpoint is not None):
+        # Partitions are crawled whole into their own NDJSON and checkpoint files in --partition-dir
+        parser.error("--pages, --format, --export, --output and --checkpoint "
+                     "cannot be combined with --partition")
+    output = args.output or "food_safety_data.ndjson"
+    checkpoint_path = "food_safety_data.checkpoint" if args.checkpoint is None else args.checkpoint
+    output_format = args.format or 'json'
+    json_output = DEFAULT_EXPORTS[output_format] if args.json_output is None else args.json_output
+    first_page, last_page = args.pages or (1, None)
+    if args.partition:
+        scrape_partitions(
+            args.partition,
+            backend=args.backend,
+            workers=args.workers,
+            requests_per_second=args.rate,
+            partition_dir=args.partition_dir,
+            resume=args.resume,
+            stale_after=args.stale_after,
+            fsync=args.fsync,
+            index_path=args.incremental,
+            stop_after_unchanged_pages=args.stop_after_unchanged_pages,
+            database=args.sqlite,
+            past_violations=not args.no_past_violations,
+            url=args.url,
+            headless=not args.headed,
+            recycle_after=args.recycle_after,
+            cache_dir=args.cache,
+            cache_ttl=args.cache_ttl,
+            cache_size_mb=args.cache_size,
+            slow_latency=args.slow_latency,
+            metrics_path=args.metrics,
+            archive_dir=args.archive
+        )
+    else:
+        scrape_food_safety_data(
+            backend=args.backend,
+            workers=args.workers,
+            requests_per_second=args.rate,
+            output=output,
+            json_output=json_output or None,
+            fsync=args.fsync,
+            checkpoint_path=checkpoint_path or None,
+            resume=args.resume,
+            index_path=args.incremental,
+            stop_after_unchanged_pages=args.stop_after_unchanged_pages,
+            database=args.sqlite,
+            past_violations=not args.no_past_violations,
+            url=args.url,
+            headless=not args.headed,
+            recycle_after=args.recycle_after,
+            cache_dir=args.cache,
+            cache_ttl=args.cache_ttl,
+            cache_size_mb=args.cache_size,
+            slow_latency=args.slow_latency,
+            metrics_path=args.metrics,
+            output_format=output_format,
+            first_page=first_page,
+            last_page=last_page,
+            parse_workers=args.parse_workers,
+            archive_dir=args.archive
+        )
@@ -0,0 +1,256 @@
+"""
+Crawl Metrics
+Structured timing and counters for the crawl stages. Per-popup and per-page
+progress goes to a leveled logger instead of the console. A summary table
+and a metrics file written at the end of the run show which stage dominates
+wall time.
+
+    timer(stage)         times a block into the stage_seconds histogram
+    timed(stage)         the same as a function decorator
+    increment(name)      bumps a counter such as rows, violations or retries
+    observe(name, v)     adds a value to any histogram
+
+Every module records into the shared METRICS registry. The metrics file is
+JSON when its name ends in .json. Otherwise it is written in the Prometheus
+text format, atomically, so node_exporter's textfile collector can pick it
+up.
+
+Usage:
+    python main.py --backend http --log-level debug --metrics metrics.prom
+    python main.py --backend async --metrics metrics.json
+"""
+
+import bisect
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+NAMESPACE = 'food_safety'
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DESCRIPTIONS = {
+    'stage_seconds': "Time spent per crawl stage (summed over threads)",
+    'wait_seconds': "Time spent in browser condition waits",
+    'rows_total': "Rows written",
+    'violations_total': "Violations in written rows, current and past inspections",
+    'popup_errors_total': "Violation popups recorded as errors",
+    'retries_total': "Network calls retried, by error class",
+    'failures_total': "Network calls given up on, by error class",
+    'timeouts_total': "Timeouts, by source",
+    'cache_requests_total': "Response cache lookups, by result",
+    'run_seconds': "Wall time of the run",
+}
+
+
+def configure_logging(level='info'):
+    """Send log records of the given level and above to stderr."""
+    logging.basicConfig(level=getattr(logging, level.upper()), format=LOG_FORMAT)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """Bucketed distribution of observed values."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """Return (upper bound, count of values at or below it) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and restart the wall clock."""
+        with self._lock:
+            self.started = time.time()
+            self._started = time.perf_counter()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def increment(self, name, amount=1, **labels):
+        """Add amount to a counter; names end in _total by convention."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to value."""
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """Add one value to a histogram."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time the enclosed block into stage_seconds{stage=...}, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage):
+        """Decorator form of timer()."""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record_rows(self, rows):
+        """Count written rows and the violations in their current and past inspection popups."""
+        violations = 0
+        for row in rows:
+            popups = [row.get('violation_details')]
+            popups += [past.get('violation_details') for past in row.get('past_inspections') or []]
+            for details in popups:
+                if isinstance(details, dict) and isinstance(details.get('violations'), list):
+                    violations += len(details['violations'])
+        self.increment('rows_total', len(rows))
+        self.increment('violations_total', violations)
+
+    def wall_seconds(self):
+        return time.perf_counter() - self._started
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            families = {}
+            for (name, key), value in sorted(self.counters.items()):
+                families.setdefault((name, 'counter'), []).append(f"{NAMESPACE}_{name}{_format_labels(key)} {value}")
+            for (name, key), value in sorted(self.gauges.items()):
+                families.setdefault((name, 'gauge'), []).append(f"{NAMESPACE}_{name}{_format_labels(key)} {value}")
+            for (name, key), histogram in sorted(self.histograms.items()):
+                lines = families.setdefault((name, 'histogram'), [])
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{NAMESPACE}_{name}_bucket{_format_labels(key, [('le', le)])} {count}")
+                lines.append(f"{NAMESPACE}_{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{NAMESPACE}_{name}_count{_format_labels(key)} {histogram.count}")
+        out = []
+        for (name, kind), lines in sorted(families.items()):
+            if name in DESCRIPTIONS:
+                out.append(f"# HELP {NAMESPACE}_{name} {DESCRIPTIONS[name]}")
+            out.append(f"# TYPE {NAMESPACE}_{name} {kind}")
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+    def to_dict(self):
+        """Return every metric as JSON-serialisable data."""
+        with self._lock:
+            return {
+                'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'wall_seconds': round(self.wall_seconds(), 3),
+                'counters': [
+                    {'name': name, 'labels': dict(key), 'value': value}
+                    for (name, key), value in sorted(self.counters.items())
+                ],
+                'gauges': [
+                    {'name': name, 'labels': dict(key), 'value': value}
+                    for (name, key), value in sorted(self.gauges.items())
+                ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(key),
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'max': round(histogram.max, 6),
+                        'buckets': {
+                            '+Inf' if bound == float('inf') else str(bound): count
+                            for bound, count in histogram.cumulative()
+                        }
+                    }
+                    for (name, key), histogram in sorted(self.histograms.items())
+                ]
+            }
+
+    def dump(self, path):
+        """
+        Write all metrics to path.
+
+        Args:
+            path: Destination file; JSON if it ends in .json, Prometheus text otherwise
+        """
+        self.set_gauge('run_seconds', round(self.wall_seconds(), 3))
+        if path.endswith('.json'):
+            body = json.dumps(self.to_dict(), indent=2)
+        else:
+            body = self.to_prometheus()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        print(f"Metrics written to {path}")
+
+    def print_summary(self):
+        """Print busy time per stage, largest first, and every counter."""
+        wall = self.wall_seconds()
+        with self._lock:
+            stages = sorted(
+                ((dict(key).get('stage'), histogram) for (name, key), histogram in self.histograms.items()
+                 if name == 'stage_seconds'),
+                key=lambda item: item[1].sum, reverse=True
+            )
+            counters = sorted(self.counters.items())
+        print(f"Stage timings ({wall:.1f}s wall; stages nest and overlap across threads):")
+        for stage, histogram in stages:
+            average = histogram.sum / histogram.count * 1000 if histogram.count else 0.0
+            share = histogram.sum / wall * 100 if wall else 0.0
+            print(f"  {stage}: {histogram.count} calls, {histogram.sum:.2f}s busy ({share:.0f}% of wall), "
+                  f"{average:.0f} ms avg, {histogram.max * 1000:.0f} ms max")
+        if counters:
+            print("Counters: " + ", ".join(
+                f"{name}{_format_labels(key)} {value}" for (name, key), value in counters
+            ))
+
+
+METRICS = Metrics()
@@ -0,0 +1,197 @@
+"""
+NDJSON Output Sink
+Streams scraped records to disk one JSON object per line, so memory use does
+not grow with the size of the crawl, and compacts the result into the usual
+indented JSON array afterwards. iter_file() streams records back out of
+either form for the tools that post-process crawl output.
+
+Usage:
+    python ndjson_sink.py food_safety_data.ndjson food_safety_data.json
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+
+JSON_CHUNK_SIZE = 1 << 20
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+log = logging.getLogger(__name__)
+
+
+class NdjsonWriter:
+    """
+    Buffered, thread-safe NDJSON writer.
+
+    Records go through a write buffer and are flushed every flush_every
+    records; with fsync=True each flush is also forced to stable storage.
+    The writer doubles as a parallel_crawl result sink via add().
+    """
+
+    def __init__(self, path, flush_every=100, fsync=False, append=False, buffer_size=1 << 16):
+        self.path = path
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.count = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8', buffering=buffer_size)
+
+    def write(self, record):
+        """Append one record as a single line."""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self.count += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+
+    def add(self, rows):
+        """Append a batch of records."""
+        for row in rows:
+            self.write(row)
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def flush(self):
+        """Push buffered records to the file (and to disk if fsync is enabled)."""
+        with self._lock:
+            self._flush()
+
+    def tell(self):
+        """Flush buffered records and return the size of the file written so far."""
+        with self._lock:
+            self._flush()
+            return self._file.tell()
+
+    def close(self):
+        """Flush and close the file."""
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_records(path):
+    """
+    Stream records back out of an NDJSON file.
+
+    A truncated last line, as left behind by a crash mid-write, is skipped.
+
+    Args:
+        path: NDJSON file path
+
+    Yields:
+        Decoded records
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                log.warning("Skipping unreadable line in %s", path)
+
+
+def iter_json_array(path, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Stream the records of a JSON array file without loading the whole array.
+
+    Args:
+        path: File holding a JSON array of objects, e.g. food_safety_data.json
+
+    Yields:
+        Decoded records
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not hold a JSON array")
+        pos = 1
+        while True:
+            pos = SEPARATOR_RE.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The record runs past the buffer; keep its start and read on
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield record
+
+
+def iter_file(path):
+    """Yield the records of an NDJSON file or JSON array file."""
+    with open(path, encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+    if first == '[':
+        return iter_json_array(path)
+    return iter_records(path)
+
+
+def compact(ndjson_path, json_path, indent=4, ensure_ascii=True, transform=None):
+    """
+    Build the indented JSON array from an NDJSON file, one record at a time.
+
+    The output is byte-for-byte what json.dump(records, f, indent=indent)
+    would produce, without holding all records in memory.
+
+    Args:
+        ndjson_path: Source NDJSON file
+        json_path: Destination JSON file
+        indent: Indentation used for the array
+        ensure_ascii: Escape non-ASCII characters, as json.dump does by default
+        transform: Optional function applied to each record before it is written
+
+    Returns:
+        Number of records written
+    """
+    prefix = ' ' * indent
+    count = 0
+    tmp_path = json_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('[')
+        for record in iter_records(ndjson_path):
+            if transform:
+                record = transform(record)
+            body = json.dumps(record, indent=indent, ensure_ascii=ensure_ascii).replace('\n', '\n' + prefix)
+            out.write((',\n' if count else '\n') + prefix + body)
+            count += 1
+        out.write('\n]' if count else ']')
+    os.replace(tmp_path, json_path)
+    print(f"Compacted {count} records from {ndjson_path} into {json_path}")
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    compact(sys.argv[1], sys.argv[2])
@@ -0,0 +1,316 @@
+"""
+Establishment Normalization
+Parses the scraped name and address text into fields and groups records
+that describe the same establishment.
+
+Both scrapers leave the address as free text, with the phone number on
+its second line (newmain.py's mapAddress, main.py's map_address). The
+same establishment also shows up under slightly different spellings
+across pages and past inspections ("CASEY'S GENERAL STORE #2" and "CASEYS
+GENERAL STORE 2"). Each record is parsed into street, city, state, ZIP
+and phone, and keyed by a normalized name, street and phone.
+
+Duplicates are found through a blocking index rather than by comparing
+every pair. Records only meet the records that share one of these blocks:
+
+    name + ZIP      identical normalized names in one ZIP: merged outright
+    phone           same phone number
+    street + ZIP    same normalized street address
+
+Within a block, two records are merged when their names are close enough
+and their store numbers do not disagree. Identical spellings are resolved
+once, so the work grows with the number of distinct variants, not rows.
+
+Usage:
+    python normalize.py food_safety_data.ndjson inspection_data.json --out establishments.ndjson
+    python normalize.py food_safety_data.ndjson --assignments records.ndjson
+"""
+
+import argparse
+import difflib
+import functools
+import hashlib
+import json
+import re
+import time
+
+from ndjson_sink import iter_file
+from sqlite_store import grid_establishment, split_address
+
+TOKEN_RE = re.compile(r'[A-Z0-9]+')
+# Words that do not tell establishments apart
+NAME_NOISE = {'THE', 'LLC', 'L', 'C', 'INC', 'CO', 'CORP', 'CORPORATION', 'COMPANY', 'LTD', 'DBA', 'OF'}
+STREET_WORDS = {
+    'STREET': 'ST', 'AVENUE': 'AVE', 'AV': 'AVE', 'ROAD': 'RD', 'DRIVE': 'DR', 'BOULEVARD': 'BLVD',
+    'LANE': 'LN', 'HIGHWAY': 'HWY', 'PARKWAY': 'PKWY', 'COURT': 'CT', 'PLACE': 'PL', 'CIRCLE': 'CIR',
+    'TERRACE': 'TER', 'TRAIL': 'TRL', 'PLAZA': 'PLZ', 'SQUARE': 'SQ', 'EXPRESSWAY': 'EXPY',
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W', 'SUITE': 'STE', 'BUILDING': 'BLDG',
+    'FIRST': '1ST', 'SECOND': '2ND', 'THIRD': '3RD', 'FOURTH': '4TH', 'FIFTH': '5TH',
+}
+NAME_OVERLAP = 0.5          # Shared name words / words of the shorter name
+NAME_SIMILARITY = 0.85      # difflib ratio for names that share too few words
+MAX_CANDIDATES = 200        # Variants compared per block, so huge blocks stay cheap
+
+
+def name_tokens(name):
+    """Split a trade name into uppercase words without punctuation or noise words."""
+    text = (name or '').upper().replace('&', ' AND ').replace("'", '')
+    return [token for token in TOKEN_RE.findall(text) if token not in NAME_NOISE]
+
+
+def normalize_street(street):
+    """Uppercase a street address and spell its common words the USPS way."""
+    return " ".join(STREET_WORDS.get(token, token) for token in TOKEN_RE.findall((street or '').upper()))
+
+
+def normalize_phone(phone):
+    """Return the ten digits of a phone number, or None."""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits if len(digits) == 10 else None
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def parse_establishment(trade_name, map_address):
+    """
+    Parse a trade name and address text into fields.
+
+    Cached: the same texts come back on every page and past inspection of an
+    establishment. The returned dictionary is shared and must not be changed.
+
+    Returns:
+        Dictionary with 'trade_name', 'street', 'city', 'state', 'zip',
+        'phone' and the normalized 'name_key', 'street_key' and 'phone_key'
+    """
+    fields = {'trade_name': " ".join(trade_name.split())}
+    fields.update(split_address(map_address))
+    if fields['zip']:
+        fields['zip'] = fields['zip'][:5]
+    fields['name_key'] = " ".join(name_tokens(trade_name))
+    fields['street_key'] = normalize_street(fields['street'])
+    fields['phone_key'] = normalize_phone(fields['phone'])
+    return fields
+
+
+def establishment_fields(record):
+    """
+    Parse the establishment of a scraped record into fields.
+
+    Args:
+        record: main.py grid row or newmain.py establishment record
+
+    Returns:
+        Dictionary from parse_establishment()
+    """
+    if 'tradeName' in record:
+        trade_name, map_address = record.get('tradeName') or '', record.get('mapAddress') or ''
+    else:
+        trade_name, map_address = grid_establishment(record)
+    return parse_establishment(trade_name, map_address)
+
+
+def store_numbers(name_key):
+    """Return the numbers in a normalized name, e.g. {'1234'} for "SUBWAY 1234"."""
+    return frozenset(word for word in name_key.split() if word.isdigit())
+
+
+def names_match(a, b):
+    """
+    Decide whether two normalized names can belong to one establishment.
+
+    Names whose store numbers differ never match ("SUBWAY 1234" and
+    "SUBWAY 5678"); otherwise enough shared words or a close spelling do.
+    """
+    if a == b:
+        return True
+    numbers_a, numbers_b = store_numbers(a), store_numbers(b)
+    if numbers_a and numbers_b and numbers_a != numbers_b:
+        return False
+    words_a = set(a.split()) - numbers_a
+    words_b = set(b.split()) - numbers_b
+    if words_a and words_b and len(words_a & words_b) / min(len(words_a), len(words_b)) >= NAME_OVERLAP:
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= NAME_SIMILARITY
+
+
+class EstablishmentIndex:
+    """
+    Blocking index that groups records into establishments as they are added.
+
+    Each distinct (name, street, ZIP, phone) spelling is a variant; variants
+    are joined into establishments with union-find. An establishment keeps
+    the store numbers of its names, so a name without one cannot chain
+    "#1" and "#2" of a chain into one establishment.
+    """
+
+    def __init__(self):
+        self.variants = []          # Variant number -> fields of its first record
+        self.variant_rows = []      # Variant number -> records seen with that spelling
+        self._variant_ids = {}      # Signature -> variant number
+        self._parents = []          # Union-find parent of each variant
+        self._numbers = []          # Union-find root -> store numbers of its names
+        self._blocks = {}           # Block key -> variant numbers
+        self.comparisons = 0
+        self._ids = {}
+        self._ids_for = None        # Variant count the cached establishment IDs belong to
+
+    def _find(self, variant):
+        root = variant
+        while self._parents[root] != root:
+            root = self._parents[root]
+        while self._parents[variant] != root:
+            self._parents[variant], variant = root, self._parents[variant]
+        return root
+
+    def _union(self, a, b):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return
+        numbers_a, numbers_b = self._numbers[root_a], self._numbers[root_b]
+        if numbers_a and numbers_b and numbers_a != numbers_b:
+            return
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        self._parents[child] = root
+        self._numbers[root] = numbers_a or numbers_b
+
+    def _block_keys(self, fields):
+        keys = []
+        if fields['name_key']:
+            keys.append(('name', fields['zip'], fields['name_key']))
+        if fields['phone_key']:
+            keys.append(('phone', fields['phone_key']))
+        if fields['street_key'] and fields['zip']:
+            keys.append(('street', fields['zip'], fields['street_key']))
+        return keys
+
+    def add(self, fields):
+        """
+        Add one parsed record.
+
+        Args:
+            fields: Dictionary from establishment_fields()
+
+        Returns:
+            Variant number of the record
+        """
+        signature = (fields['name_key'], fields['street_key'], fields['zip'], fields['phone_key'])
+        variant = self._variant_ids.get(signature)
+        if variant is not None:
+            self.variant_rows[variant] += 1
+            return variant
+
+        variant = len(self.variants)
+        self._variant_ids[signature] = variant
+        self.variants.append(fields)
+        self.variant_rows.append(1)
+        self._parents.append(variant)
+        self._numbers.append(store_numbers(fields['name_key']))
+        for key in self._block_keys(fields):
+            members = self._blocks.setdefault(key, [])
+            if key[0] == 'name' and members:
+                self._union(variant, members[0])
+            else:
+                for other in members[-MAX_CANDIDATES:]:
+                    if self._find(other) == self._find(variant):
+                        continue
+                    self.comparisons += 1
+                    if names_match(fields['name_key'], self.variants[other]['name_key']):
+                        self._union(variant, other)
+            members.append(variant)
+        return variant
+
+    def entity_of(self, variant):
+        """Return the establishment ID of a variant."""
+        return self._entity_ids()[self._find(variant)]
+
+    def _entity_ids(self):
+        if self._ids_for != len(self.variants):
+            members = {}
+            for variant in range(len(self.variants)):
+                members.setdefault(self._find(variant), []).append(variant)
+            self._ids = {}
+            for root, group in members.items():
+                signature = min(
+                    "\x1f".join(str(self.variants[v][key]) for key in ('name_key', 'street_key', 'zip'))
+                    for v in group
+                )
+                self._ids[root] = hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16]
+            self._ids_for = len(self.variants)
+        return self._ids
+
+    def establishments(self):
+        """
+        Summarize every establishment.
+
+        Yields:
+            Dictionaries with the 'establishment_id', the most common spelling
+            of each field, every 'names' variant and the number of 'records'
+        """
+        ids = self._entity_ids()
+        groups = {}
+        for variant in range(len(self.variants)):
+            groups.setdefault(self._find(variant), []).append(variant)
+        for root, group in groups.items():
+            group.sort(key=lambda v: self.variant_rows[v], reverse=True)
+            best = self.variants[group[0]]
+            entry = {'establishment_id': ids[root], 'trade_name': best['trade_name']}
+            for key in ('street', 'city', 'state', 'zip', 'phone'):
+                entry[key] = next((self.variants[v][key] for v in group if self.variants[v][key]), None)
+            entry['names'] = sorted({self.variants[v]['trade_name'] for v in group})
+            entry['records'] = sum(self.variant_rows[v] for v in group)
+            yield entry
+
+    def __len__(self):
+        return len({self._find(variant) for variant in range(len(self.variants))})
+
+
+def resolve_files(paths, out=None, assignments=None):
+    """
+    Parse and group the establishments of scraped output files.
+
+    Args:
+        paths: NDJSON or JSON array files from main.py or newmain.py
+        out: Optional NDJSON file for one line per establishment
+        assignments: Optional NDJSON file for one line per input record with
+            its parsed fields and establishment ID, in input order
+
+    Returns:
+        The filled EstablishmentIndex
+    """
+    index = EstablishmentIndex()
+    start = time.perf_counter()
+    sources = []
+    rows = 0
+    for path in paths:
+        for record in iter_file(path):
+            fields = establishment_fields(record)
+            sources.append((path, index.add(fields)))
+            rows += 1
+    elapsed = time.perf_counter() - start
+    print(f"Resolved {rows} records into {len(index)} establishments "
+          f"({len(index.variants)} spellings, {index.comparisons} comparisons) in {elapsed:.1f}s")
+
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            for entry in index.establishments():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"Wrote establishments to {out}")
+    if assignments:
+        with open(assignments, 'w', encoding='utf-8') as f:
+            for position, (path, variant) in enumerate(sources):
+                fields = index.variants[variant]
+                entry = {'source': path, 'record': position, 'establishment_id': index.entity_of(variant)}
+                entry.update((key, fields[key]) for key in ('trade_name', 'street', 'city', 'state', 'zip', 'phone'))
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"Wrote record assignments to {assignments}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse addresses and merge duplicate establishments.")
+    parser.add_argument('files', nargs='+', help="NDJSON or JSON output of main.py/newmain.py")
+    parser.add_argument('--out', help="NDJSON file with one line per establishment")
+    parser.add_argument('--assignments', help="NDJSON file with each record's fields and establishment ID")
+    args = parser.parse_args()
+    resolve_files(args.files, args.out, args.assignments)
@@ -0,0 +1,477 @@
+"""
+Inspection Page Parser
+Turns raw HTML of the public inspection search page into the row dictionaries
+and violation records the scrapers produce, without touching a browser.
+
+Run this file directly to benchmark it against the saved index.html/table.html
+snapshots; tests/test_page_parser.py checks it against them.
+"""
+
+import math
+import re
+import sys
+import time
+
+from lxml import html
+
+VIOLATIONS_PREFIX = 'MainContent_wucPublicInspectionViolations'
+VIOLATION_FIELD_RE = re.compile(
+    rf'^{VIOLATIONS_PREFIX}_rptViolations_(lblRegulatorCodeType|pnlCodeExplanation|pnlComments)_(\d+)$'
+)
+POSTBACK_TARGET_RE = re.compile(
+    r"(?:__doPostBack\(|WebForm_PostBackOptions\()\s*(?:&quot;|['\"])([^'\"&]+)"
+)
+PAGE_ARGUMENT_RE = re.compile(r"Page\$(\d+)")
+RECORD_COUNT_RE = re.compile(r"([\d,]+)\s+record\(s\) found")
+DATA_ROW_CLASSES = ('GridItem', 'GridAltItem')
+
+
+class PopupNotLoaded(ValueError):
+    """The violations popup was still empty: the page came back without its content."""
+
+
+def parse_document(source):
+    """
+    Parse page HTML into an lxml document.
+
+    Args:
+        source: HTML as str or bytes, or an already parsed document
+
+    Returns:
+        lxml document root
+    """
+    if isinstance(source, (str, bytes)):
+        return html.fromstring(source)
+    return source
+
+
+def clean_text(element):
+    """Return the element text with whitespace collapsed the way the browser renders it."""
+    return " ".join(element.text_content().split())
+
+
+def postback_target(script):
+    """
+    Extract the event target from a __doPostBack or WebForm_PostBackOptions call.
+
+    Args:
+        script: href or onclick attribute value
+
+    Returns:
+        Event target string, or None if the script holds no postback
+    """
+    match = POSTBACK_TARGET_RE.search(script or '')
+    return match.group(1) if match else None
+
+
+def extract_form_fields(source):
+    """
+    Collect the fields a browser would submit with the page form.
+
+    Buttons are left out; the caller adds the one that triggers the request.
+
+    Args:
+        source: Page HTML or parsed document
+
+    Returns:
+        Dictionary of form field names to values
+    """
+    doc = parse_document(source)
+    fields = {}
+    for element in doc.xpath('//form[@id="theForm"]//*[self::input or self::select or self::textarea]'):
+        name = element.get('name')
+        if not name:
+            continue
+        if element.tag == 'select':
+            selected = element.xpath('.//option[@selected]') or element.xpath('.//option')
+            fields[name] = selected[0].get('value', '') if selected else ''
+        elif element.tag == 'textarea':
+            fields[name] = element.text or ''
+        else:
+            input_type = (element.get('type') or 'text').lower()
+            if input_type in ('submit', 'image', 'button', 'reset', 'file'):
+                continue
+            if input_type in ('checkbox', 'radio'):
+                if element.get('checked') is not None:
+                    fields[name] = element.get('value', 'on')
+                continue
+            fields[name] = element.get('value', '')
+    return fields
+
+
+def get_grid(source):
+    """Return the MainContent_gvInspections table element, or None."""
+    grids = parse_document(source).xpath('//table[@id="MainContent_gvInspections"]')
+    return grids[0] if grids else None
+
+
+def _grid_rows(grid):
+    return grid.xpath('./tbody/tr | ./tr')
+
+
+def has_results(source):
+    """Return True if the page shows a results grid with at least one data row."""
+    grid = get_grid(source)
+    return grid is not None and any(row.get('class') in DATA_ROW_CLASSES for row in _grid_rows(grid))
+
+
+def parse_headers(source):
+    """
+    Read the grid headers the same way the Selenium scraper does.
+
+    Args:
+        source: Page HTML or parsed document
+
+    Returns:
+        List of the first six header names, with the unnamed fifth column
+        called "Violations"
+    """
+    grid = get_grid(source)
+    header_row = _grid_rows(grid)[0]
+    headers = [clean_text(th) for th in header_row.xpath('./th')][:6]
+    headers[4] = "Violations"
+    return headers
+
+
+def split_name_address(cell):
+    """
+    Split the Name / Address cell the way newmain.py does.
+
+    Args:
+        cell: First <td> of a grid row
+
+    Returns:
+        Tuple of (trade_name, map_address); map_address keeps the address
+        and phone lines separated by a newline
+    """
+    trade_name = " ".join((cell.text or "").split())
+    lines = [clean_text(div) for div in cell.xpath('./div')]
+    return trade_name, "\n".join(line for line in lines if line)
+
+
+def _violations_link(cell):
+    for link in cell.xpath('.//a'):
+        if clean_text(link):
+            return {'id': link.get('id'), 'target': postback_target(link.get('href'))}
+    return None
+
+
+def _report_button(cell_parent):
+    names = cell_parent.xpath('./td/input[@type="image" and contains(@name, "$btnInspectionReport")]/@name')
+    return names[0] if names else None
+
+
+def parse_past_inspections(row):
+    """
+    Read the past inspections embedded in a grid row.
+
+    Each row carries its full inspection history in a hidden
+    gvPastInspections table, so no extra request is needed to get it.
+
+    Args:
+        row: Data <tr> of the results grid
+
+    Returns:
+        List of dictionaries with 'inspection_date', 'inspection_type',
+        'compliance', 'violations', 'violations_link' (None when there
+        are no violations to open) and 'report_button', the form name of
+        the inspection report button (None if the row has none), newest first
+    """
+    past = []
+    for table in row.xpath('./td/div[@id="divPastInspections"]/div/table'):
+        for past_row in _grid_rows(table):
+            if past_row.get('class') not in DATA_ROW_CLASSES:
+                continue
+            cells = past_row.xpath('./td')
+            if len(cells) < 4:
+                continue
+            past.append({
+                'inspection_date': clean_text(cells[0]),
+                'inspection_type': clean_text(cells[1]),
+                'compliance': clean_text(cells[2]),
+                'violations': clean_text(cells[3]),
+                'violations_link': _violations_link(cells[3]),
+                'report_button': _report_button(past_row)
+            })
+    return past
+
+
+def parse_grid_rows(source, headers=None):
+    """
+    Extract every data row of the current grid page in one pass.
+
+    Args:
+        source: Page HTML or parsed document
+        headers: Header names used as row keys; read from the grid if omitted
+
+    Returns:
+        List of (row_data, row_info) tuples. row_data is the scraped row:
+        the grid columns keyed by header, then 'trade_name' and 'map_address'
+        as split by split_name_address. row_info holds what the crawlers need
+        besides it: 'trade_name', 'map_address', 'violations_link', a
+        dictionary with the link 'id' and postback 'target' (None when there
+        are no violations to open), 'report_button', the form name of the
+        current inspection report button, and 'past_inspections' as returned
+        by parse_past_inspections. Every violations link, current or past,
+        also gets 'inspection', the (trade_name, map_address, inspection
+        date, inspection type) of the inspection its popup shows.
+    """
+    grid = get_grid(source)
+    if grid is None:
+        return []
+    if headers is None:
+        headers = parse_headers(grid)
+
+    rows = []
+    for row in _grid_rows(grid):
+        if row.get('class') not in DATA_ROW_CLASSES:
+            continue
+        columns = row.xpath('./td')
+        row_data = {}
+        row_info = {
+            'trade_name': '',
+            'map_address': '',
+            'violations_link': None,
+            'report_button': _report_button(row),
+            'past_inspections': parse_past_inspections(row)
+        }
+        for i, col in enumerate(columns[:6]):
+            if i < len(headers):
+                row_data[headers[i]] = clean_text(col)
+                if i == 0:
+                    row_info['trade_name'], row_info['map_address'] = split_name_address(col)
+                elif i == 4:  # Violations column
+                    row_info['violations_link'] = _violations_link(col)
+        if any(row_data.values()):
+            row_data['trade_name'] = row_info['trade_name']
+            row_data['map_address'] = row_info['map_address']
+            establishment = (row_info['trade_name'], row_info['map_address'])
+            if row_info['violations_link'] and len(columns) > 2:
+                row_info['violations_link']['inspection'] = establishment + (
+                    clean_text(columns[1]), clean_text(columns[2])
+                )
+            for past in row_info['past_inspections']:
+                if past['violations_link']:
+                    past['violations_link']['inspection'] = establishment + (
+                        past['inspection_date'], past['inspection_type']
+                    )
+            rows.append((row_data, row_info))
+    return rows
+
+
+def parse_pager(source):
+    """
+    Read the pager row of the grid.
+
+    Args:
+        source: Page HTML or parsed document
+
+    Returns:
+        Dictionary with the 'current_page' number and the sorted list of
+        'linked_pages' reachable from this page
+    """
+    grid = get_grid(source)
+    pager = {'current_page': 1, 'linked_pages': []}
+    if grid is None:
+        return pager
+    for pager_row in grid.xpath('./tbody/tr[@class="GridPager"] | ./tr[@class="GridPager"]'):
+        current = pager_row.xpath('.//span')
+        if current and clean_text(current[0]).isdigit():
+            pager['current_page'] = int(clean_text(current[0]))
+        pages = set()
+        for href in pager_row.xpath('.//a/@href'):
+            match = PAGE_ARGUMENT_RE.search(href)
+            if match:
+                pages.add(int(match.group(1)))
+        pager['linked_pages'] = sorted(pages)
+    return pager
+
+
+def get_next_page_number(source, current_page):
+    """
+    Check the pager row for a link to the page after current_page.
+
+    Args:
+        source: Page HTML or parsed document
+        current_page: Current page number
+
+    Returns:
+        Next page number, or None on the last page
+    """
+    if current_page + 1 in parse_pager(source)['linked_pages']:
+        return current_page + 1
+    return None
+
+
+def parse_page_count(source):
+    """
+    Work out how many result pages the current search has.
+
+    Uses the "N record(s) found." summary and the number of rows on the
+    current page, falling back to the highest page linked from the pager.
+
+    Args:
+        source: Page HTML or parsed document with a results grid
+
+    Returns:
+        Total number of pages
+    """
+    doc = parse_document(source)
+    pager = parse_pager(doc)
+    fallback = max([pager['current_page']] + pager['linked_pages'])
+    summary = doc.xpath('//span[@class="summaryRow"]')
+    match = RECORD_COUNT_RE.search(clean_text(summary[0])) if summary else None
+    rows_per_page = len(parse_grid_rows(doc))
+    if not match or not rows_per_page or pager['current_page'] == fallback:
+        # The last page may be short, so its row count says nothing about page size
+        return fallback
+    return max(fallback, math.ceil(int(match.group(1).replace(',', '')) / rows_per_page))
+
+
+def next_hop(source, target_page):
+    """
+    Pick the pager link that gets closest to target_page.
+
+    The pager only links a window of pages, so distant pages are reached by
+    jumping to the furthest link in the right direction and trying again.
+
+    Args:
+        source: Page HTML or parsed document with a results grid
+        target_page: Page number to reach
+
+    Returns:
+        Page number to post next, or None if already on target_page
+    """
+    return pager_hop(parse_pager(source), target_page)
+
+
+def pager_hop(pager, target_page):
+    """
+    next_hop() for a pager that has already been read with parse_pager().
+
+    Args:
+        pager: Dictionary returned by parse_pager()
+        target_page: Page number to reach
+
+    Returns:
+        Page number to post next, or None if already on target_page
+    """
+    current, linked = pager['current_page'], pager['linked_pages']
+    if current == target_page:
+        return None
+    if target_page in linked:
+        return target_page
+    if target_page > current:
+        candidates = [page for page in linked if page > current]
+        hop = max(candidates) if candidates else None
+    else:
+        candidates = [page for page in linked if page < current]
+        hop = min(candidates) if candidates else None
+    if hop is None:
+        raise ValueError(f"Page {target_page} is not reachable from page {current}")
+    return hop
+
+
+def parse_violation_popup(source):
+    """
+    Read the violations popup in a single pass over the document.
+
+    Code explanations are present in the markup even while their panels are
+    collapsed, so no toggling is needed. A code cited more than once in
+    the popup has its explanation read once, and the violations share
+    the string. Popups do not share explanations with each other, so a
+    changed text on the site is read as it is.
+
+    Args:
+        source: Page HTML or parsed document with the popup rendered
+
+    Returns:
+        Dictionary containing violation details
+
+    Raises:
+        PopupNotLoaded: If the popup header is missing or has no inspection
+            date, i.e. the popup never populated; reading it would wrongly
+            report zero violations. Callers record it as {"error": ...}
+    """
+    doc = parse_document(source)
+    header = doc.xpath(f'//*[@id="{VIOLATIONS_PREFIX}_lblHeader"]')
+    if not header:
+        raise PopupNotLoaded("Header element not found")
+    inspection_date = clean_text(header[0]).replace('Inspection Violations:', '').strip()
+    if not inspection_date:
+        raise PopupNotLoaded("Violations popup did not populate")
+
+    facility = doc.xpath(f'//*[@id="{VIOLATIONS_PREFIX}_lblFacilityInformation"]')
+    facility_text = clean_text(facility[0]) if facility else None
+
+    by_index = {}
+    for element in doc.xpath(f'//*[starts-with(@id, "{VIOLATIONS_PREFIX}_rptViolations_")]'):
+        match = VIOLATION_FIELD_RE.match(element.get('id'))
+        if match:
+            by_index.setdefault(int(match.group(2)), {})[match.group(1)] = element
+
+    violations = []
+    explanations = {}
+    index = 0
+    while 'lblRegulatorCodeType' in by_index.get(index, {}):
+        fields = by_index[index]
+        code = clean_text(fields['lblRegulatorCodeType'])
+        explanation = None
+        if 'pnlCodeExplanation' in fields:
+            explanation = explanations.get(code)
+            if explanation is None:
+                panel = fields['pnlCodeExplanation'].xpath('./div/div')
+                if panel:
+                    explanation = explanations.setdefault(code, clean_text(panel[0]))
+        comments = fields.get('pnlComments')
+        violations.append({
+            'code': code,
+            'code_explanation': explanation,
+            'inspector_comments': (
+                clean_text(comments).replace('Inspector Comments', '').strip()
+                if comments is not None else None
+            )
+        })
+        index += 1
+
+    return {
+        'inspection_date': inspection_date,
+        'facility_information': facility_text,
+        'violations': violations
+    }
+
+
+def benchmark(paths, rounds=50):
+    """
+    Report how fast grid pages are parsed.
+
+    The snapshots hold no open popup, so only the grid is timed.
+
+    Args:
+        paths: HTML snapshot files to parse
+        rounds: Number of times each file is parsed
+
+    Returns:
+        Rows parsed per second
+    """
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+
+    total_rows = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for source in sources:
+            doc = parse_document(source)
+            total_rows += len(parse_grid_rows(doc))
+    elapsed = time.perf_counter() - start
+
+    rate = total_rows / elapsed if elapsed else 0.0
+    print(f"Parsed {total_rows} rows from {rounds * len(sources)} pages in {elapsed:.3f}s "
+          f"({rate:.0f} rows/s)")
+    return rate
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:] or ["index.html", "table.html"])
@@ -0,0 +1,255 @@
+"""
+Pager Navigation
+Moves a crawl session's results grid to any page in as few postbacks as the
+site allows, so resuming or sharding at page 300 does not click through the
+299 pages before it.
+
+The grid's pager links one window of pages (20 on the site) plus a "..."
+link to the page just outside the window on either side. Pages the pager did
+not render fail the site's event validation, but any page can be posted
+from the saved form state of a page whose pager links it. PageNavigator,
+shared by every HTTP session of a crawl, therefore:
+
+    1. tries Page$N directly, once per crawl, and remembers whether the site took it
+    2. keeps the form state of one page per pager window as a waypoint, so a
+       session can start from the waypoint nearest its target
+    3. walks the "..." links from there, one postback per window
+
+plan_hops() works out a route without loading any pages.
+
+Usage:
+    python pager.py 300 650                    # total pages and planned routes
+    python pager.py --seek 300 --url http://127.0.0.1:8765/PublicInspectionSearch.aspx
+"""
+
+import argparse
+import logging
+import threading
+
+from metrics import METRICS
+from page_parser import pager_hop, parse_pager
+
+PAGER_WINDOW = 20
+
+log = logging.getLogger(__name__)
+
+
+def page_range(value):
+    """
+    Parse a FIRST-LAST page range argument.
+
+    Args:
+        value: Range such as "1-20", or "40-" for page 40 to the end
+
+    Returns:
+        (first, last) tuple; last is None for an open-ended range
+
+    Raises:
+        argparse.ArgumentTypeError: If the range is not numeric, starts
+            before page 1 or ends before it starts
+    """
+    first, _, last = value.partition('-')
+    try:
+        first, last = int(first), int(last) if last else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid page range {value!r}; expected FIRST-LAST, e.g. 1-20 or 40-"
+        ) from None
+    if first < 1:
+        raise argparse.ArgumentTypeError(f"invalid page range {value!r}; pages start at 1")
+    if last is not None and last < first:
+        raise argparse.ArgumentTypeError(f"invalid page range {value!r}; last page is before the first")
+    return first, last
+
+
+def plan_hops(current, target, window=PAGER_WINDOW):
+    """
+    Work out the pages a windowed pager has to post to get from one page to another.
+
+    Args:
+        current: Page the grid is on
+        target: Page to reach
+        window: Page links per pager window
+
+    Returns:
+        Pages to post, in order; empty if current is target
+    """
+    hops = []
+    while current != target:
+        first = (current - 1) // window * window + 1
+        last = first + window - 1
+        if first <= target <= last:
+            current = target
+        elif target > last:
+            current = last + 1
+        else:
+            current = first - 1
+        hops.append(current)
+    return hops
+
+
+class PageNavigator:
+    """
+    Thread-safe page seeking shared by the HTTP sessions of one search.
+
+    Args:
+        window: Page links per pager window, used to compare routes
+        direct: Whether the site accepts jumps to pages its pager did not
+            link; None finds out with the first such seek
+    """
+
+    def __init__(self, window=PAGER_WINDOW, direct=None):
+        self.window = window
+        self.direct = direct
+        self.seeks = 0
+        self.postbacks = 0
+        self._lock = threading.Lock()
+        self._waypoints = {}  # Pager window -> (page, form fields, pager or None)
+
+    def remember(self, page_num, fields, pager=None):
+        """
+        Keep a page's form state as a starting point for later seeks.
+
+        Args:
+            page_num: Page the fields belong to
+            fields: WebForms fields of that page
+            pager: The page's parse_pager() result; None for a state restored
+                from a checkpoint, which is only trusted to link its neighbours
+        """
+        if not fields or not page_num:
+            return
+        window = (page_num - 1) // self.window
+        with self._lock:
+            known = self._waypoints.get(window)
+            if known is None or (known[2] is None and pager is not None):
+                self._waypoints[window] = (page_num, dict(fields), pager)
+
+    def forget(self, page_num):
+        """Drop the waypoint of page_num, e.g. after the site refused its state."""
+        with self._lock:
+            window = (page_num - 1) // self.window
+            if self._waypoints.get(window, (None,))[0] == page_num:
+                del self._waypoints[window]
+
+    def _route_cost(self, page_num, pager, target):
+        if pager is None:
+            step = page_num + 1 if target > page_num else page_num - 1
+            return 1 + len(plan_hops(step, target, self.window))
+        return len(plan_hops(page_num, target, self.window))
+
+    def _best_waypoint(self, current, target):
+        with self._lock:
+            waypoints = list(self._waypoints.values())
+        best, best_cost = None, len(plan_hops(current, target, self.window))
+        for waypoint in waypoints:
+            page_num, _, pager = waypoint
+            if page_num == target:
+                continue  # Its state shows the page but the document is gone
+            cost = self._route_cost(page_num, pager, target)
+            if cost < best_cost:
+                best, best_cost = waypoint, cost
+        return best
+
+    def _learn_direct(self, accepted):
+        with self._lock:
+            if self.direct is None:
+                self.direct = accepted
+                log.info("Site %s jumps to pages the pager does not link",
+                         "accepts" if accepted else "refuses")
+
+    def _count(self, postbacks):
+        with self._lock:
+            self.seeks += 1
+            self.postbacks += postbacks
+        METRICS.increment('pager_postbacks_total', postbacks)
+
+    def seek(self, client, target):
+        """
+        Move a client's grid to target.
+
+        Args:
+            client: http_backend.WebFormsClient showing a page of this search
+            target: Page to reach
+
+        Returns:
+            Number of postbacks it took
+        """
+        pager = parse_pager(client.doc)
+        if pager['current_page'] == target:
+            return 0
+        postbacks = 0
+        if self.direct is not False and target not in pager['linked_pages']:
+            postbacks += 1
+            accepted = client.try_page(target) is not None
+            self._learn_direct(accepted)
+            if accepted:
+                self._count(postbacks)
+                return postbacks
+
+        waypoint = self._best_waypoint(pager['current_page'], target)
+        if waypoint:
+            page_num, fields, waypoint_pager = waypoint
+            waypoint_pager = waypoint_pager or {
+                'current_page': page_num, 'linked_pages': [page_num - 1, page_num + 1]
+            }
+            log.debug("Seeking page %d from the saved state of page %d", target, page_num)
+            saved_fields = client.fields
+            client.fields = dict(fields)
+            postbacks += 1
+            # Probe the saved state without retries: a refusal means it went stale
+            if client.try_page(pager_hop(waypoint_pager, target)) is None:
+                log.info("Saved state of page %d was refused; walking from page %d",
+                         page_num, pager['current_page'])
+                self.forget(page_num)
+                client.fields = saved_fields
+            else:
+                pager = parse_pager(client.doc)
+                self.remember(pager['current_page'], client.fields, pager)
+
+        while True:
+            hop = pager_hop(pager, target)
+            if hop is None:
+                break
+            pager = parse_pager(client.go_to_page(hop))
+            postbacks += 1
+            self.remember(pager['current_page'], client.fields, pager)
+        self._count(postbacks)
+        return postbacks
+
+    def print_summary(self):
+        """Print how many postbacks the seeks took and what was learned about the site."""
+        direct = {None: "untested", True: "accepted", False: "refused"}[self.direct]
+        print(f"Pager: {self.seeks} seeks took {self.postbacks} postbacks; direct jumps {direct}; "
+              f"{len(self._waypoints)} waypoints")
+
+
+if __name__ == "__main__":
+    import http_backend
+    import metrics
+
+    parser = argparse.ArgumentParser(description="Show or try the shortest routes to result pages.")
+    parser.add_argument('pages', nargs='+', type=int, help="Target pages")
+    parser.add_argument('--url', default=http_backend.SEARCH_URL, help="Search page URL")
+    parser.add_argument('--window', type=int, default=PAGER_WINDOW, help="Page links per pager window")
+    parser.add_argument('--seek', action='store_true', help="Move the grid to each page and count postbacks")
+    args = parser.parse_args()
+    metrics.configure_logging()
+
+    navigator = PageNavigator(window=args.window)
+    session = http_backend.HttpPageSession(url=args.url, navigator=navigator)
+    session.open()
+    total = session.total_pages()
+    print(f"{total} result pages")
+    try:
+        for page in args.pages:
+            if not 1 <= page <= total:
+                print(f"Page {page}: out of range")
+                continue
+            print(f"Page {page}: {len(plan_hops(session.page_num, page, args.window))} postbacks "
+                  f"walking from page {session.page_num}")
+            if args.seek:
+                session.seek(page)
+                print(f"Page {page}: reached with {navigator.postbacks} postbacks so far")
+    finally:
+        session.close()
+    navigator.print_summary()
@@ -0,0 +1,255 @@
+"""
+Parallel Crawler
+Runs several independent crawl sessions side by side, each walking its own
+disjoint range of result pages, and collects their rows in one shared sink.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import records
+from metrics import METRICS
+from resilience import CrawlTruncated
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Thread-safe per-host limit on how often requests may start.
+
+    Every session talking to the same host draws from one schedule, so adding
+    workers raises throughput only until the host's request budget is used up.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """Block until a request to the host of url may be sent."""
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            with METRICS.timer('rate_limit'):
+                time.sleep(delay)
+
+
+class ResultSink:
+    """Thread-safe collector that all crawl sessions feed their rows into."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.results = []
+
+    def add(self, rows):
+        """Append one page worth of rows."""
+        with self._lock:
+            self.results.extend(rows)
+
+    def __len__(self):
+        with self._lock:
+            return len(self.results)
+
+
+class TeeSink:
+    """
+    Feeds every row to several sinks at once.
+
+    The first sink is the primary one: its path and file position stand for
+    the whole tee, and the others are flushed before that position is read
+    so a checkpoint never runs ahead of any of them.
+    """
+
+    def __init__(self, primary, *others):
+        self.primary = primary
+        self.others = others
+        self.path = getattr(primary, 'path', None)
+
+    def write(self, record):
+        """Send one record to every sink."""
+        for sink in (self.primary,) + self.others:
+            sink.write(record)
+
+    def add(self, rows):
+        """Send a batch of records to every sink."""
+        for sink in (self.primary,) + self.others:
+            sink.add(rows)
+
+    def tell(self):
+        """Flush the secondary sinks and return the primary sink's position."""
+        for sink in self.others:
+            sink.flush()
+        return self.primary.tell()
+
+    def close(self):
+        """Close every sink."""
+        for sink in (self.primary,) + self.others:
+            sink.close()
+
+    @property
+    def count(self):
+        return self.primary.count
+
+    def __len__(self):
+        return len(self.primary)
+
+
+def shard_pages(first_page, last_page, shards):
+    """
+    Split a page range into contiguous, disjoint chunks of near-equal size.
+
+    Args:
+        first_page: First page number to crawl
+        last_page: Last page number to crawl (inclusive)
+        shards: Number of chunks to produce
+
+    Returns:
+        List of (start, end) tuples, inclusive on both ends
+    """
+    total = last_page - first_page + 1
+    if total <= 0:
+        return []
+    shards = max(1, min(shards, total))
+    size, extra = divmod(total, shards)
+    ranges = []
+    start = first_page
+    for i in range(shards):
+        end = start + size - 1 + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def crawl_shard(session, start, end, sink, checkpoint=None, stop_after_empty_pages=None):
+    """
+    Crawl pages start..end with one session and feed the rows into sink.
+
+    Args:
+        session: Opened crawl session (HTTP or Selenium)
+        start: First page of the shard
+        end: Last page of the shard (inclusive); None runs to the last page
+        sink: Shared result sink
+        checkpoint: Optional checkpoint.CheckpointStore; pages it already
+            holds are skipped and every finished page is committed to it
+        stop_after_empty_pages: Stop early after this many consecutive pages
+            that yielded no rows, e.g. because an incremental crawl found
+            nothing new on them
+
+    Returns:
+        Number of pages crawled
+
+    Raises:
+        resilience.CrawlTruncated: If the pager ends before the last page
+            the search reported, instead of passing that off as the end
+    """
+    if checkpoint:
+        start = checkpoint.first_unfinished_page(start)
+        if end is not None and start > end:
+            return 0
+    expected_last = end if end is not None else session.total_pages()
+    if start > expected_last:
+        return 0
+    session.seek(start)
+    pages = 0
+    empty_streak = 0
+    while True:
+        page_num = session.page_num
+        if not (checkpoint and checkpoint.is_page_done(page_num)):
+            log.info("Scraping page %d (shard %d-%s)", page_num, start, end or 'end')
+            with METRICS.timer('scrape_page'):
+                rows = session.scrape_page()
+            with METRICS.timer('write'):
+                if checkpoint:
+                    checkpoint.commit_page(page_num, rows, sink, session.form_state())
+                else:
+                    sink.add(rows)
+            METRICS.record_rows(rows)
+            pages += 1
+            empty_streak = 0 if rows else empty_streak + 1
+            if stop_after_empty_pages and empty_streak >= stop_after_empty_pages:
+                log.info("No new rows on the last %d pages. Stopping early.", empty_streak)
+                return pages
+        if end is not None and page_num >= end:
+            return pages
+        if not session.next_page():
+            if page_num < expected_last:
+                raise CrawlTruncated(f"Pager ended at page {page_num} of {expected_last}")
+            return pages
+
+
+def crawl_parallel(make_session, workers=4, sink=None, first_page=1, last_page=None, checkpoint=None):
+    """
+    Crawl the result pages with several sessions in parallel.
+
+    Args:
+        make_session: Callable returning a new, unopened crawl session
+        workers: Number of concurrent sessions
+        sink: Result sink to feed; a records.CompactSink, which holds the
+            rows in memory as compact records, is created if omitted
+        first_page: First page to crawl
+        last_page: Last page to crawl; defaults to the final result page
+        checkpoint: Optional checkpoint.CheckpointStore shared by all sessions
+
+    Returns:
+        The result sink
+
+    Raises:
+        Exception: The first shard failure, once every shard has stopped;
+            the pages of the other shards are written and checkpointed
+    """
+    sink = sink if sink is not None else records.CompactSink()
+
+    # The first session also discovers how many pages there are
+    probe = make_session()
+    try:
+        probe.open()
+        if last_page is None:
+            last_page = probe.total_pages()
+    except BaseException:
+        # The probe is only handed to the first shard once it is open
+        probe.close()
+        raise
+    shards = shard_pages(first_page, last_page, workers)
+    print(f"Crawling pages {first_page}-{last_page} with {len(shards)} sessions: {shards}")
+
+    def run(index, start, end):
+        session = probe if index == 0 else make_session()
+        try:
+            if index != 0:
+                session.open()
+            return crawl_shard(session, start, end, sink, checkpoint)
+        finally:
+            session.close()
+
+    if not shards:
+        probe.close()
+        return sink
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = {
+            pool.submit(run, index, start, end): (start, end)
+            for index, (start, end) in enumerate(shards)
+        }
+        for future in as_completed(futures):
+            start, end = futures[future]
+            try:
+                print(f"Shard {start}-{end} finished after {future.result()} pages")
+            except Exception as e:
+                log.error("Shard %d-%d failed: %s", start, end, e)
+                failures.append(e)
+
+    if failures:
+        raise failures[0]
+    return sink
@@ -0,0 +1,168 @@
+"""
+Process-Pool Parsing
+Moves the CPU-bound half of a crawl, turning grid pages (with their nested
+gvPastInspections tables) and violation popups from HTML into rows, onto
+worker processes. Parsing then scales with cores instead of queuing on the
+GIL behind the fetch loop, which matters once fetching is cheap: replaying
+a response cache or backfilling from saved HTML.
+
+Workers receive raw HTML bytes and send back plain rows and popup
+dictionaries; lxml trees never leave a worker. The text cleanup (collapsed
+whitespace, the "Inspector Comments" label) happens there too.
+
+    ParsePool.rows(html)       grid page -> [(row_data, row_info), ...]
+    ParsePool.popup(html)      violations popup -> violation_details
+    ParsePool.map_files(paths) saved grid pages -> rows, in order
+    ParsePool.map(function)    any other parse job, e.g. html_archive.py's re-parse
+
+With workers=0 everything is parsed on a thread of the calling process
+instead, so callers keep one code path.
+
+Usage:
+    python main.py --backend async --workers 8 --parse-workers 4 --cache .http_cache
+    python parse_pool.py --workers 4 --out rows.ndjson pages/*.html
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ndjson_sink
+from incremental import past_inspection_records
+from metrics import METRICS
+from page_parser import parse_grid_rows, parse_violation_popup
+
+
+def parse_page(source, headers=None):
+    """Parse a grid page into (row_data, row_info) tuples; runs in a worker."""
+    return parse_grid_rows(source, headers)
+
+
+def parse_popup(source):
+    """Parse a violations popup; runs in a worker."""
+    return parse_violation_popup(source)
+
+
+def parse_page_file(path, headers=None):
+    """Read and parse a saved grid page in a worker, so only the path crosses processes."""
+    with open(path, 'rb') as f:
+        return parse_grid_rows(f.read(), headers)
+
+
+class ParsePool:
+    """
+    Pool of parser processes shared by the stages of a crawl.
+
+    Args:
+        workers: Worker processes; None uses one per core, 0 parses on
+            threads of this process
+    """
+
+    def __init__(self, workers=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        # Forking a process whose threads may hold locks can deadlock the children, so workers are spawned
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+        ) if self.workers > 0 else None
+
+    @property
+    def inline(self):
+        """True if parsing happens in this process; callers may then pass parsed documents."""
+        return self._executor is None
+
+    async def _run(self, function, *args):
+        if self._executor is None:
+            return await asyncio.to_thread(function, *args)
+        return await asyncio.wrap_future(self._executor.submit(function, *args))
+
+    async def rows(self, source, headers=None):
+        """
+        Parse a grid page without blocking the event loop.
+
+        Args:
+            source: Raw page HTML; a parsed document is accepted when inline
+            headers: Header names used as row keys; read from the grid if omitted
+
+        Returns:
+            List of (row_data, row_info) tuples, as page_parser.parse_grid_rows
+        """
+        with METRICS.timer('parse_rows'):
+            return await self._run(parse_page, source, headers)
+
+    async def popup(self, source):
+        """Parse a violations popup without blocking the event loop."""
+        with METRICS.timer('parse_popup'):
+            return await self._run(parse_popup, source)
+
+    def map(self, function, *iterables, chunksize=4):
+        """
+        Call a module-level function over iterables across the pool.
+
+        Returns:
+            Iterator of the results, in order
+        """
+        if self._executor is None:
+            return map(function, *iterables)
+        return self._executor.map(function, *iterables, chunksize=chunksize)
+
+    def map_files(self, paths, headers=None):
+        """
+        Parse saved grid pages across the pool.
+
+        Yields:
+            (path, rows) pairs in the order of paths
+        """
+        yield from zip(paths, self.map(parse_page_file, paths, [headers] * len(paths)))
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def parse_files(paths, output, workers=None):
+    """
+    Parse saved grid pages into an NDJSON file of rows.
+
+    Popups are not part of a grid page, so violation_details is left None;
+    the past inspections come from the page itself.
+
+    Args:
+        paths: Saved grid page HTML files
+        output: NDJSON file the rows are written to
+        workers: Worker processes; None uses one per core
+
+    Returns:
+        Number of rows written
+    """
+    paths = list(paths)
+    start = time.perf_counter()
+    with ParsePool(workers) as pool, ndjson_sink.NdjsonWriter(output) as writer:
+        for _, rows in pool.map_files(paths):
+            for row_data, row_info in rows:
+                row_data['violation_details'] = None
+                row_data['past_inspections'] = past_inspection_records(row_info, None)
+                writer.write(row_data)
+        rows = writer.count
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(paths)} pages into {rows} rows with {pool.workers or 'no'} worker processes "
+          f"in {elapsed:.2f}s ({len(paths) / elapsed if elapsed else 0:.0f} pages/s); wrote {output}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse saved grid pages into NDJSON rows across processes.")
+    parser.add_argument('files', nargs='+', help="Saved grid page HTML files")
+    parser.add_argument('--out', default='parsed_rows.ndjson', help="NDJSON output file")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per core, 0: none)")
+    args = parser.parse_args()
+    parse_files(args.files, args.out, args.workers)
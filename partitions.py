@@ -0,0 +1,341 @@
+"""
+Partitioned Crawls
+Splits the statewide search into filtered searches - per city, ZIP, county
+or radius - and crawls each one as an independent work unit, so no crawl
+has to walk a single pager thousands of pages deep.
+
+Every partition writes its own NDJSON file and checkpoint to a partition
+directory, and partitions.json there records when each partition last
+started and finished. Partitions can therefore run side by side, and any
+one of them can be re-crawled on its own schedule (busy cities daily, the
+rest of the state weekly) without touching the others.
+
+Partition specs:
+    city:Wichita,Topeka         one partition per city
+    zip:66212,66213             one partition per ZIP code
+    county:Johnson,Sedgwick     counties as named on the search page
+    county:all                  every county on the search page
+    radius:37.69,-97.34,25      latitude, longitude and miles of a radius search
+    city:@cities.txt            values read from a file, one per line
+
+The page geocodes radius searches in the browser, so radius partitions take
+the center as coordinates and send them in the hidden fields directly.
+
+Usage:
+    python main.py --backend http --partition county:all --workers 4
+    python main.py --backend http --partition city:Wichita --stale-after 24
+    python partitions.py county:all city:Wichita
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import checkpoint
+import ndjson_sink
+import parallel_crawl
+from http_backend import SEARCH_URL, WebFormsClient
+from page_parser import clean_text, parse_document
+
+CITY_FIELD = 'ctl00$MainContent$txtCity'
+ZIP_FIELD = 'ctl00$MainContent$txtZip'
+COUNTY_FIELD = 'ctl00$MainContent$wucStateCountiesFS$ddlCounty'
+RADIUS_FIELDS = {
+    'use': 'ctl00$MainContent$hfUseRadius',
+    'latitude': 'ctl00$MainContent$hfLatitude',
+    'longitude': 'ctl00$MainContent$hfLongitude',
+    'miles': 'ctl00$MainContent$hfRadiusMiles',
+    'checkbox': 'ctl00$MainContent$chkRadius',
+    'select': 'ctl00$MainContent$ddlRadiusMiles'
+}
+STATE_FILE = 'partitions.json'
+
+log = logging.getLogger(__name__)
+
+
+class Partition:
+    """One filtered search, crawled as its own unit of work."""
+
+    def __init__(self, kind, value, criteria):
+        self.kind = kind
+        self.value = value
+        self.name = f"{kind}:{value}"
+        self.criteria = criteria
+
+    @property
+    def slug(self):
+        """File-name-safe form of the partition name."""
+        return re.sub(r'[^a-z0-9.]+', '-', self.name.lower()).strip('-')
+
+    def __repr__(self):
+        return f"Partition({self.name!r})"
+
+
+def county_options(source):
+    """
+    Read the county choices offered by the search page.
+
+    Args:
+        source: Search page HTML or parsed document
+
+    Returns:
+        Dictionary of county names to their option values
+    """
+    doc = parse_document(source)
+    options = doc.xpath(f'//select[@name="{COUNTY_FIELD}"]/option')
+    return {clean_text(option): option.get('value') for option in options if option.get('value')}
+
+
+def _spec_values(text):
+    if text.startswith('@'):
+        with open(text[1:], encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [value.strip() for value in text.split(',') if value.strip()]
+
+
+def parse_partition_spec(spec, counties=None):
+    """
+    Expand one partition spec into partitions.
+
+    Args:
+        spec: Spec such as 'city:Wichita,Topeka' (see the module docstring)
+        counties: Callable returning county_options() of the search page;
+            only called for county specs
+
+    Returns:
+        List of Partition objects
+
+    Raises:
+        ValueError: If the spec is malformed or names an unknown county
+    """
+    kind, _, text = spec.partition(':')
+    kind = kind.strip().lower()
+    if not text:
+        raise ValueError(f"Partition spec {spec!r} has no values")
+
+    if kind == 'city':
+        return [Partition('city', city, {CITY_FIELD: city}) for city in _spec_values(text)]
+    if kind == 'zip':
+        return [Partition('zip', code, {ZIP_FIELD: code}) for code in _spec_values(text)]
+    if kind == 'county':
+        options = counties() if counties else {}
+        by_name = {name.lower(): (name, value) for name, value in options.items()}
+        names = list(options) if text.strip().lower() == 'all' else _spec_values(text)
+        partitions = []
+        for name in names:
+            if name.lower() not in by_name:
+                raise ValueError(f"Unknown county {name!r}")
+            county, value = by_name[name.lower()]
+            partitions.append(Partition('county', county, {COUNTY_FIELD: value}))
+        return partitions
+    if kind == 'radius':
+        try:
+            latitude, longitude, miles = (float(part) for part in text.split(','))
+        except ValueError:
+            raise ValueError(f"Radius spec {spec!r} must be radius:LATITUDE,LONGITUDE,MILES") from None
+        miles_text = f"{miles:g}"
+        return [Partition('radius', text.replace(' ', ''), {
+            RADIUS_FIELDS['use']: 'true',
+            RADIUS_FIELDS['latitude']: f"{latitude:g}",
+            RADIUS_FIELDS['longitude']: f"{longitude:g}",
+            RADIUS_FIELDS['miles']: miles_text,
+            RADIUS_FIELDS['checkbox']: 'on',
+            RADIUS_FIELDS['select']: miles_text
+        })]
+    raise ValueError(f"Unknown partition type {kind!r} in {spec!r}")
+
+
+def build_partitions(specs, url=SEARCH_URL):
+    """
+    Expand partition specs into a list of distinct partitions.
+
+    The search page is only fetched (once) if a county spec needs its
+    county list.
+
+    Args:
+        specs: Partition specs
+        url: Search page URL
+
+    Returns:
+        List of Partition objects in spec order
+    """
+    county_cache = {}
+
+    def counties():
+        if 'options' not in county_cache:
+            client = WebFormsClient(url=url)
+            try:
+                county_cache['options'] = county_options(client.load())
+            finally:
+                client.session.close()
+        return county_cache['options']
+
+    partitions = {}
+    for spec in specs:
+        for partition in parse_partition_spec(spec, counties):
+            partitions.setdefault(partition.name, partition)
+    return list(partitions.values())
+
+
+class PartitionState:
+    """Thread-safe record of when each partition was last crawled, backed by a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+
+    def load(self):
+        """Read the state file if it exists."""
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        return self
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def is_finished(self, partition):
+        """Return True if the partition's last crawl ran to the end."""
+        entry = self.entries.get(partition.name)
+        return bool(entry and entry.get('finished_at'))
+
+    def is_fresh(self, partition, max_age):
+        """Return True if the partition finished a crawl less than max_age seconds ago."""
+        entry = self.entries.get(partition.name)
+        if max_age is None or not entry or not entry.get('finished_at'):
+            return False
+        return time.time() - entry['finished_at'] < max_age
+
+    def mark_started(self, partition):
+        """Record the start of a crawl; the partition counts as unfinished until mark_finished."""
+        with self._lock:
+            entry = self.entries.setdefault(partition.name, {})
+            entry.update({'criteria': partition.criteria, 'slug': partition.slug,
+                          'started_at': time.time(), 'finished_at': None})
+            self._save()
+
+    def mark_finished(self, partition, pages, rows):
+        """Record a crawl that ran to the end."""
+        with self._lock:
+            entry = self.entries.setdefault(partition.name, {})
+            entry.update({'finished_at': time.time(), 'pages': pages, 'rows': rows})
+            self._save()
+
+
+def crawl_partition(partition, make_session, directory, resume=False, database=None, fsync=False,
+                    stop_after_empty_pages=None):
+    """
+    Crawl one partition into its own NDJSON file, checkpointing every page.
+
+    Args:
+        partition: Partition to crawl
+        make_session: Callable taking search criteria and returning a new, unopened session
+        directory: Partition directory holding the output and checkpoint files
+        resume: Continue from the partition's checkpoint instead of starting over
+        database: Optional sqlite_store.SqliteStore shared by all partitions
+        fsync: Force every buffered flush of the output to disk
+        stop_after_empty_pages: Stop after this many pages in a row without new rows
+
+    Returns:
+        Tuple of (pages crawled, rows written)
+    """
+    output = os.path.join(directory, partition.slug + '.ndjson')
+    store = checkpoint.CheckpointStore(os.path.join(directory, partition.slug + '.checkpoint'))
+    if resume and store.load():
+        store.truncate_output(output)
+    else:
+        store.reset()
+        resume = False
+    writer = ndjson_sink.NdjsonWriter(output, fsync=fsync, append=resume)
+    sink = parallel_crawl.TeeSink(writer, database) if database is not None else writer
+    session = make_session(partition.criteria)
+    try:
+        session.open()
+        if session.headers is None:
+            log.warning("%s: search matched nothing", partition.name)
+            return 0, 0
+        pages = parallel_crawl.crawl_shard(session, 1, None, sink, store, stop_after_empty_pages)
+    finally:
+        session.close()
+        writer.close()
+        if database is not None:
+            database.flush()
+    return pages, writer.count
+
+
+def crawl_partitions(partitions, make_session, directory='partitions', workers=1, resume=False,
+                     max_age=None, database=None, fsync=False, stop_after_empty_pages=None):
+    """
+    Crawl partitions side by side, each into its own files.
+
+    Args:
+        partitions: Partitions to crawl
+        make_session: Callable taking search criteria and returning a new, unopened session
+        directory: Partition directory; created if missing
+        workers: Number of partitions crawled at once
+        resume: Skip partitions that finished since they were last started
+            and continue the others from their checkpoints
+        max_age: Skip partitions that finished less than this many seconds ago
+        database: Optional sqlite_store.SqliteStore all partitions also write to
+        fsync: Force every buffered flush of the outputs to disk
+        stop_after_empty_pages: Stop a partition after this many pages in a row without new rows
+
+    Returns:
+        Dictionary of partition names to (pages, rows) for the partitions that finished
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = PartitionState(os.path.join(directory, STATE_FILE)).load()
+    todo = []
+    for partition in partitions:
+        if resume and state.is_finished(partition):
+            print(f"{partition.name}: finished in an earlier run, skipping")
+        elif state.is_fresh(partition, max_age):
+            print(f"{partition.name}: crawled recently, skipping")
+        else:
+            todo.append(partition)
+    print(f"Crawling {len(todo)} of {len(partitions)} partitions with {max(1, workers)} workers")
+
+    def run(partition):
+        if not (resume and partition.name in state.entries):
+            state.mark_started(partition)
+        return crawl_partition(partition, make_session, directory, resume, database, fsync,
+                               stop_after_empty_pages)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run, partition): partition for partition in todo}
+        for future in as_completed(futures):
+            partition = futures[future]
+            try:
+                pages, rows = future.result()
+            except Exception as e:
+                log.error("%s failed: %s", partition.name, e)
+                continue
+            state.mark_finished(partition, pages, rows)
+            results[partition.name] = (pages, rows)
+            print(f"{partition.name} finished: {pages} pages, {rows} rows")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List crawl partitions and when they were last crawled.")
+    parser.add_argument('specs', nargs='+', help="Partition specs, e.g. county:all or city:Wichita,Topeka")
+    parser.add_argument('--url', default=SEARCH_URL, help="Search page to read the county list from")
+    parser.add_argument('--dir', default='partitions', help="Partition directory")
+    args = parser.parse_args()
+
+    state = PartitionState(os.path.join(args.dir, STATE_FILE)).load()
+    for partition in build_partitions(args.specs, args.url):
+        entry = state.entries.get(partition.name, {})
+        finished = entry.get('finished_at')
+        last = time.strftime('%Y-%m-%d %H:%M', time.localtime(finished)) if finished else 'never'
+        print(f"{partition.name:<32}{partition.slug:<32}{last:<18}{entry.get('rows', '')}")
@@ -0,0 +1,290 @@
+"""
+Compact Records
+Memory-lean in-memory model of scraped rows for crawls large enough that a
+list of row dictionaries gets expensive.
+
+A row dictionary repeats its header keys, and every row repeats the same
+dates, inspection types and compliance values as separate string objects.
+Each violation also carries a full copy of its code's explanation. The
+model here stores rows as __slots__ dataclasses instead:
+
+    Establishment   one grid row: its columns, current popup and past inspections
+    Inspection      one past inspection from the row's history
+    Violation       one cited code with the inspector's comments
+
+Categorical strings are interned, key tuples are shared between rows, and
+explanation text is kept once per code in a CodeBook that violations refer
+to by code. to_dict() turns a record back into exactly the dictionary it
+was built from, so the JSON output schema does not change.
+
+Usage:
+    python records.py food_safety_data.ndjson    # compare memory against plain dictionaries
+"""
+
+import json
+import sys
+import threading
+import tracemalloc
+from dataclasses import dataclass
+
+DETAILS_KEY = 'violation_details'
+PAST_KEY = 'past_inspections'
+DETAIL_FIELDS = ('inspection_date', 'facility_information', 'violations')
+PAST_FIELDS = ('inspection_date', 'inspection_type', 'compliance', 'violations', DETAILS_KEY)
+VIOLATION_FIELDS = ('code', 'code_explanation', 'inspector_comments')
+# Grid columns that hold free text rather than a small set of repeating values
+FREE_TEXT_COLUMNS = {'Name / Address', 'trade_name', 'map_address'}
+
+
+def intern(value):
+    """Intern strings; pass anything else through unchanged."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CodeBook:
+    """Thread-safe code -> explanation table shared by all violations of a sink."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.explanations = {}
+
+    def register(self, code, explanation):
+        """
+        Record the explanation of a code.
+
+        Returns:
+            True if the explanation is now the one stored for the code, so
+            the violation does not need to keep its own copy
+        """
+        if code is None or explanation is None:
+            return False
+        with self._lock:
+            known = self.explanations.setdefault(code, explanation)
+        return known == explanation
+
+    def explain(self, code):
+        """Return the stored explanation of a code, or None."""
+        return self.explanations.get(code)
+
+
+@dataclass(slots=True)
+class Violation:
+    """One violation of a popup; explanation is only set when the code book's differs."""
+    code: str
+    inspector_comments: str
+    explanation: str = None
+    in_code_book: bool = True
+
+    def to_dict(self, code_book):
+        explanation = code_book.explain(self.code) if self.in_code_book else self.explanation
+        return {'code': self.code, 'code_explanation': explanation, 'inspector_comments': self.inspector_comments}
+
+
+@dataclass(slots=True)
+class ViolationDetails:
+    """Parsed violations popup, or the error raised while opening it."""
+    inspection_date: str = None
+    facility_information: str = None
+    violations: tuple = ()
+    error: str = None
+
+    def to_dict(self, code_book):
+        if self.error is not None:
+            return {'error': self.error}
+        return {
+            'inspection_date': self.inspection_date,
+            'facility_information': self.facility_information,
+            'violations': [violation.to_dict(code_book) for violation in self.violations]
+        }
+
+
+@dataclass(slots=True)
+class Inspection:
+    """One past inspection listed in a grid row."""
+    inspection_date: str
+    inspection_type: str
+    compliance: str
+    violations: str
+    details: object = None
+
+    def to_dict(self, code_book):
+        return {
+            'inspection_date': self.inspection_date,
+            'inspection_type': self.inspection_type,
+            'compliance': self.compliance,
+            'violations': self.violations,
+            DETAILS_KEY: _expand(self.details, code_book)
+        }
+
+
+@dataclass(slots=True)
+class Establishment:
+    """One grid row: its columns in key order, current popup and past inspections."""
+    keys: tuple
+    columns: tuple
+    details: object = None
+    past_inspections: tuple = ()
+
+    def to_dict(self, code_book):
+        values = iter(self.columns)
+        row = {}
+        for key in self.keys:
+            if key == DETAILS_KEY:
+                row[key] = _expand(self.details, code_book)
+            elif key == PAST_KEY:
+                row[key] = None if self.past_inspections is None else [
+                    inspection.to_dict(code_book) for inspection in self.past_inspections
+                ]
+            else:
+                row[key] = next(values)
+        return row
+
+
+def _expand(value, code_book):
+    # Details are compacted when they have a known shape and kept as they are otherwise
+    return value.to_dict(code_book) if isinstance(value, ViolationDetails) else value
+
+
+class RecordCompactor:
+    """Builds compact records, sharing key tuples and explanations between them."""
+
+    def __init__(self, code_book=None):
+        self.code_book = code_book or CodeBook()
+        self._key_sets = {}
+
+    def _keys(self, keys):
+        keys = tuple(intern(key) for key in keys)
+        return self._key_sets.setdefault(keys, keys)
+
+    def details(self, details):
+        """Compact a violation_details value; unknown shapes are returned as they are."""
+        if not isinstance(details, dict):
+            return details
+        if tuple(details) == ('error',):
+            return ViolationDetails(error=details['error'])
+        if tuple(details) != DETAIL_FIELDS or not isinstance(details['violations'], list):
+            return details
+        violations = []
+        for violation in details['violations']:
+            if not isinstance(violation, dict) or tuple(violation) != VIOLATION_FIELDS:
+                return details
+            code = intern(violation['code'])
+            explanation = violation['code_explanation']
+            shared = self.code_book.register(code, explanation)
+            violations.append(Violation(
+                code, violation['inspector_comments'],
+                None if shared else explanation, shared
+            ))
+        return ViolationDetails(
+            intern(details['inspection_date']), details['facility_information'], tuple(violations)
+        )
+
+    def record(self, row):
+        """
+        Compact one scraped row.
+
+        Args:
+            row: Row dictionary as produced by the scrapers
+
+        Returns:
+            Establishment, or the row itself if it does not have the grid row shape
+        """
+        if not isinstance(row, dict):
+            return row
+        # Older output has past_inspections: null; it is kept as None
+        past = row.get(PAST_KEY)
+        if past is not None:
+            if not isinstance(past, list) or any(
+                not isinstance(entry, dict) or tuple(entry) != PAST_FIELDS for entry in past
+            ):
+                return row
+            past = tuple(
+                Inspection(
+                    intern(entry['inspection_date']), intern(entry['inspection_type']),
+                    intern(entry['compliance']), intern(entry['violations']),
+                    self.details(entry[DETAILS_KEY])
+                )
+                for entry in past
+            )
+        columns = tuple(
+            value if key in FREE_TEXT_COLUMNS else intern(value)
+            for key, value in row.items() if key not in (DETAILS_KEY, PAST_KEY)
+        )
+        return Establishment(self._keys(row), columns, self.details(row.get(DETAILS_KEY)), past)
+
+    def expand(self, record):
+        """Turn a compact record back into its row dictionary."""
+        return record.to_dict(self.code_book) if isinstance(record, Establishment) else record
+
+
+class CompactSink:
+    """
+    Thread-safe in-memory result sink that keeps rows as compact records.
+
+    A drop-in for parallel_crawl.ResultSink when a whole crawl is held in
+    memory; iterating yields the original row dictionaries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compactor = RecordCompactor()
+        self.records = []
+
+    def write(self, row):
+        """Add one row."""
+        record = self.compactor.record(row)
+        with self._lock:
+            self.records.append(record)
+
+    def add(self, rows):
+        """Add one page worth of rows."""
+        records = [self.compactor.record(row) for row in rows]
+        with self._lock:
+            self.records.extend(records)
+
+    def __iter__(self):
+        with self._lock:
+            records = list(self.records)
+        return (self.compactor.expand(record) for record in records)
+
+    def __len__(self):
+        with self._lock:
+            return len(self.records)
+
+    def dump_json(self, path, indent=4):
+        """Write every row to path as the indented JSON array the scrapers produce."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(list(self), f, indent=indent)
+
+
+def measure(path):
+    """
+    Compare the memory held by an NDJSON file's rows as dictionaries and as compact records.
+
+    Returns:
+        Tuple of (bytes as dictionaries, bytes as compact records)
+    """
+    import ndjson_sink
+
+    tracemalloc.start()
+    rows = list(ndjson_sink.iter_records(path))
+    as_dicts = tracemalloc.get_traced_memory()[0]
+    del rows
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    sink = CompactSink()
+    for row in ndjson_sink.iter_records(path):
+        sink.write(row)
+    as_records = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return as_dicts, as_records
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    dicts, compact = measure(sys.argv[1])
+    print(f"Dictionaries: {dicts / (1 << 20):.1f} MB, compact records: {compact / (1 << 20):.1f} MB "
+          f"({dicts / compact if compact else 0:.1f}x smaller)")
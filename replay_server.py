@@ -0,0 +1,381 @@
+"""
+Replay Server
+Local stand-in for the public inspection search page, built from the saved
+index.html snapshot, so crawls can be tested and timed without touching
+foodsafety.kda.ks.gov.
+
+The results grid is synthetic: its data rows are copies of the snapshot's
+rows, renamed so every record is unique, and the grid size, pager window
+and response latencies are configurable. Grid paging and violation popups
+and inspection report buttons are answered like the real WebForms page
+(reports are small generated PDFs); the current page number is kept
+in __VIEWSTATE, so the server itself is stateless. External scripts are
+left out and a small shim stands in for the WebForms and colorbox
+functions the scrapers rely on, so a browser can drive the page too.
+
+Usage:
+    python replay_server.py --port 8765 --pages 34 --popup-latency 0.05
+    python main.py --backend http --url http://127.0.0.1:8765/PublicInspectionSearch.aspx
+"""
+
+import argparse
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from lxml import html
+
+from page_parser import DATA_ROW_CLASSES, VIOLATIONS_PREFIX, get_grid
+
+GRID_TARGET = 'ctl00$MainContent$gvInspections'
+VIEWSTATE_RE = re.compile(r'^replay-(\d+)-')
+ROW_INDEX_RE = re.compile(r'(MainContent_gvInspections_(?:lnkViolations|btnInspectionReport|lnkPastInspections|gvPastInspections))_\d+')
+ROW_CONTROL_RE = re.compile(r'(ctl00\$MainContent\$gvInspections\$)ctl\d+')
+EXTERNAL_SCRIPT_RE = re.compile(r'<script[^>]*src="(?:https?:)?//[^"]*"[^>]*>\s*</script>')
+SAMPLE_CODES = [
+    ('2-301.14', 'When to wash hands.'),
+    ('3-501.16', 'Time/temperature control for safety food, hot and cold holding.'),
+    ('4-601.11', 'Equipment, food-contact surfaces, nonfood-contact surfaces, and utensils.'),
+    ('6-501.12', 'Cleaning, frequency and restrictions.'),
+    ('3-302.11', 'Packaged and unpackaged food - separation, packaging, and segregation.')
+]
+
+# Stand-ins for WebResource.axd, jQuery and colorbox: just enough for the
+# scrapers' postbacks, popup waits and close button to work in a browser.
+SHIM_SCRIPT = """<script type="text/javascript">
+function WebForm_PostBackOptions(eventTarget, eventArgument) {
+    this.eventTarget = eventTarget;
+    this.eventArgument = eventArgument;
+}
+function WebForm_DoPostBackWithOptions(options) {
+    __doPostBack(options.eventTarget, options.eventArgument);
+}
+function lnkViolations_OnClientClick() {}
+function lnkPastInspections_OnClientClick() {}
+function btnInspectionReport_OnClientClick() {}
+function BlockElement() {}
+var jQueryShim = new Proxy(function () {}, {
+    get: function () { return jQueryShim; },
+    apply: function () { return jQueryShim; }
+});
+window.$ = window.jQuery = jQueryShim;
+</script>
+"""
+
+COLORBOX_SCRIPT = """<script type="text/javascript">
+(function () {
+    var popup = document.getElementById('tbPublicInspectionMain');
+    var box = document.createElement('div');
+    var content = document.createElement('div');
+    var close = document.createElement('button');
+    box.id = 'colorbox';
+    content.id = 'cboxLoadedContent';
+    close.id = 'cboxClose';
+    close.type = 'button';
+    close.onclick = function () { box.style.display = 'none'; };
+    content.appendChild(popup);
+    box.appendChild(content);
+    box.appendChild(close);
+    document.body.appendChild(box);
+})();
+</script>
+"""
+
+
+class ReplayStats:
+    """Thread-safe counters of what the replay server has answered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all counters."""
+        with self._lock:
+            self.requests = 0
+            self.grid_pages = 0
+            self.popups = 0
+            self.reports = 0
+            self.popup_latencies = []
+
+    def record(self, kind, elapsed):
+        """Count one answered request of kind 'grid', 'popup', 'report' or 'other'."""
+        with self._lock:
+            self.requests += 1
+            if kind == 'grid':
+                self.grid_pages += 1
+            elif kind == 'popup':
+                self.popups += 1
+                self.popup_latencies.append(elapsed)
+            elif kind == 'report':
+                self.reports += 1
+
+    def summary(self):
+        """Return the counters and popup latency percentiles in milliseconds."""
+        with self._lock:
+            latencies = sorted(self.popup_latencies)
+            stats = {'requests': self.requests, 'grid_pages': self.grid_pages, 'popups': self.popups,
+                     'reports': self.reports}
+        for name, pct in (('p50', 50), ('p90', 90), ('p99', 99)):
+            stats[f'popup_{name}_ms'] = (
+                round(latencies[min(len(latencies) - 1, len(latencies) * pct // 100)] * 1000, 2)
+                if latencies else None
+            )
+        return stats
+
+
+class ReplaySite:
+    """
+    Renders synthetic result pages and popups from the index.html snapshot.
+
+    Args:
+        snapshot: Saved search page with a results grid
+        pages: Number of result pages
+        rows_per_page: Data rows per page
+        pager_window: Page links shown in the pager, like the site's 20
+        popup_latency: Seconds to wait before answering a violations popup
+        page_latency: Seconds to wait before answering any other request
+    """
+
+    def __init__(self, snapshot='index.html', pages=34, rows_per_page=15, pager_window=20,
+                 popup_latency=0.0, page_latency=0.0):
+        self.pages = pages
+        self.rows_per_page = rows_per_page
+        self.pager_window = pager_window
+        self.popup_latency = popup_latency
+        self.page_latency = page_latency
+        self.stats = ReplayStats()
+        self._build_templates(snapshot)
+
+    def _build_templates(self, snapshot):
+        doc = html.parse(snapshot).getroot()
+        grid = get_grid(doc)
+        container = grid.find('tbody') if grid.find('tbody') is not None else grid
+
+        self.row_templates = []
+        for row in list(container):
+            if row.get('class') in DATA_ROW_CLASSES:
+                name_cell = row.find('td')
+                name_cell.text = f"{' '.join((name_cell.text or '').split())} #@@REC@@"
+                markup = html.tostring(row, encoding='unicode')
+                markup = ROW_INDEX_RE.sub('\\1_@@IDX@@', markup)
+                markup = ROW_CONTROL_RE.sub('\\1ctl@@CTL@@', markup)
+                self.row_templates.append(markup)
+            if row.get('class') in DATA_ROW_CLASSES or row.get('class') == 'GridPager':
+                container.remove(row)
+        container.append(html.fromstring('<tr id="replay-rows"><td></td></tr>'))
+
+        for summary in doc.xpath('//span[@class="summaryRow"]'):
+            for child in list(summary):
+                summary.remove(child)
+            summary.text = '@@SUMMARY@@'
+        for viewstate in doc.xpath('//input[@name="__VIEWSTATE"]'):
+            self.viewstate = viewstate.get('value', '')
+            viewstate.set('value', '@@VIEWSTATE@@')
+        header = doc.xpath(f'//*[@id="{VIOLATIONS_PREFIX}_lblHeader"]')[0]
+        header.text = '@@POPUP_HEADER@@'
+        facility = doc.xpath(f'//*[@id="{VIOLATIONS_PREFIX}_lblFacilityInformation"]')[0]
+        facility.text = '@@POPUP_FACILITY@@'
+        violations = doc.xpath('//table[@id="tbPublicInspectionMain"]//div[@class="inputFormGroup"]')[-1]
+        violations.text = '@@POPUP_VIOLATIONS@@'
+
+        markup = html.tostring(doc, encoding='unicode', doctype='<!DOCTYPE html>')
+        markup = EXTERNAL_SCRIPT_RE.sub('', markup)
+        markup = markup.replace('</head>', SHIM_SCRIPT + '</head>', 1)
+        markup = markup.replace('</body>', '@@COLORBOX@@</body>', 1)
+        before, after = re.split(r'<tr id="replay-rows">.*?</tr>', markup, maxsplit=1, flags=re.S)
+        self.page_head, self.page_tail = before, after
+
+    def _row(self, page_num, index):
+        record = (page_num - 1) * self.rows_per_page + index + 1
+        return (self.row_templates[index % len(self.row_templates)]
+                .replace('@@REC@@', str(record))
+                .replace('@@IDX@@', str(index))
+                .replace('@@CTL@@', f'{index + 2:02d}'))
+
+    def _pager(self, page_num):
+        first = (page_num - 1) // self.pager_window * self.pager_window + 1
+        last = min(first + self.pager_window - 1, self.pages)
+
+        def link(page, text):
+            return (f'<td><a href="javascript:__doPostBack(\'{GRID_TARGET}\',\'Page${page}\')">'
+                    f'{text}</a></td>')
+
+        cells = [link(first - 1, '...')] if first > 1 else []
+        for page in range(first, last + 1):
+            cells.append(f'<td><span>{page}</span></td>' if page == page_num else link(page, page))
+        if last < self.pages:
+            cells.append(link(last + 1, '...'))
+        return (f'<tr class="GridPager"><td colspan="7"><table><tbody><tr>'
+                f'{"".join(cells)}</tr></tbody></table></td></tr>')
+
+    def _popup(self, page_num, target):
+        seed = zlib.crc32(f'{page_num}:{target}'.encode())
+        count = 1 + seed % 4
+        parts = []
+        for i in range(count):
+            code, explanation = SAMPLE_CODES[(seed + i) % len(SAMPLE_CODES)]
+            parts.append(
+                f'<span id="{VIOLATIONS_PREFIX}_rptViolations_lblRegulatorCodeType_{i}">{code}</span>'
+                f'<div id="{VIOLATIONS_PREFIX}_rptViolations_pnlCodeExplanation_{i}">'
+                f'<div><div>{explanation}</div></div></div>'
+                f'<div id="{VIOLATIONS_PREFIX}_rptViolations_pnlComments_{i}">'
+                f'<b>Inspector Comments</b> Observed on replay page {page_num}, item {i + 1}.</div>'
+            )
+        return "".join(parts)
+
+    def _report(self, page_num, button):
+        # A few KB of text behind a PDF header, unique per page and button
+        seed = zlib.crc32(f'{page_num}:{button}'.encode())
+        lines = [f'Replay inspection report, page {page_num}, {button}'] * (50 + seed % 200)
+        return '%PDF-1.4\n' + '\n'.join(lines) + '\n%%EOF\n'
+
+    def render(self, page_num, popup_target=None):
+        """
+        Render a full result page, optionally with a violations popup open.
+
+        Args:
+            page_num: Result page to show
+            popup_target: Event target of the lnkViolations link that was clicked
+
+        Returns:
+            Page HTML
+        """
+        first = (page_num - 1) * self.rows_per_page
+        count = max(0, min(self.rows_per_page, self.pages * self.rows_per_page - first))
+        rows = "".join(self._row(page_num, i) for i in range(count)) + self._pager(page_num)
+        page = (self.page_head + rows + self.page_tail) \
+            .replace('@@SUMMARY@@', f'{self.pages * self.rows_per_page} record(s) found.') \
+            .replace('@@VIEWSTATE@@', f'replay-{page_num}-{self.viewstate}')
+        if popup_target:
+            return page \
+                .replace('@@POPUP_HEADER@@', 'Inspection Violations: 02/06/2025') \
+                .replace('@@POPUP_FACILITY@@', f'Replay facility for {popup_target}') \
+                .replace('@@POPUP_VIOLATIONS@@', self._popup(page_num, popup_target)) \
+                .replace('@@COLORBOX@@', COLORBOX_SCRIPT)
+        return page \
+            .replace('@@POPUP_HEADER@@', '') \
+            .replace('@@POPUP_FACILITY@@', '') \
+            .replace('@@POPUP_VIOLATIONS@@', '') \
+            .replace('@@COLORBOX@@', '')
+
+    def respond(self, form):
+        """
+        Answer a form post the way the WebForms page would.
+
+        Args:
+            form: Posted fields, one value per name
+
+        Returns:
+            Tuple of (status, kind, body) where kind is 'grid', 'popup', 'report' or 'other'
+        """
+        match = VIEWSTATE_RE.match(form.get('__VIEWSTATE', ''))
+        page_num = int(match.group(1)) if match else 1
+        target = form.get('__EVENTTARGET', '')
+        argument = form.get('__EVENTARGUMENT', '')
+
+        if target == GRID_TARGET and argument.startswith('Page$'):
+            new_page = int(argument[len('Page$'):])
+            first = (page_num - 1) // self.pager_window * self.pager_window + 1
+            last = min(first + self.pager_window - 1, self.pages)
+            if not (max(1, first - 1) <= new_page <= min(self.pages, last + 1)):
+                # The real page fails event validation for links it did not render
+                return 500, 'other', f'Invalid postback argument Page${new_page}'
+            return 200, 'grid', self.render(new_page)
+        reports = [name[:-len('.x')] for name in form if name.endswith('$btnInspectionReport.x')]
+        if reports:
+            return 200, 'report', self._report(page_num, reports[0])
+        if target.endswith('$lnkViolations'):
+            return 200, 'popup', self.render(page_num, target)
+        if 'ctl00$MainContent$btnSearch' in form:
+            return 200, 'grid', self.render(1)
+        return 200, 'grid', self.render(page_num)
+
+
+def make_handler(site):
+    """Build a request handler class bound to site."""
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            start = time.perf_counter()
+            path = self.path.split('?', 1)[0]
+            if path.endswith(('.js', '.axd')):
+                self._send(200, '', 'application/javascript')
+                kind = 'other'
+            elif path.endswith(('.css', '.png', '.gif', '.jpg', '.ico')):
+                self._send(404, '')
+                kind = 'other'
+            else:
+                time.sleep(site.page_latency)
+                self._send(200, site.render(1))
+                kind = 'grid'
+            site.stats.record(kind, time.perf_counter() - start)
+
+        def do_POST(self):
+            start = time.perf_counter()
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            form = {name: values[0] for name, values in parse_qs(body, keep_blank_values=True).items()}
+            status, kind, page = site.respond(form)
+            time.sleep(site.popup_latency if kind == 'popup' else site.page_latency)
+            self._send(status, page, 'application/pdf' if kind == 'report' else 'text/html; charset=utf-8')
+            site.stats.record(kind, time.perf_counter() - start)
+
+        def _send(self, status, body, content_type='text/html; charset=utf-8'):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return ReplayHandler
+
+
+def start_server(site, host='127.0.0.1', port=0):
+    """
+    Serve site from a background thread.
+
+    Args:
+        site: ReplaySite to serve
+        host: Interface to bind
+        port: Port to bind; 0 picks a free one
+
+    Returns:
+        Tuple of (server, search page URL); call server.shutdown() to stop
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}/FoodSafety/Web/Inspection/PublicInspectionSearch.aspx"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local replay of the inspection search page.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--snapshot', default='index.html', help="Saved search page with a results grid")
+    parser.add_argument('--pages', type=int, default=34, help="Number of result pages")
+    parser.add_argument('--rows-per-page', type=int, default=15)
+    parser.add_argument('--pager-window', type=int, default=20, help="Page links shown in the pager")
+    parser.add_argument('--popup-latency', type=float, default=0.0, help="Seconds before a popup is answered")
+    parser.add_argument('--page-latency', type=float, default=0.0, help="Seconds before a grid page is answered")
+    args = parser.parse_args()
+
+    replay = ReplaySite(args.snapshot, args.pages, args.rows_per_page, args.pager_window,
+                        args.popup_latency, args.page_latency)
+    httpd, search_url = start_server(replay, args.host, args.port)
+    print(f"Serving {args.pages} pages of {args.rows_per_page} rows at {search_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
+        print(replay.stats.summary())
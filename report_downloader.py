@@ -0,0 +1,372 @@
+"""
+Inspection Report Downloader
+Bulk-downloads the inspection report PDFs behind the grid's
+btnInspectionReport buttons, for each row's current inspection and for
+every past inspection listed with it.
+
+The grid is walked over HTTP. Each page's report buttons are queued with
+that page's form state, and a bounded pool of workers fetches them while
+the walker moves on. Each worker has its own connection. Bodies are streamed
+to disk in chunks and stored under the SHA-256 of their bytes, so a report
+is kept once however many rows link to it:
+
+    <out>/objects/ab/abcdef...pdf    report files, named by content hash
+    <out>/manifest.ndjson            one line per downloaded report
+
+The manifest records each report's establishment, inspection date and type
+with its file. Re-runs skip reports that are listed in it and still on
+disk, so an interrupted download picks up where it stopped.
+
+Usage:
+    python report_downloader.py --out reports --workers 4
+    python report_downloader.py --out reports --pages 1-20 --url http://127.0.0.1:8765/PublicInspectionSearch.aspx
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import http_backend
+import metrics
+import ndjson_sink
+import page_parser
+import pager
+import parallel_crawl
+import resilience
+from metrics import METRICS
+
+CHUNK_SIZE = 1 << 16
+PDF_MAGIC = b'%PDF'
+
+log = logging.getLogger(__name__)
+
+
+class ReportError(ValueError):
+    """The site answered a report button with something other than a PDF."""
+
+
+def report_id(trade_name, map_address, inspection_date, inspection_type):
+    """
+    Build a stable ID for one inspection's report.
+
+    Returns:
+        Hex digest identifying the establishment's inspection
+    """
+    key = "\x1f".join((trade_name, map_address, inspection_date, inspection_type))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def report_targets(source, headers=None):
+    """
+    List the inspection reports linked from a grid page.
+
+    Args:
+        source: Page HTML or parsed document with a results grid
+        headers: Header names used as row keys; read from the grid if omitted
+
+    Returns:
+        List of dictionaries with the report 'id', the 'button' form name,
+        'trade_name', 'map_address', 'inspection_date', 'inspection_type'
+        and 'current' (False for past inspections)
+    """
+    targets = []
+    for row_data, row_info in page_parser.parse_grid_rows(source, headers):
+        inspections = [(
+            row_info['report_button'], row_data.get('Most Recent Inspection', ''),
+            row_data.get('Inspection Type', ''), True
+        )]
+        inspections += [
+            (past['report_button'], past['inspection_date'], past['inspection_type'], False)
+            for past in row_info['past_inspections']
+        ]
+        for button, inspection_date, inspection_type, current in inspections:
+            if not button:
+                continue
+            targets.append({
+                'id': report_id(row_info['trade_name'], row_info['map_address'], inspection_date, inspection_type),
+                'button': button,
+                'trade_name': row_info['trade_name'],
+                'map_address': row_info['map_address'],
+                'inspection_date': inspection_date,
+                'inspection_type': inspection_type,
+                'current': current
+            })
+    return targets
+
+
+class ReportStore:
+    """Content-addressed directory of report files."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+
+    def relative_path(self, digest):
+        return os.path.join('objects', digest[:2], f'{digest}.pdf')
+
+    def exists(self, relative_path):
+        return os.path.exists(os.path.join(self.directory, relative_path))
+
+    def save(self, response, chunk_size=CHUNK_SIZE):
+        """
+        Stream a response body to disk under the hash of its bytes.
+
+        Args:
+            response: Streaming requests.Response of a report button
+
+        Returns:
+            Tuple of (sha256 digest, size in bytes, relative path, True if
+            the same bytes were already stored)
+
+        Raises:
+            ReportError: If the body is not a PDF, e.g. an error page
+        """
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.directory, f'download.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size):
+                    if size == 0 and not chunk.startswith(PDF_MAGIC):
+                        raise ReportError(
+                            f"Expected a PDF, got {response.headers.get('Content-Type', 'no content type')}"
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            if size == 0:
+                raise ReportError("Empty report")
+            relative_path = self.relative_path(digest.hexdigest())
+            path = os.path.join(self.directory, relative_path)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest.hexdigest(), size, relative_path, duplicate
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class ReportManifest:
+    """Thread-safe, append-only record of downloaded reports."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            for entry in ndjson_sink.iter_records(path):
+                self.entries[entry['id']] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def get(self, rid):
+        with self._lock:
+            return self.entries.get(rid)
+
+    def add(self, entry):
+        """Record one downloaded report and flush it to disk at once."""
+        with self._lock:
+            self.entries[entry['id']] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ReportDownloader:
+    """
+    Bounded pool of report downloads fed page by page.
+
+    Args:
+        directory: Output directory for the report files and manifest
+        url: Search page URL the buttons post to
+        workers: Concurrent downloads
+        rate_limiter: Optional parallel_crawl.RateLimiter shared with the page walker
+        retries: Optional resilience.Resilience the downloads run under
+        queue_size: Downloads that may wait for a worker before submit_page blocks
+        chunk_size: Bytes read from the network per write
+    """
+
+    def __init__(self, directory, url=http_backend.SEARCH_URL, workers=4, rate_limiter=None, retries=None,
+                 queue_size=None, chunk_size=CHUNK_SIZE):
+        self.url = url
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.store = ReportStore(directory)
+        self.manifest = ReportManifest(os.path.join(directory, 'manifest.ndjson'))
+        self.counts = {'downloaded': 0, 'duplicate': 0, 'skipped': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._local = threading.local()
+        self._clients = []
+        self._slots = threading.BoundedSemaphore(queue_size or workers * 4)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+
+    def _client(self):
+        # requests sessions are not shared between threads, so each worker gets its own
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = http_backend.WebFormsClient(url=self.url, rate_limiter=self.rate_limiter)
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _count(self, result, amount=1):
+        with self._lock:
+            self.counts[result] += amount
+        METRICS.increment('reports_total', amount, result=result)
+
+    def is_done(self, rid):
+        """Return True if the report is in the manifest and its file is on disk."""
+        entry = self.manifest.get(rid)
+        return entry is not None and self.store.exists(entry['path'])
+
+    def submit_page(self, doc, fields, page_num=None):
+        """
+        Queue every report of a grid page that is not downloaded yet.
+
+        Blocks while the download queue is full.
+
+        Args:
+            doc: Parsed grid page
+            fields: WebForms fields of that page
+            page_num: Page number, recorded in the manifest
+
+        Returns:
+            Number of reports queued
+        """
+        queued = 0
+        skipped = 0
+        for target in report_targets(doc):
+            with self._lock:
+                seen = target['id'] in self._queued
+                self._queued.add(target['id'])
+            if seen or self.is_done(target['id']):
+                skipped += 1
+                continue
+            self._slots.acquire()
+            self._pool.submit(self._download, target, dict(fields), page_num)
+            queued += 1
+        if skipped:
+            self._count('skipped', skipped)
+        return queued
+
+    def _fetch(self, target, fields):
+        response = self._client().open_report(target['button'], fields)
+        try:
+            return self.store.save(response, self.chunk_size)
+        finally:
+            response.close()
+
+    def _download(self, target, fields, page_num):
+        try:
+            with METRICS.timer('report_download'):
+                if self.retries:
+                    digest, size, path, duplicate = self.retries.call(self.url, self._fetch, target, fields)
+                else:
+                    digest, size, path, duplicate = self._fetch(target, fields)
+            entry = {key: value for key, value in target.items() if key != 'button'}
+            entry.update({
+                'sha256': digest,
+                'size': size,
+                'path': path,
+                'page': page_num,
+                'downloaded_at': datetime.datetime.now().isoformat(timespec='seconds')
+            })
+            self.manifest.add(entry)
+            self._count('duplicate' if duplicate else 'downloaded')
+            METRICS.increment('report_bytes_total', size)
+            log.debug("Saved report of %s (%s) to %s", target['trade_name'], target['inspection_date'], path)
+        except Exception as e:
+            self._count('failed')
+            log.warning("Report of %s (%s) failed: %s", target['trade_name'], target['inspection_date'], e)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Wait for queued downloads, then close connections and the manifest."""
+        self._pool.shutdown(wait=True)
+        for client in self._clients:
+            client.session.close()
+        self.manifest.close()
+
+    def print_summary(self):
+        """Print what happened to the reports seen."""
+        counts = self.counts
+        print(f"Reports: {counts['downloaded']} downloaded, {counts['duplicate']} identical to a stored file, "
+              f"{counts['skipped']} already done, {counts['failed']} failed; "
+              f"{len(self.manifest.entries)} in {self.manifest.path}")
+
+
+def download_reports(directory, url=http_backend.SEARCH_URL, workers=4, requests_per_second=2.0,
+                     first_page=1, last_page=None, slow_latency=5.0):
+    """
+    Walk the result pages and download every inspection report they link.
+
+    Args:
+        directory: Output directory for the report files and manifest
+        url: Search page URL
+        workers: Concurrent downloads
+        requests_per_second: Per-host request budget shared by pages and downloads
+        first_page: First result page to take reports from
+        last_page: Last result page; defaults to the final one
+        slow_latency: Seconds per request above which concurrency is reduced
+
+    Returns:
+        The ReportDownloader, with its counts
+    """
+    rate_limiter = parallel_crawl.RateLimiter(requests_per_second)
+    retries = resilience.Resilience(
+        limiter=resilience.AdaptiveLimiter(initial=workers + 1, maximum=workers + 1, slow_latency=slow_latency)
+    )
+    session = http_backend.HttpPageSession(
+        url=url, rate_limiter=rate_limiter, resilience=retries, navigator=pager.PageNavigator()
+    )
+    downloader = ReportDownloader(directory, url, workers, rate_limiter, retries)
+    try:
+        session.open()
+        if session.headers is None:
+            print("The search matched nothing")
+            return downloader
+        last_page = last_page or session.total_pages()
+        session.seek(first_page)
+        while True:
+            queued = downloader.submit_page(session.client.doc, session.form_state(), session.page_num)
+            log.info("Page %d: queued %d reports", session.page_num, queued)
+            if session.page_num >= last_page or not session.next_page():
+                break
+    finally:
+        session.close()
+        downloader.close()
+        downloader.print_summary()
+        retries.print_summary()
+    return downloader
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the inspection report PDFs of the search results.")
+    parser.add_argument('--out', default='reports', help="Directory for report files and the manifest")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent downloads")
+    parser.add_argument('--rate', type=float, default=2.0, help="Requests per second per host (0 = unlimited)")
+    parser.add_argument('--pages', type=pager.page_range, default=(1, None), metavar='FIRST-LAST',
+                        help="Result pages to take reports from, e.g. 1-20 or 40-")
+    parser.add_argument('--url', default=http_backend.SEARCH_URL, help="Search page URL")
+    parser.add_argument('--log-level', choices=metrics.LOG_LEVELS, default='info')
+    args = parser.parse_args()
+    metrics.configure_logging(args.log_level)
+
+    first, last = args.pages
+    download_reports(args.out, args.url, max(1, args.workers), args.rate, first, last)
+    METRICS.print_summary()
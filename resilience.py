@@ -0,0 +1,329 @@
+"""
+Network Resilience
+Retries, backoff, a circuit breaker and adaptive concurrency for every
+request the crawlers send, so a slow or flaky site makes a crawl slower
+instead of shorter.
+
+    RetryPolicy        exponential backoff with full jitter for one class of errors
+    CircuitBreaker     stops all traffic to a host for a while once it keeps failing
+    AdaptiveLimiter    AIMD cap on concurrent requests, lowered when latency rises
+    Resilience         runs a call under all three, shared by every session of a crawl
+
+Errors are sorted into classes (connection errors, timeouts, server errors,
+throttling, browser errors), and each class has its own retry policy. Client
+errors and anything unrecognised are raised at once, because retrying will
+not fix them.
+"""
+
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from selenium.common.exceptions import (
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException
+)
+
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+
+class CrawlTruncated(RuntimeError):
+    """The pager ran out before the page the crawl expected to reach."""
+
+
+class CircuitOpen(RuntimeError):
+    """The circuit breaker gave up waiting for a failing host to recover."""
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempts: Total tries, including the first
+        base_delay: Delay ceiling before the first retry, in seconds
+        max_delay: Upper bound for any delay
+        multiplier: Growth of the ceiling per retry
+    """
+
+    def __init__(self, attempts=4, base_delay=1.0, max_delay=60.0, multiplier=2.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, retry):
+        """Return a random delay for the given retry (1 for the first)."""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** (retry - 1))
+        return random.uniform(0, ceiling)
+
+
+# Retry policy per error class; classes missing here are not retried
+POLICIES = {
+    'connection': RetryPolicy(attempts=6, base_delay=2.0),
+    'timeout': RetryPolicy(attempts=5, base_delay=2.0),
+    'server': RetryPolicy(attempts=5, base_delay=4.0),
+    'throttled': RetryPolicy(attempts=8, base_delay=10.0, max_delay=300.0),
+    'stale': RetryPolicy(attempts=4, base_delay=0.5, max_delay=5.0),
+    'browser': RetryPolicy(attempts=3, base_delay=2.0),
+}
+# Classes that count against the host's circuit breaker
+HOST_FAILURES = {'connection', 'timeout', 'server', 'throttled'}
+
+
+def classify(error):
+    """
+    Sort an exception into an error class.
+
+    Returns:
+        One of the POLICIES keys, 'client' for HTTP 4xx, or None if unknown
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429 or status == 503:
+            return 'throttled'
+        return 'server' if status >= 500 else 'client'
+    if isinstance(error, (requests.Timeout, TimeoutException)):
+        return 'timeout'
+    if isinstance(error, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return 'connection'
+    if isinstance(error, StaleElementReferenceException):
+        return 'stale'
+    if isinstance(error, WebDriverException):
+        return 'browser'
+    return None
+
+
+def retry_after(error):
+    """Return the Retry-After delay of a throttled response in seconds, or None."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    Thread-safe breaker for one host.
+
+    After failure_threshold failures in a row the circuit opens and every
+    caller waits for reset_timeout. Then one trial request is let through:
+    success closes the circuit, failure opens it again for twice as long
+    (up to max_reset_timeout).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=600.0):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.opens = 0
+        self._condition = threading.Condition()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.trial_running else 'open'
+
+    def before_call(self, max_wait=None):
+        """
+        Block while the circuit is open.
+
+        Raises:
+            CircuitOpen: If the circuit stays open longer than max_wait seconds
+        """
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        with self._condition:
+            while self.opened_at is not None:
+                reopen_at = self.opened_at + self.reset_timeout
+                now = time.monotonic()
+                if now >= reopen_at and not self.trial_running:
+                    self.trial_running = True
+                    return
+                if deadline is not None and now >= deadline:
+                    raise CircuitOpen(f"Circuit still open after {max_wait:.0f}s")
+                wait = reopen_at - now if now < reopen_at else 1.0
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+                self._condition.wait(max(wait, 0.01))
+
+    def record_success(self):
+        with self._condition:
+            if self.opened_at is not None:
+                log.info("Circuit closed: host is answering again")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+            self.reset_timeout = self.base_reset_timeout
+            self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            self.failures += 1
+            if self.trial_running:
+                self.trial_running = False
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self.opened_at = time.monotonic()
+                log.warning("Circuit re-opened: pausing for %.0fs", self.reset_timeout)
+            elif self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.opens += 1
+                log.warning("Circuit opened after %d failures: pausing for %.0fs", self.failures, self.reset_timeout)
+            self._condition.notify_all()
+
+
+class AdaptiveLimiter:
+    """
+    Thread-safe concurrency cap that adapts to latency (AIMD).
+
+    The limit grows by one after each window of fast, successful calls
+    and is halved when a call fails or takes longer than slow_latency.
+
+    Args:
+        initial: Starting limit
+        minimum: Lowest limit
+        maximum: Highest limit
+        slow_latency: Seconds above which a call counts as slow
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, slow_latency=5.0):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.slow_latency = slow_latency
+        self.in_flight = 0
+        self.decreases = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, ok=True):
+        with self._condition:
+            self.in_flight -= 1
+            if not ok or (latency is not None and latency > self.slow_latency):
+                if self.limit > self.minimum:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self.decreases += 1
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class Resilience:
+    """
+    Runs network calls under retries, per-host circuit breakers and an adaptive limiter.
+
+    One instance is shared by every session of a crawl, so all of them
+    back off together when the site struggles.
+
+    Args:
+        policies: Error class -> RetryPolicy; defaults to POLICIES
+        limiter: AdaptiveLimiter, or None to leave concurrency alone
+        failure_threshold: Consecutive host failures that open a circuit
+        reset_timeout: Seconds an open circuit pauses traffic before a trial call
+        max_pause: Seconds a call may wait on an open circuit before giving up
+    """
+
+    def __init__(self, policies=None, limiter=None, failure_threshold=5, reset_timeout=30.0, max_pause=1800.0):
+        self.policies = dict(POLICIES if policies is None else policies)
+        self.limiter = limiter
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_pause = max_pause
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.retries = {}
+        self.failures = {}
+
+    def breaker(self, url):
+        """Return the circuit breaker of url's host."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _count(self, counter, error_class):
+        with self._lock:
+            counter[error_class] = counter.get(error_class, 0) + 1
+        name = 'retries_total' if counter is self.retries else 'failures_total'
+        METRICS.increment(name, error_class=error_class)
+
+    def call(self, url, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs), retrying errors whose class has a policy.
+
+        Args:
+            url: URL the call talks to; picks the circuit breaker
+
+        Returns:
+            Whatever function returns
+
+        Raises:
+            The last error once its policy runs out of attempts, any error
+            without a policy straight away, or CircuitOpen
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call(self.max_pause)
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                error_class = classify(error)
+                if error_class == 'timeout':
+                    METRICS.increment('timeouts_total', source='request')
+                if self.limiter:
+                    self.limiter.release(time.monotonic() - start, ok=False)
+                if error_class in HOST_FAILURES:
+                    breaker.record_failure()
+                elif breaker.trial_running:
+                    breaker.record_success()  # The host answered; the error is ours
+                policy = self.policies.get(error_class)
+                if policy is None or attempt >= policy.attempts:
+                    self._count(self.failures, error_class or type(error).__name__)
+                    raise
+                self._count(self.retries, error_class)
+                delay = max(policy.delay(attempt), retry_after(error) or 0)
+                log.warning("%s error (%s), retry %d in %.1fs", error_class, type(error).__name__, attempt, delay)
+                time.sleep(delay)
+                continue
+            if self.limiter:
+                self.limiter.release(time.monotonic() - start)
+            breaker.record_success()
+            return result
+
+    def print_summary(self):
+        """Print retries, failures, circuit openings and the final concurrency limit."""
+        opens = sum(breaker.opens for breaker in self._breakers.values())
+        retries = ", ".join(f"{name} {count}" for name, count in sorted(self.retries.items())) or "none"
+        failures = ", ".join(f"{name} {count}" for name, count in sorted(self.failures.items())) or "none"
+        line = f"Resilience: retries {retries}; gave up on {failures}; circuit opened {opens} times"
+        if self.limiter:
+            line += f"; concurrency limit {self.limiter.limit} ({self.limiter.decreases} decreases)"
+        print(line)
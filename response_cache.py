@@ -0,0 +1,245 @@
+"""
+HTTP Response Cache
+On-disk cache of fetched grid pages and violation popups, so development
+re-runs against the site (or a replay server) do not download the same pages
+again.
+
+Bodies are stored content-addressed: each one is written once, under the
+SHA-256 of its bytes, and an SQLite index maps request keys (method, URL
+and posted form fields) to bodies. Requests that return the same bytes share
+one file. Entries expire after a TTL, and once the stored bodies exceed the
+byte budget the least recently used ones are evicted. Bodies are read
+through mmap rather than buffered file reads.
+
+Usage:
+    python main.py --backend http --cache .http_cache --cache-ttl 86400
+    python response_cache.py .http_cache
+    python response_cache.py .http_cache --clear
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES objects(digest),
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_objects_last_access ON objects (last_access);
+CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries (digest);
+"""
+
+
+def request_key(method, url, form=None):
+    """
+    Build the cache key of a request.
+
+    Args:
+        method: 'GET' or 'POST'
+        url: Request URL
+        form: Posted form fields, if any
+
+    Returns:
+        Hex digest identifying the request
+    """
+    parts = [method.upper(), url, sorted((form or {}).items())]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe, size-bounded cache of response bodies.
+
+    Args:
+        directory: Cache directory; created if missing
+        ttl: Seconds an entry stays valid; None keeps entries until evicted
+        max_bytes: Budget for the stored bodies
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=512 << 20):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(
+            os.path.join(directory, 'index.db'), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        self.purge_expired()
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _read(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+
+    def get(self, key):
+        """
+        Look up a cached body.
+
+        Args:
+            key: Key from request_key()
+
+        Returns:
+            Body bytes, or None if the request is not cached or has expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT digest, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            digest = row[0]
+            self.conn.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (now, digest))
+        try:
+            body = self._read(digest)
+        except FileNotFoundError:
+            # Evicted by another thread between the lookup and the read
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def put(self, key, body):
+        """
+        Store a body under a request key, evicting old bodies if over budget.
+
+        Args:
+            key: Key from request_key()
+            body: Response bytes
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        now = time.time()
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            if self.conn.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone():
+                self.conn.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (now, digest))
+            else:
+                self.conn.execute(
+                    "INSERT INTO objects (digest, size, last_access) VALUES (?, ?, ?)",
+                    (digest, len(body), now)
+                )
+                self.total_bytes += len(body)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, digest, stored_at) VALUES (?, ?, ?)",
+                (key, digest, now)
+            )
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _drop_object(self, digest, size):
+        self.conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+        self.conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+        self.total_bytes -= size
+
+    def _evict(self):
+        # Drop least recently used bodies until the cache is back under budget
+        rows = self.conn.execute("SELECT digest, size FROM objects ORDER BY last_access").fetchall()
+        for digest, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._drop_object(digest, size)
+            self.evictions += 1
+
+    def purge_expired(self):
+        """Remove expired entries and the bodies no entry refers to any more."""
+        if self.ttl is None:
+            return
+        with self._lock:
+            self.conn.execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - self.ttl,))
+            orphans = self.conn.execute(
+                """SELECT digest, size FROM objects
+                   WHERE NOT EXISTS (SELECT 1 FROM entries WHERE entries.digest = objects.digest)"""
+            ).fetchall()
+            for digest, size in orphans:
+                self._drop_object(digest, size)
+
+    def clear(self):
+        """Remove every entry and body."""
+        with self._lock:
+            for digest, size in self.conn.execute("SELECT digest, size FROM objects").fetchall():
+                self._drop_object(digest, size)
+
+    def stats(self):
+        """Return entry, body and hit counts."""
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            objects = self.conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+        return {
+            'entries': entries,
+            'objects': objects,
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def print_summary(self):
+        """Print hit rate and size of the cache."""
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        rate = stats['hits'] / lookups * 100 if lookups else 0.0
+        print(f"Response cache: {stats['hits']}/{lookups} hits ({rate:.0f}%), "
+              f"{stats['entries']} entries sharing {stats['objects']} bodies, "
+              f"{stats['bytes'] / (1 << 20):.1f} MB, {stats['evictions']} evicted")
+
+    def close(self):
+        """Close the index database."""
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the HTTP response cache.")
+    parser.add_argument('directory', help="Cache directory")
+    parser.add_argument('--clear', action='store_true', help="Remove every cached response")
+    args = parser.parse_args()
+
+    with ResponseCache(args.directory, ttl=None) as cache:
+        if args.clear:
+            cache.clear()
+            print(f"Cleared {args.directory}")
+        cache.print_summary()
@@ -0,0 +1,96 @@
+"""
+Record Schema
+The one record layout every crawl mode writes, and its conversion to the
+ownerName/tradeName/inspections layout of newmain.py's inspection_data.json.
+
+Each grid row becomes one record:
+
+    "Name / Address", "Most Recent Inspection", "Inspection Type",
+    "Compliance", "Violations", "Current Inspection Report"
+                          grid columns, keyed by their header text
+    trade_name            establishment name and address as the row's markup
+    map_address           separates them; the address keeps its phone on a
+                          second line
+    violation_details     popup of the current inspection, {'error': ...}
+                          if it failed to load, or None without violations
+    past_inspections      inspections listed in the row's history, each with
+                          its own violation_details
+
+A violation_details popup holds 'inspection_date', 'facility_information'
+and 'violations', a list of {'code', 'code_explanation',
+'inspector_comments'}.
+
+Usage:
+    python schema.py food_safety_data.ndjson inspection_data.json    # write the newmain.py layout
+"""
+
+import sys
+
+import ndjson_sink
+from records import DETAILS_KEY, PAST_KEY
+from sqlite_store import grid_establishment
+
+
+def _inspection_entries(inspection_date, inspection_type, details):
+    violations = details.get('violations') if isinstance(details, dict) else None
+    if not violations:
+        entry = {
+            "inspectionGrade": None,
+            "inspectionDate": inspection_date,
+            "inspectionType": inspection_type,
+            "violationDescription": None,
+            "violationCode": None,
+            "inspectionDescription": None
+        }
+        if isinstance(details, dict) and 'error' in details:
+            # The popup failed to load; its violations are unknown, not absent
+            entry["error"] = details['error']
+        return [entry]
+    return [{
+        "inspectionGrade": None,
+        "inspectionDate": inspection_date,
+        "inspectionType": inspection_type,
+        "violationDescription": violation.get('code_explanation'),
+        "violationCode": violation.get('code'),
+        "inspectionDescription": violation.get('inspector_comments')
+    } for violation in violations]
+
+
+def to_inspection_record(row):
+    """
+    Convert a record to newmain.py's layout.
+
+    Every inspection, current and past, contributes one entry per cited
+    violation, or a single entry without violation fields if it had none.
+    An inspection whose popup failed to load gets a single entry carrying
+    the popup's 'error' instead.
+
+    Args:
+        row: Record in the canonical layout
+
+    Returns:
+        Dictionary with 'ownerName', 'tradeName', 'establishmentTypes',
+        'mapAddress' and 'inspections'
+    """
+    trade_name, map_address = grid_establishment(row)
+    inspections = _inspection_entries(
+        row.get("Most Recent Inspection"), row.get("Inspection Type"), row.get(DETAILS_KEY)
+    )
+    for past in row.get(PAST_KEY) or []:
+        inspections += _inspection_entries(
+            past.get('inspection_date'), past.get('inspection_type'), past.get(DETAILS_KEY)
+        )
+    return {
+        "ownerName": None,
+        "tradeName": trade_name,
+        "establishmentTypes": [],
+        "mapAddress": map_address,
+        "inspections": inspections
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    ndjson_sink.compact(sys.argv[1], sys.argv[2], ensure_ascii=False, transform=to_inspection_record)
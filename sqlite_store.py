@@ -0,0 +1,513 @@
+"""
+SQLite Inspection Store
+Normalizes scraped rows into establishment, inspection and violation tables
+so they can be queried without loading a whole JSON dump into memory.
+
+Both output shapes are accepted: the grid rows main.py produces and the
+ownerName/tradeName/inspections records newmain.py produces. Rows are
+buffered and inserted in batches, one transaction per batch, into a
+database running in WAL mode. Re-adding a row updates it in place, so a
+page redone after a crash does not create duplicates. Code explanations,
+identical for every citation of a code, are stored once per code in
+violation_codes.
+
+Usage:
+    python sqlite_store.py food_safety.db import food_safety_data.json inspection_data.json
+    python sqlite_store.py food_safety.db query --code 2-301.14 --year 2025
+    python sqlite_store.py food_safety.db top-codes --city WICHITA
+"""
+
+import argparse
+import logging
+import re
+import sqlite3
+import threading
+
+import metrics
+import ndjson_sink
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS establishments (
+    id INTEGER PRIMARY KEY,
+    trade_name TEXT NOT NULL,
+    map_address TEXT NOT NULL,
+    owner_name TEXT,
+    street TEXT,
+    city TEXT,
+    state TEXT,
+    zip TEXT,
+    phone TEXT,
+    UNIQUE (trade_name, map_address)
+);
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY,
+    establishment_id INTEGER NOT NULL REFERENCES establishments(id),
+    inspection_date TEXT NOT NULL,
+    inspection_type TEXT NOT NULL,
+    compliance TEXT,
+    violation_count INTEGER,
+    facility_information TEXT,
+    UNIQUE (establishment_id, inspection_date, inspection_type)
+);
+CREATE TABLE IF NOT EXISTS violations (
+    id INTEGER PRIMARY KEY,
+    inspection_id INTEGER NOT NULL REFERENCES inspections(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    code TEXT,
+    code_explanation TEXT,
+    inspector_comments TEXT,
+    UNIQUE (inspection_id, position)
+);
+CREATE TABLE IF NOT EXISTS violation_codes (
+    code TEXT PRIMARY KEY,
+    explanation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections (inspection_date);
+CREATE INDEX IF NOT EXISTS idx_inspections_establishment ON inspections (establishment_id);
+CREATE INDEX IF NOT EXISTS idx_violations_code ON violations (code);
+CREATE INDEX IF NOT EXISTS idx_establishments_city ON establishments (city);
+"""
+
+PHONE_RE = re.compile(r'\s*(\(?\d{3}\)?[\s-]?\d{3}-\d{4})\s*$')
+STATE_ZIP_RE = re.compile(r',\s*([A-Z]{2})\s+(\d{5}(?:-\d{4})?)\s*$')
+DATE_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+VIOLATION_COUNT_RE = re.compile(r'(\d+)')
+STREET_SUFFIXES = {
+    'ST', 'AVE', 'AV', 'RD', 'DR', 'BLVD', 'LN', 'HWY', 'PKWY', 'CT', 'PL', 'WAY', 'CIR',
+    'TER', 'TRL', 'PIKE', 'PLZ', 'SQ', 'EXPY', 'FWY', 'LOOP', 'RUN'
+}
+UNIT_MARKERS = {'STE', 'SUITE', 'UNIT', 'APT', 'BLDG', 'RM', '#'}
+
+log = logging.getLogger(__name__)
+
+
+def iso_date(value):
+    """Turn the site's MM/DD/YYYY dates into sortable YYYY-MM-DD strings."""
+    match = DATE_RE.match((value or '').strip())
+    if not match:
+        return (value or '').strip()
+    month, day, year = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def split_address(map_address):
+    """
+    Break a map address into street, city, state, ZIP and phone.
+
+    The site prints street and city on one line ("9312 W 87TH ST Overland
+    Park, KS 66212"), so the city is a best guess: a trailing run of
+    mixed-case words if there is one, otherwise the words after the last
+    street suffix or unit number, otherwise the last word.
+
+    Args:
+        map_address: Address line, optionally followed by the phone number
+
+    Returns:
+        Dictionary with 'street', 'city', 'state', 'zip' and 'phone'
+    """
+    text = " ".join((map_address or '').split())
+    parts = {'street': None, 'city': None, 'state': None, 'zip': None, 'phone': None}
+    match = PHONE_RE.search(text)
+    if match:
+        parts['phone'] = match.group(1)
+        text = text[:match.start()]
+    match = STATE_ZIP_RE.search(text)
+    if not match:
+        parts['street'] = text or None
+        return parts
+    parts['state'], parts['zip'] = match.groups()
+    words = text[:match.start()].split()
+
+    split_at = len(words)
+    while split_at > 1 and any(c.islower() for c in words[split_at - 1]):
+        split_at -= 1
+    if split_at == len(words):
+        split_at = len(words) - 1
+        for i in range(len(words) - 2, 0, -1):
+            if words[i] in STREET_SUFFIXES:
+                split_at = i + 1
+                break
+            if words[i - 1] in UNIT_MARKERS:
+                split_at = i + 1
+                break
+    parts['street'] = " ".join(words[:split_at]) or None
+    parts['city'] = " ".join(words[split_at:]).upper() or None
+    return parts
+
+
+def grid_establishment(record):
+    """
+    Return the (trade_name, map_address) of a main.py grid row.
+
+    Both come from the row's markup, where name, address lines and phone are
+    separate elements (see page_parser.split_name_address). Rows written
+    before they were recorded only have the flattened "Name / Address"
+    column, which cannot be split reliably; its text is kept as the name.
+    """
+    if 'trade_name' in record:
+        return record.get('trade_name') or '', record.get('map_address') or ''
+    return " ".join((record.get('Name / Address') or '').split()), ''
+
+
+def _grid_inspection(date, inspection_type, compliance, violations_text, details):
+    count = VIOLATION_COUNT_RE.search(violations_text or '')
+    if not count:
+        violations = []
+    elif details and 'error' not in details:
+        violations = details.get('violations') or []
+    else:
+        violations = None  # Popup not opened or failed; keep whatever is stored
+    return {
+        'inspection_date': iso_date(date),
+        'inspection_type': inspection_type or '',
+        'compliance': compliance or None,
+        'violation_count': int(count.group(1)) if count else 0,
+        'facility_information': (details or {}).get('facility_information'),
+        'violations': violations
+    }
+
+
+def normalize_record(record):
+    """
+    Map a scraped record onto establishment/inspection/violation rows.
+
+    Args:
+        record: main.py grid row or newmain.py establishment record
+
+    Returns:
+        Tuple of (establishment, inspections); each inspection carries its
+        list of violations under 'violations', or None when they were not
+        fetched
+    """
+    if 'tradeName' in record:
+        establishment = {
+            'trade_name': record.get('tradeName') or '',
+            'map_address': record.get('mapAddress') or '',
+            'owner_name': record.get('ownerName')
+        }
+        by_key = {}
+        for entry in record.get('inspections') or []:
+            key = (iso_date(entry.get('inspectionDate')), entry.get('inspectionType') or '')
+            inspection = by_key.setdefault(key, {
+                'inspection_date': key[0],
+                'inspection_type': key[1],
+                'compliance': None,
+                'facility_information': None,
+                'violations': []
+            })
+            if 'error' in entry:
+                inspection['violations'] = None  # Popup failed; keep whatever is stored
+            elif inspection['violations'] is not None and (
+                entry.get('violationCode') or entry.get('violationDescription')
+            ):
+                inspection['violations'].append({
+                    'code': entry.get('violationCode'),
+                    'code_explanation': entry.get('violationDescription'),
+                    'inspector_comments': entry.get('inspectionDescription')
+                })
+        inspections = list(by_key.values())
+        for inspection in inspections:
+            violations = inspection['violations']
+            inspection['violation_count'] = len(violations) if violations is not None else None
+    else:
+        trade_name, map_address = grid_establishment(record)
+        establishment = {'trade_name': trade_name, 'map_address': map_address, 'owner_name': None}
+        inspections = [_grid_inspection(
+            record.get('Most Recent Inspection'), record.get('Inspection Type'),
+            record.get('Compliance'), record.get('Violations'), record.get('violation_details')
+        )]
+        for past in record.get('past_inspections') or []:
+            inspections.append(_grid_inspection(
+                past.get('inspection_date'), past.get('inspection_type'),
+                past.get('compliance'), past.get('violations'), past.get('violation_details')
+            ))
+    establishment.update(split_address(establishment['map_address']))
+    return establishment, inspections
+
+
+class SqliteStore:
+    """
+    Thread-safe, batched writer and query API over the inspection database.
+
+    Doubles as a parallel_crawl result sink via add().
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.count = 0
+        self._pending = []
+        self._establishment_ids = {}
+        self._code_explanations = {}
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self._code_explanations = dict(self.conn.execute("SELECT code, explanation FROM violation_codes"))
+
+    def write(self, record):
+        """Queue one scraped record, inserting the batch once it is full."""
+        with self._lock:
+            self._pending.append(record)
+            self.count += 1
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def add(self, rows):
+        """Queue a batch of scraped records."""
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """Insert all queued records in one transaction."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        # Swap the batch out first, so a bad record fails this flush only
+        # rather than every later write retrying it
+        pending, self._pending = self._pending, []
+        try:
+            with self.conn:
+                for record in pending:
+                    establishment, inspections = normalize_record(record)
+                    establishment_id = self._establishment_id(establishment)
+                    for inspection in inspections:
+                        self._upsert_inspection(establishment_id, inspection)
+        except Exception:
+            # Rows cached during the rolled-back transaction are not in the database
+            self._establishment_ids.clear()
+            self._code_explanations = dict(self.conn.execute("SELECT code, explanation FROM violation_codes"))
+            raise
+
+    def _establishment_id(self, establishment):
+        key = (establishment['trade_name'], establishment['map_address'])
+        if key not in self._establishment_ids:
+            self._establishment_ids[key] = self.conn.execute(
+                """INSERT INTO establishments
+                       (trade_name, map_address, owner_name, street, city, state, zip, phone)
+                   VALUES (:trade_name, :map_address, :owner_name, :street, :city, :state, :zip, :phone)
+                   ON CONFLICT (trade_name, map_address) DO UPDATE SET
+                       owner_name = COALESCE(excluded.owner_name, owner_name)
+                   RETURNING id""",
+                establishment
+            ).fetchone()[0]
+        return self._establishment_ids[key]
+
+    def _upsert_inspection(self, establishment_id, inspection):
+        inspection_id = self.conn.execute(
+            """INSERT INTO inspections
+                   (establishment_id, inspection_date, inspection_type, compliance,
+                    violation_count, facility_information)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (establishment_id, inspection_date, inspection_type) DO UPDATE SET
+                   compliance = COALESCE(excluded.compliance, compliance),
+                   violation_count = COALESCE(excluded.violation_count, violation_count),
+                   facility_information = COALESCE(excluded.facility_information, facility_information)
+               RETURNING id""",
+            (establishment_id, inspection['inspection_date'], inspection['inspection_type'],
+             inspection['compliance'], inspection['violation_count'],
+             inspection['facility_information'])
+        ).fetchone()[0]
+        if inspection['violations'] is None:
+            return
+        self.conn.execute("DELETE FROM violations WHERE inspection_id = ?", (inspection_id,))
+        self.conn.executemany(
+            """INSERT INTO violations (inspection_id, position, code, code_explanation, inspector_comments)
+               VALUES (?, ?, ?, ?, ?)""",
+            [
+                (inspection_id, position, v.get('code'), self._own_explanation(v), v.get('inspector_comments'))
+                for position, v in enumerate(inspection['violations'])
+            ]
+        )
+
+    def _own_explanation(self, violation):
+        # Explanations live once per code in violation_codes; a violation only
+        # keeps its own copy when it differs from the one stored for its code
+        code, explanation = violation.get('code'), violation.get('code_explanation')
+        if not code or explanation is None:
+            return explanation
+        if code not in self._code_explanations:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO violation_codes (code, explanation) VALUES (?, ?)", (code, explanation)
+            )
+            self._code_explanations[code] = explanation
+        return None if self._code_explanations[code] == explanation else explanation
+
+    def close(self):
+        """Insert queued records and close the database."""
+        with self._lock:
+            self._flush()
+            self.conn.close()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def missing_violation_details(self, trade_name, map_address, inspection_date, inspection_type):
+        """
+        Check whether the violations of an inspection still need fetching.
+
+        Args:
+            trade_name: Establishment name as parsed from the grid
+            map_address: Establishment address as parsed from the grid
+            inspection_date: Inspection date, MM/DD/YYYY or YYYY-MM-DD
+            inspection_type: Inspection type
+
+        Returns:
+            True unless the store already holds violations for the inspection
+        """
+        with self._lock:
+            row = self.conn.execute(
+                """SELECT 1 FROM establishments e
+                   JOIN inspections i ON i.establishment_id = e.id
+                   JOIN violations v ON v.inspection_id = i.id
+                   WHERE e.trade_name = ? AND e.map_address = ?
+                     AND i.inspection_date = ? AND i.inspection_type = ?
+                   LIMIT 1""",
+                (trade_name, map_address, iso_date(inspection_date), inspection_type)
+            ).fetchone()
+        return row is None
+
+    def find_inspections(self, code=None, city=None, date_from=None, date_to=None, limit=None):
+        """
+        Look up inspections by violation code, city and date range.
+
+        Args:
+            code: Only inspections citing this violation code
+            city: Only establishments in this city (case-insensitive)
+            date_from: Earliest inspection date, YYYY-MM-DD (inclusive)
+            date_to: Latest inspection date, YYYY-MM-DD (inclusive)
+            limit: Maximum number of results
+
+        Returns:
+            List of dictionaries, newest inspection first
+        """
+        clauses, params = [], []
+        if code:
+            clauses.append("i.id IN (SELECT inspection_id FROM violations WHERE code = ?)")
+            params.append(code)
+        if city:
+            clauses.append("e.city = ?")
+            params.append(city.upper())
+        if date_from:
+            clauses.append("i.inspection_date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("i.inspection_date <= ?")
+            params.append(date_to)
+        sql = """SELECT e.trade_name, e.street, e.city, e.state, e.zip, e.phone,
+                        i.id AS inspection_id, i.inspection_date, i.inspection_type,
+                        i.compliance, i.violation_count
+                 FROM inspections i JOIN establishments e ON e.id = i.establishment_id"""
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY i.inspection_date DESC, e.trade_name"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            self._flush()
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def violations_for(self, inspection_id):
+        """Return the violations cited in one inspection, in popup order."""
+        with self._lock:
+            self._flush()
+            return [dict(row) for row in self.conn.execute(
+                """SELECT v.code, COALESCE(v.code_explanation, c.explanation) AS code_explanation,
+                          v.inspector_comments
+                   FROM violations v LEFT JOIN violation_codes c ON c.code = v.code
+                   WHERE v.inspection_id = ? ORDER BY v.position""",
+                (inspection_id,)
+            )]
+
+    def top_violation_codes(self, city=None, date_from=None, date_to=None, limit=10):
+        """
+        Count how often each violation code was cited.
+
+        Returns:
+            List of (code, citations) tuples, most frequent first
+        """
+        clauses, params = [], []
+        if city:
+            clauses.append("e.city = ?")
+            params.append(city.upper())
+        if date_from:
+            clauses.append("i.inspection_date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("i.inspection_date <= ?")
+            params.append(date_to)
+        sql = """SELECT v.code, COUNT(*) AS citations
+                 FROM violations v
+                 JOIN inspections i ON i.id = v.inspection_id
+                 JOIN establishments e ON e.id = i.establishment_id"""
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " GROUP BY v.code ORDER BY citations DESC, v.code LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            self._flush()
+            return [tuple(row) for row in self.conn.execute(sql, params)]
+
+
+def import_file(store, path):
+    """
+    Load a JSON array or NDJSON file of scraped records into the store.
+
+    Returns:
+        Number of records imported
+    """
+    before = store.count
+    store.add(ndjson_sink.iter_file(path))
+    store.flush()
+    log.info("Imported %d records from %s into %s", store.count - before, path, store.path)
+    return store.count - before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the inspection database.")
+    parser.add_argument('database', help="SQLite database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Load scraped JSON or NDJSON files")
+    import_parser.add_argument('files', nargs='+')
+
+    for name in ('query', 'top-codes'):
+        command = commands.add_parser(name)
+        command.add_argument('--city')
+        command.add_argument('--year', type=int, help="Shorthand for --from YEAR-01-01 --to YEAR-12-31")
+        command.add_argument('--from', dest='date_from', help="Earliest date, YYYY-MM-DD")
+        command.add_argument('--to', dest='date_to', help="Latest date, YYYY-MM-DD")
+        command.add_argument('--limit', type=int)
+        if name == 'query':
+            command.add_argument('--code', help="Violation code cited in the inspection")
+    args = parser.parse_args()
+    metrics.configure_logging()
+
+    with SqliteStore(args.database) as db:
+        if args.command == 'import':
+            for path in args.files:
+                import_file(db, path)
+        else:
+            date_from, date_to = args.date_from, args.date_to
+            if args.year:
+                date_from, date_to = f"{args.year}-01-01", f"{args.year}-12-31"
+            if args.command == 'query':
+                for row in db.find_inspections(args.code, args.city, date_from, date_to, args.limit):
+                    print(f"{row['inspection_date']}  {row['trade_name']}, {row['city']}  "
+                          f"{row['inspection_type']}  {row['violation_count']} violation(s)")
+            else:
+                for code, citations in db.top_violation_codes(args.city, date_from, date_to, args.limit or 10):
+                    print(f"{citations:6d}  {code}")
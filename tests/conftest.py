@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def snapshot():
+    """Return the raw HTML of a saved page in the repository root."""
+    def read(name):
+        with open(os.path.join(ROOT, name), 'rb') as f:
+            return f.read()
+    return read
+
+
+@pytest.fixture
+def grid_row():
+    """Return a factory for grid rows with a parsed name and one past inspection."""
+    def build(trade_name, map_address):
+        return {
+            'Name / Address': " ".join(f"{trade_name} {map_address}".split()),
+            'Most Recent Inspection': '02/06/2025',
+            'Inspection Type': 'Routine',
+            'Compliance': 'In',
+            'Violations': '',
+            'Current Inspection Report': '',
+            'trade_name': trade_name,
+            'map_address': map_address,
+            'violation_details': None,
+            'past_inspections': [{
+                'inspection_date': '01/23/2025',
+                'inspection_type': 'Licensing-Operational',
+                'compliance': 'Out',
+                'violations': 'Violation(s) 1',
+                'violation_details': {
+                    'inspection_date': '01/23/2025',
+                    'facility_information': None,
+                    'violations': [{'code': '2-301.14', 'code_explanation': 'When to wash hands.',
+                                    'inspector_comments': 'No soap.'}]
+                }
+            }]
+        }
+    return build
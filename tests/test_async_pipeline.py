@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import async_pipeline
+from replay_server import ReplaySite, start_server
+from resilience import CircuitOpen
+
+from conftest import ROOT
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, rows):
+        self.rows.extend(rows)
+
+
+@pytest.fixture(scope='module')
+def replay_url():
+    server, url = start_server(ReplaySite(os.path.join(ROOT, 'index.html'), pages=6))
+    yield url
+    server.shutdown()
+
+
+def crawl(url, sink, **kwargs):
+    return asyncio.run(asyncio.wait_for(async_pipeline.crawl_async(sink, url=url, **kwargs), timeout=30))
+
+
+def test_crawl(replay_url):
+    sink = ListSink()
+    stats = crawl(replay_url, sink, detail_workers=2)
+    assert stats.pages == 6
+    assert len(sink.rows) == 90
+    assert all('error' not in (row['violation_details'] or {}) for row in sink.rows)
+
+
+def test_failing_stage_stops_the_crawl(replay_url, monkeypatch):
+    # The parser dies once the fetcher has filled the page queue and finished;
+    # the shutdown must not block on a queue nobody reads any more
+    plan_page = async_pipeline.plan_page
+
+    def failing_plan_page(page_num, *args):
+        if page_num == 2:
+            time.sleep(2)
+            raise RuntimeError("parser broke")
+        return plan_page(page_num, *args)
+
+    monkeypatch.setattr(async_pipeline, 'plan_page', failing_plan_page)
+    with pytest.raises(RuntimeError, match="parser broke"):
+        crawl(replay_url, ListSink(), detail_workers=2, last_page=6)
+
+
+def test_open_circuit_fails_the_crawl(replay_url, monkeypatch):
+    def circuit_open(*args):
+        raise CircuitOpen("Circuit still open after 1800s")
+
+    monkeypatch.setattr(async_pipeline, 'fetch_popup', circuit_open)
+    with pytest.raises(CircuitOpen):
+        crawl(replay_url, ListSink(), detail_workers=2)
@@ -0,0 +1,24 @@
+from checkpoint import CheckpointStore
+
+
+def test_finished_crawl_survives_reload(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'crawl.checkpoint'))
+    store.reset()
+    assert not store.is_finished()
+    store.mark_finished(1, 5)
+
+    loaded = CheckpointStore(store.path)
+    assert loaded.load()
+    assert loaded.is_finished(1, 5)
+    assert loaded.is_finished(2, 4)
+    assert not loaded.is_finished(1, 6)
+    assert not loaded.is_finished(1, None)
+
+
+def test_finished_to_the_end_covers_every_range(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'crawl.checkpoint'))
+    store.mark_finished()
+    assert store.is_finished()
+    assert store.is_finished(3, 40)
+    store.reset()
+    assert not store.is_finished()
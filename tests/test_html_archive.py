@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import main
+from html_archive import reparse
+from ndjson_sink import iter_records
+from replay_server import ReplaySite, start_server
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope='module')
+def replay_url():
+    server, url = start_server(ReplaySite(os.path.join(ROOT, 'index.html'), pages=2))
+    yield url
+    server.shutdown()
+
+
+def past_details(path):
+    return sum(
+        1 for row in iter_records(str(path)) for past in row['past_inspections']
+        if past['violation_details'] and 'error' not in past['violation_details']
+    )
+
+
+@pytest.mark.parametrize('backend', ['http', 'async'])
+def test_reparse_after_a_second_crawl_keeps_earlier_popups(tmp_path, replay_url, backend):
+    def crawl(output):
+        main.scrape_food_safety_data(
+            backend=backend, requests_per_second=0, url=replay_url, output=str(output), json_output=None,
+            checkpoint_path=None, database=str(tmp_path / 'history.db'), archive_dir=str(tmp_path / 'archive')
+        )
+
+    crawl(tmp_path / 'first.ndjson')
+    # The second run finds the past inspections in the database and does not reopen them
+    crawl(tmp_path / 'second.ndjson')
+    assert past_details(tmp_path / 'first.ndjson') > 0
+    assert past_details(tmp_path / 'second.ndjson') == 0
+
+    reparse(str(tmp_path / 'archive'), str(tmp_path / 'rebuilt.ndjson'), workers=0)
+    assert past_details(tmp_path / 'rebuilt.ndjson') == past_details(tmp_path / 'first.ndjson')
+    rebuilt = {row['Name / Address']: row for row in iter_records(str(tmp_path / 'rebuilt.ndjson'))}
+    for row in iter_records(str(tmp_path / 'first.ndjson')):
+        assert rebuilt[row['Name / Address']] == row
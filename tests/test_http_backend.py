@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from http_backend import HttpPageSession
+from page_parser import parse_grid_rows
+from replay_server import ReplaySite, start_server
+from response_cache import ResponseCache
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope='module')
+def replay_url():
+    server, url = start_server(ReplaySite(os.path.join(ROOT, 'index.html'), pages=2))
+    yield url
+    server.shutdown()
+
+
+def test_unpopulated_popup_is_not_cached(tmp_path, snapshot, replay_url):
+    session = HttpPageSession(url=replay_url, cache=ResponseCache(str(tmp_path / 'cache')))
+    session.open()
+    link = next(info['violations_link'] for _, info in parse_grid_rows(session.client.doc) if info['violations_link'])
+
+    request = session.client._request
+    popups = []
+
+    def flaky_request(method, form=None):
+        if form and form.get('__EVENTTARGET') == link['target']:
+            popups.append(form)
+            if len(popups) == 1:
+                # The saved page has the popup markup, but empty
+                return snapshot('index.html')
+        return request(method, form)
+
+    session.client._request = flaky_request
+    assert 'error' in session.fetch_violation_details(link)
+    details = session.fetch_violation_details(link)
+    assert details['violations']
+    # The good popup is cached; the unpopulated one was fetched again instead
+    assert session.fetch_violation_details(link) == details
+    assert len(popups) == 2
+    session.close()
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from ndjson_sink import NdjsonWriter, compact, iter_file
+
+RECORDS = [
+    {'Name / Address': 'PIZZA 4 U\n123 MAIN ST', 'Inspection Type': 'Routine', 'violation_details': None},
+    {'Name / Address': 'CAFÉ ☃', 'violation_details': {'violations': [{'code': '2-301.14', 'count': 2}]},
+     'past_inspections': [], 'score': 1.5, 'open': True},
+    {'nested': {'empty': {}, 'list': [[], [1, [2]]]}},
+]
+
+
+def write_ndjson(path, records):
+    with NdjsonWriter(str(path), flush_every=1) as writer:
+        writer.add(records)
+
+
+@pytest.mark.parametrize('indent', [2, 4])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_compact_matches_json_dump_byte_for_byte(tmp_path, indent, ensure_ascii):
+    source, target = tmp_path / 'rows.ndjson', tmp_path / 'rows.json'
+    write_ndjson(source, RECORDS)
+
+    assert compact(str(source), str(target), indent=indent, ensure_ascii=ensure_ascii) == len(RECORDS)
+    expected = json.dumps(RECORDS, indent=indent, ensure_ascii=ensure_ascii)
+    assert target.read_bytes() == expected.encode('utf-8')
+
+
+def test_compact_of_an_empty_file_is_an_empty_array(tmp_path):
+    source, target = tmp_path / 'rows.ndjson', tmp_path / 'rows.json'
+    write_ndjson(source, [])
+
+    assert compact(str(source), str(target)) == 0
+    assert target.read_text(encoding='utf-8') == json.dumps([], indent=4)
+
+
+def test_iter_file_reads_both_forms_and_skips_a_truncated_line(tmp_path, caplog):
+    source, target = tmp_path / 'rows.ndjson', tmp_path / 'rows.json'
+    write_ndjson(source, RECORDS)
+    compact(str(source), str(target))
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write('{"Name / Address": "TRUNC')
+
+    assert list(iter_file(str(target))) == RECORDS
+    assert list(iter_file(str(source))) == RECORDS
+    assert 'Skipping unreadable line' in caplog.text
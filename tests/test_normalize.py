@@ -0,0 +1,21 @@
+from normalize import EstablishmentIndex, establishment_fields
+from schema import to_inspection_record
+
+
+def test_fields_come_from_the_parsed_name(grid_row):
+    fields = establishment_fields(grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100'))
+    assert fields['trade_name'] == 'PIZZA 4 U'
+    assert fields['name_key'] == 'PIZZA 4 U'
+    assert fields['street'] == '100 MAIN ST'
+    assert fields['city'] == 'WICHITA'
+    assert fields['zip'] == '67202'
+    assert fields['phone_key'] == '3165550100'
+
+
+def test_both_layouts_resolve_to_one_establishment(grid_row):
+    row = grid_row("CASEY'S GENERAL STORE HWY 54", 'Pratt, KS 67124\n620-555-0199')
+    index = EstablishmentIndex()
+    first = index.add(establishment_fields(row))
+    second = index.add(establishment_fields(to_inspection_record(row)))
+    assert index.entity_of(first) == index.entity_of(second)
+    assert len(index) == 1
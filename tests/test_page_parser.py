@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import page_parser
+from replay_server import ReplaySite
+
+from conftest import ROOT
+
+HEADERS = [
+    'Name / Address', 'Most Recent Inspection', 'Inspection Type',
+    'Compliance', 'Violations', 'Current Inspection Report'
+]
+
+
+@pytest.mark.parametrize('name', ['index.html', 'table.html'])
+def test_grid_rows(snapshot, name):
+    doc = page_parser.parse_document(snapshot(name))
+    assert page_parser.has_results(doc)
+    assert page_parser.parse_headers(doc) == HEADERS
+
+    rows = page_parser.parse_grid_rows(doc)
+    assert len(rows) == 15
+    row_data, row_info = rows[0]
+    assert list(row_data) == HEADERS + ['trade_name', 'map_address']
+    assert row_data['Name / Address'] == '87TH SPOT NUTRITION 9312 W 87TH ST Overland Park, KS 66212 913-708-3597'
+    assert row_data['Most Recent Inspection'] == '02/06/2025'
+    assert row_data['Inspection Type'] == 'Follow-up'
+    assert row_data['Compliance'] == 'In'
+    assert row_data['trade_name'] == row_info['trade_name'] == '87TH SPOT NUTRITION'
+    assert row_data['map_address'] == row_info['map_address'] == (
+        '9312 W 87TH ST Overland Park, KS 66212\n913-708-3597'
+    )
+    assert row_info['violations_link'] is None
+    assert row_info['report_button'] == 'ctl00$MainContent$gvInspections$ctl02$btnInspectionReport'
+
+
+@pytest.mark.parametrize('name', ['index.html', 'table.html'])
+def test_past_inspections(snapshot, name):
+    rows = page_parser.parse_grid_rows(snapshot(name))
+    assert sum(len(row_info['past_inspections']) for _, row_info in rows) == 168
+
+    past = rows[0][1]['past_inspections']
+    assert past == [{
+        'inspection_date': '01/23/2025',
+        'inspection_type': 'Licensing-Operational',
+        'compliance': 'Out',
+        'violations': 'Violation(s) 1',
+        'violations_link': {
+            'id': 'MainContent_gvInspections_gvPastInspections_0_lnkViolations_0',
+            'target': 'ctl00$MainContent$gvInspections$ctl02$gvPastInspections$ctl02$lnkViolations',
+            'inspection': ('87TH SPOT NUTRITION', '9312 W 87TH ST Overland Park, KS 66212\n913-708-3597',
+                           '01/23/2025', 'Licensing-Operational')
+        },
+        'report_button': 'ctl00$MainContent$gvInspections$ctl02$gvPastInspections$ctl02$btnInspectionReport'
+    }]
+
+
+def test_pager(snapshot):
+    doc = page_parser.parse_document(snapshot('index.html'))
+    pager = page_parser.parse_pager(doc)
+    assert pager == {'current_page': 1, 'linked_pages': list(range(2, 22))}
+    assert page_parser.get_next_page_number(doc, 1) == 2
+    assert page_parser.get_next_page_number(doc, 21) is None
+    assert page_parser.next_hop(doc, 1) is None
+    assert page_parser.next_hop(doc, 12) == 12
+    assert page_parser.next_hop(doc, 30) == 21
+    assert page_parser.parse_page_count(doc) == 34
+
+
+def test_violation_popup():
+    site = ReplaySite(os.path.join(ROOT, 'index.html'), pages=2)
+    target = 'ctl00$MainContent$gvInspections$ctl03$lnkViolations'
+    popup = page_parser.parse_violation_popup(site.render(1, target))
+
+    assert popup['inspection_date'] == '02/06/2025'
+    assert popup['facility_information'] == f'Replay facility for {target}'
+    assert popup['violations']
+    for number, violation in enumerate(popup['violations'], 1):
+        assert violation['code']
+        assert violation['code_explanation']
+        assert violation['inspector_comments'] == f'Observed on replay page 1, item {number}.'
+
+
+def test_unpopulated_popup_raises(snapshot):
+    # The snapshot was saved with the popup closed: its markup is there, but empty
+    with pytest.raises(page_parser.PopupNotLoaded):
+        page_parser.parse_violation_popup(snapshot('index.html'))
+
+
+def test_popup_without_header_raises():
+    with pytest.raises(page_parser.PopupNotLoaded):
+        page_parser.parse_violation_popup('<html><body><p>Session expired</p></body></html>')
+
+
+def test_explanations_are_read_per_popup():
+    site = ReplaySite(os.path.join(ROOT, 'index.html'), pages=2)
+    target = 'ctl00$MainContent$gvInspections$ctl03$lnkViolations'
+    popup = site.render(1, target)
+    first = page_parser.parse_violation_popup(popup)['violations'][0]
+    reworded = popup.replace(first['code_explanation'], 'Reworded explanation.')
+    assert page_parser.parse_violation_popup(reworded)['violations'][0]['code_explanation'] == 'Reworded explanation.'
@@ -0,0 +1,25 @@
+import argparse
+
+import pytest
+
+from pager import page_range, plan_hops
+
+
+def test_page_range_parses_closed_and_open_ranges():
+    assert page_range('1-20') == (1, 20)
+    assert page_range('40-') == (40, None)
+    assert page_range('7') == (7, None)
+    assert page_range('3-3') == (3, 3)
+
+
+@pytest.mark.parametrize('value', ['0-5', '5-2', 'a-b', '1-x', '', '-4'])
+def test_page_range_rejects_bad_ranges(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        page_range(value)
+
+
+def test_plan_hops_walks_one_window_at_a_time():
+    assert plan_hops(1, 1) == []
+    assert plan_hops(1, 15) == [15]
+    assert plan_hops(1, 45) == [21, 41, 45]
+    assert plan_hops(45, 3) == [40, 20, 3]
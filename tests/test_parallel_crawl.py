@@ -0,0 +1,67 @@
+import pytest
+
+import parallel_crawl
+from resilience import CrawlTruncated
+
+
+class FakeSession:
+    """Grid of `pages` pages with one row each; the pager stops early after `pager_end`."""
+
+    def __init__(self, pages=6, pager_end=None):
+        self.pages = pages
+        self.pager_end = pager_end or pages
+        self.page_num = 1
+
+    def open(self):
+        self.page_num = 1
+
+    def total_pages(self):
+        return self.pages
+
+    def seek(self, page_num):
+        self.page_num = page_num
+
+    def scrape_page(self):
+        return [{'page': self.page_num}]
+
+    def next_page(self):
+        if self.page_num >= self.pager_end:
+            return False
+        self.page_num += 1
+        return True
+
+    def form_state(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def test_all_shards_written():
+    sink = parallel_crawl.ResultSink()
+    parallel_crawl.crawl_parallel(lambda: FakeSession(), workers=3, sink=sink)
+    assert sorted(row['page'] for row in sink.results) == [1, 2, 3, 4, 5, 6]
+
+
+def test_failed_shard_is_raised_after_the_others_finish():
+    sink = parallel_crawl.ResultSink()
+    with pytest.raises(CrawlTruncated):
+        parallel_crawl.crawl_parallel(lambda: FakeSession(pager_end=4), workers=3, sink=sink)
+    # Shard 5-6 cannot page past 5; shards 1-2 and 3-4 still finish
+    assert sorted(row['page'] for row in sink.results) == [1, 2, 3, 4, 5]
+
+
+def test_probe_is_closed_when_it_cannot_open():
+    class BrokenSession(FakeSession):
+        closed = False
+
+        def open(self):
+            raise ConnectionError("search page unreachable")
+
+        def close(self):
+            self.closed = True
+
+    probe = BrokenSession()
+    with pytest.raises(ConnectionError):
+        parallel_crawl.crawl_parallel(lambda: probe, workers=2)
+    assert probe.closed
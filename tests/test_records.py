@@ -0,0 +1,16 @@
+from records import CompactSink
+
+
+def test_rows_round_trip(grid_row):
+    row = grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100')
+    sink = CompactSink()
+    sink.add([row])
+    assert list(sink) == [row]
+
+
+def test_null_history_round_trips(grid_row):
+    row = grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100')
+    row['past_inspections'] = None
+    sink = CompactSink()
+    sink.write(row)
+    assert list(sink) == [row]
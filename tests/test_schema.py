@@ -0,0 +1,26 @@
+from schema import to_inspection_record
+from sqlite_store import SqliteStore
+
+
+def test_inspection_record_uses_the_parsed_name(grid_row):
+    record = to_inspection_record(grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100'))
+    assert record['tradeName'] == 'PIZZA 4 U'
+    assert record['mapAddress'] == '100 MAIN ST Wichita, KS 67202\n316-555-0100'
+    assert [entry['inspectionDate'] for entry in record['inspections']] == ['02/06/2025', '01/23/2025']
+    assert record['inspections'][1]['violationCode'] == '2-301.14'
+    assert record['inspections'][1]['inspectionType'] == 'Licensing-Operational'
+
+
+def test_failed_popup_is_not_a_clean_inspection(grid_row, tmp_path):
+    row = grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100')
+    row['past_inspections'][0]['violation_details'] = {'error': 'Popup did not load'}
+    record = to_inspection_record(row)
+    assert 'error' not in record['inspections'][0]
+    assert record['inspections'][1]['error'] == 'Popup did not load'
+
+    with SqliteStore(str(tmp_path / 'inspections.db')) as store:
+        store.add([grid_row('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100')])
+        store.add([record])
+        past = store.find_inspections(code='2-301.14')
+    # The violations stored from the earlier, successful popup are kept
+    assert [(i['inspection_date'], i['violation_count']) for i in past] == [('2025-01-23', 1)]
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from sqlite_store import SqliteStore, import_file, normalize_record
+
+# Names the flattened "Name / Address" text cannot be split back into
+ESTABLISHMENTS = [
+    ('PIZZA 4 U', '100 MAIN ST Wichita, KS 67202\n316-555-0100'),
+    ("CASEY'S GENERAL STORE HWY 54", 'Pratt, KS 67124\n620-555-0199'),
+]
+
+
+@pytest.mark.parametrize('trade_name, map_address', ESTABLISHMENTS)
+def test_establishment_keeps_the_parsed_name(grid_row, trade_name, map_address):
+    establishment, inspections = normalize_record(grid_row(trade_name, map_address))
+    assert establishment['trade_name'] == trade_name
+    assert establishment['map_address'] == map_address
+    assert len(inspections) == 2
+
+
+@pytest.mark.parametrize('trade_name, map_address', ESTABLISHMENTS)
+def test_stored_past_inspection_is_not_fetched_again(tmp_path, grid_row, trade_name, map_address):
+    with SqliteStore(str(tmp_path / 'inspections.db')) as store:
+        assert store.missing_violation_details(trade_name, map_address, '01/23/2025', 'Licensing-Operational')
+        store.add([grid_row(trade_name, map_address)])
+        store.flush()
+        assert not store.missing_violation_details(trade_name, map_address, '01/23/2025', 'Licensing-Operational')
+
+
+def test_differing_explanation_is_kept_with_its_violation(tmp_path, grid_row):
+    old, new = grid_row('PIZZA 4 U', ''), grid_row('PIZZA 4 U', '')
+    new['past_inspections'][0]['inspection_date'] = '01/24/2025'
+    new['past_inspections'][0]['violation_details']['violations'][0]['code_explanation'] = 'Reworded.'
+    with SqliteStore(str(tmp_path / 'inspections.db')) as store:
+        store.add([old, new])
+        explanations = [
+            store.violations_for(row['inspection_id'])[0]['code_explanation']
+            for row in store.find_inspections(code='2-301.14')
+        ]
+    assert explanations == ['Reworded.', 'When to wash hands.']
+
+
+def test_bad_record_fails_only_its_own_flush(tmp_path, grid_row):
+    with SqliteStore(str(tmp_path / 'inspections.db'), batch_size=10) as store:
+        store.add([grid_row('PIZZA 4 U', ''), {'Name / Address': 'BROKEN', 'past_inspections': 'not a list'}])
+        with pytest.raises(AttributeError):
+            store.flush()
+        store.add([grid_row('PIZZA 4 U', '')])
+        store.flush()
+        assert len(store.find_inspections()) == 2
+
+
+def test_import_streams_both_file_forms(tmp_path, grid_row):
+    rows = [grid_row(trade_name, map_address) for trade_name, map_address in ESTABLISHMENTS]
+    (tmp_path / 'rows.ndjson').write_text(''.join(json.dumps(row) + '\n' for row in rows), encoding='utf-8')
+    (tmp_path / 'rows.json').write_text(json.dumps(rows, indent=4), encoding='utf-8')
+    with SqliteStore(str(tmp_path / 'inspections.db')) as store:
+        assert import_file(store, str(tmp_path / 'rows.ndjson')) == 2
+        assert import_file(store, str(tmp_path / 'rows.json')) == 2
+        assert len(store.find_inspections()) == 4
@@ -0,0 +1,72 @@
+"""
+Violation Popup Extractor
+Reads the whole violations popup with one injected script instead of one
+WebDriver round trip per field.
+"""
+
+from selenium.common.exceptions import TimeoutException
+
+import waits
+
+# Returns null until the popup is open and populated, then the full record.
+# Code explanations sit in collapsed panels that are already in the DOM, so
+# their text is read without clicking the toggles.
+EXTRACT_VIOLATIONS_JS = """
+var prefix = 'MainContent_wucPublicInspectionViolations';
+if (window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager &&
+        Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack()) {
+    return null;
+}
+var box = document.getElementById('cboxLoadedContent');
+var header = document.getElementById(prefix + '_lblHeader');
+if (!box || !header || !box.contains(header) || !header.textContent.trim()) {
+    return null;
+}
+function clean(element) {
+    return element ? element.textContent.replace(/\\s+/g, ' ').trim() : null;
+}
+var facility = document.getElementById(prefix + '_lblFacilityInformation');
+var violations = [];
+for (var i = 0; ; i++) {
+    var code = document.getElementById(prefix + '_rptViolations_lblRegulatorCodeType_' + i);
+    if (!code) {
+        break;
+    }
+    var panel = document.getElementById(prefix + '_rptViolations_pnlCodeExplanation_' + i);
+    var explanation = panel ? panel.querySelector(':scope > div > div') : null;
+    var comments = clean(document.getElementById(prefix + '_rptViolations_pnlComments_' + i));
+    violations.push({
+        code: clean(code),
+        code_explanation: clean(explanation),
+        inspector_comments: comments === null ? null : comments.replace('Inspector Comments', '').trim()
+    });
+}
+return {
+    inspection_date: clean(header).replace('Inspection Violations:', '').trim(),
+    facility_information: clean(facility),
+    violations: violations
+};
+"""
+
+
+def extract_violations(driver, timeout=10):
+    """
+    Wait for the open violations popup and read it in a single script call per poll.
+
+    Args:
+        driver: WebDriver instance with a violations popup opening
+        timeout: Maximum wait time in seconds
+
+    Returns:
+        Dictionary containing violation details, in the same shape as
+        page_parser.parse_violation_popup
+    """
+    try:
+        return waits.wait_for(
+            driver,
+            'popup_extract',
+            waits.script_condition(EXTRACT_VIOLATIONS_JS),
+            timeout
+        )
+    except TimeoutException:
+        return {"error": "Popup content not loaded"}
@@ -0,0 +1,138 @@
+"""
+Condition Waits
+Blocks on the DOM or AJAX state the scrapers actually need instead of sleeping
+for a fixed time, and keeps per-wait timing statistics.
+"""
+
+import threading
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from metrics import METRICS
+
+POLL_INTERVAL = 0.1
+
+# True once no MS AJAX partial postback is running
+AJAX_IDLE_JS = """
+return !(window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager &&
+         Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack());
+"""
+
+# True once colorbox is hidden again
+POPUP_CLOSED_JS = """
+var box = document.getElementById('colorbox');
+return !box || box.style.display === 'none' || !document.getElementById('cboxLoadedContent');
+"""
+
+
+class WaitStats:
+    """Thread-safe per-wait timing statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, elapsed, timed_out=False):
+        """Add one wait's duration under name."""
+        with self._lock:
+            entry = self._stats.setdefault(
+                name, {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0}
+            )
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            if timed_out:
+                entry['timeouts'] += 1
+
+    def summary(self):
+        """Return a copy of the statistics, keyed by wait name."""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._stats.items()}
+
+    def print_summary(self):
+        """Print one line per wait, slowest total first."""
+        stats = sorted(self.summary().items(), key=lambda item: item[1]['total'], reverse=True)
+        print("Wait timings:")
+        for name, entry in stats:
+            average = entry['total'] / entry['count'] if entry['count'] else 0.0
+            print(f"  {name}: {entry['count']} waits, {entry['total']:.2f}s total, "
+                  f"{average:.3f}s avg, {entry['max']:.3f}s max, {entry['timeouts']} timeouts")
+
+
+WAIT_STATS = WaitStats()
+
+
+def wait_for(driver, name, condition, timeout=10, poll=POLL_INTERVAL, stats=WAIT_STATS):
+    """
+    Poll condition until it is truthy and record how long that took.
+
+    Args:
+        driver: WebDriver instance
+        name: Label the timing is recorded under
+        condition: Callable taking the driver, as used by WebDriverWait
+        timeout: Maximum wait time in seconds
+        poll: Poll interval in seconds
+        stats: WaitStats to record into
+
+    Returns:
+        The condition's truthy result
+
+    Raises:
+        TimeoutException: If the condition does not hold within timeout
+    """
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll).until(condition)
+    except TimeoutException:
+        elapsed = time.perf_counter() - start
+        stats.record(name, elapsed, timed_out=True)
+        METRICS.observe('wait_seconds', elapsed, wait=name)
+        METRICS.increment('timeouts_total', source=name)
+        raise
+    elapsed = time.perf_counter() - start
+    stats.record(name, elapsed)
+    METRICS.observe('wait_seconds', elapsed, wait=name)
+    return result
+
+
+def script_condition(script):
+    """Turn a JavaScript snippet returning a boolean into a WebDriverWait condition."""
+    return lambda driver: driver.execute_script(script)
+
+
+def wait_for_ajax_idle(driver, timeout=15):
+    """Wait until no UpdatePanel postback is in flight."""
+    return wait_for(driver, 'ajax_idle', script_condition(AJAX_IDLE_JS), timeout)
+
+
+def wait_for_popup_closed(driver, timeout=5):
+    """Wait until the colorbox popup has been dismissed."""
+    return wait_for(driver, 'popup_closed', script_condition(POPUP_CLOSED_JS), timeout)
+
+
+def wait_for_grid(driver, timeout=15):
+    """Wait until the results grid has data rows and no postback is running."""
+    wait_for(
+        driver,
+        'grid_present',
+        EC.presence_of_element_located((By.CSS_SELECTOR, '#MainContent_gvInspections tr.GridItem')),
+        timeout
+    )
+    return wait_for_ajax_idle(driver, timeout)
+
+
+def wait_for_grid_refresh(driver, old_element, timeout=15):
+    """
+    Wait until a grid postback has replaced old_element and the new grid is ready.
+
+    Args:
+        driver: WebDriver instance
+        old_element: Any element of the grid as it was before the postback
+        timeout: Maximum wait time in seconds
+    """
+    wait_for(driver, 'grid_stale', EC.staleness_of(old_element), timeout)
+    return wait_for_grid(driver, timeout)